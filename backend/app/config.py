@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, List
+from typing import Any, List, Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -29,12 +29,50 @@ class Settings(BaseSettings):
 
     ai_model: str = "llama-3.1-8b-instant"
     openai_fallback_model: str = "gpt-4o-mini"
+    # pandas/statsmodels/openai load on first use; set to import them in the background at startup
+    ai_warmup_on_startup: bool = False
+    # Background review scoring only: one chat completion per window of reviews
+    credibility_batching: bool = False
+    credibility_batch_window_s: float = 0.25
+    credibility_batch_max_size: int = 16
 
     # =========================
     # Finternet (mock service)
     # =========================
+    # Defaults to the hackathon API; point at `finternet_standin.py` for offline runs
     finternet_base: str | None = None
     finternet_key: str | None = None
+    # "mock": only payment intents go over HTTP; "http": every gateway call does
+    finternet_mode: Literal["mock", "http"] = "mock"
+    finternet_timeout_s: float = 30.0
+
+    # Net per-teacher settlements instead of one settle transfer per session
+    settlement_batching: bool = False
+    settlement_batch_max_items: int = 50
+    settlement_batch_max_amount: float = 500.0
+    settlement_batch_max_age_s: float = 300.0
+    # A worker renews its claim on held accruals every tick; recovery takes claims older than this
+    settlement_accrual_lease_s: float = 120.0
+
+    # =========================
+    # Forecasting (ARIMA)
+    # =========================
+    # 0 = fit inline in the request thread; >0 = fit in a process pool of this size
+    arima_process_workers: int = 0
+    arima_timeout_s: float = 10.0
+    # Fitted models are cached per teacher/metric; new reviews update them incrementally
+    forecast_cache_ttl_s: float = 3600.0
+    forecast_refit_every: int = 20
+    # Nightly job (python -m app.services.forecast_batch); 0 = one process per CPU
+    forecast_batch_workers: int = 0
+    # Precomputed teacher_forecasts rows older than this are ignored
+    forecast_precomputed_max_age_s: float = 36 * 3600.0
+    # Review anomaly checks use a per-teacher EWMA until a teacher has this many ratings
+    anomaly_arima_min_history: int = 30
+    rating_ewma_alpha: float = 0.2
+    # Per-process EWMA cache: at most this many teachers, each reseeded after the TTL
+    rating_ewma_cache_size: int = 10000
+    rating_ewma_ttl_s: float = 3600.0
 
     # =========================
     # Server
@@ -47,6 +85,64 @@ class Settings(BaseSettings):
     # Payments defaults
     # =========================
     default_reserve_amount: float = 30.0
+    wallet_balance_ttl_s: float = 30.0
+    # A start's reservation counts against the balance until the session ends, or for at most this long
+    wallet_reservation_ttl_s: float = 1800.0
+
+    # =========================
+    # Background jobs
+    # =========================
+    jobs_max_workers: int = 4
+    jobs_max_retries: int = 3
+    jobs_retry_delay: float = 1.0
+    # A listing's AI job is re-queued at startup only once its claim is older than this
+    listing_ai_lease_s: float = 900.0
+    # "background": /reviews/submit stores a provisional score and AI scoring runs as a job
+    review_scoring_mode: Literal["inline", "background"] = "inline"
+    # A background scoring claim older than this is taken over by startup recovery
+    review_scoring_lease_s: float = 600.0
+
+    # =========================
+    # Engagement heartbeats
+    # =========================
+    engagement_flush_interval_s: float = 15.0
+    engagement_idle_ttl_s: float = 900.0
+
+    # =========================
+    # Idempotency keys
+    # =========================
+    idempotency_ttl_s: float = 86400.0
+    idempotency_wait_timeout_s: float = 30.0
+    # An in-progress key older than this (its worker died) is taken over by the next replay
+    idempotency_lease_s: float = 120.0
+
+    # =========================
+    # Finternet outbox dispatcher
+    # =========================
+    outbox_poll_interval_s: float = 2.0
+    outbox_batch_size: int = 50
+    outbox_max_attempts: int = 8
+    outbox_retry_delay_s: float = 2.0
+    # How long a claimed event is reserved before another dispatcher may retry it. Must
+    # outlast a handler: each gateway call makes up to 3 attempts of FINTERNET_TIMEOUT_S
+    outbox_lease_s: float = 300.0
+
+    # =========================
+    # Active session registry
+    # =========================
+    active_session_ttl_s: float = 4 * 3600.0
+    active_session_revalidate_s: float = 60.0
+
+    # =========================
+    # Idle session sweeper
+    # =========================
+    session_sweep_enabled: bool = True
+    session_sweep_interval_s: float = 300.0
+    session_idle_timeout_s: float = 1800.0
+    session_sweep_batch_size: int = 100
+    session_sweep_max_workers: int = 4
+    # Sessions that fail to end are retried with exponential backoff up to this delay
+    session_sweep_max_backoff_s: float = 86400.0
 
     # =========================
     # Helpers
@@ -7,6 +7,9 @@ from fastapi import Depends, Header
 from app.errors import http_error
 from app.supabase_client import get_supabase
 
+# Optional client-generated key; replays with the same key return the cached response.
+IdempotencyKey = Annotated[str | None, Header(alias="Idempotency-Key", max_length=255)]
+
 
 async def get_current_user(
     authorization: Annotated[str | None, Header(alias="Authorization")] = None,
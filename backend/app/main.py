@@ -1,11 +1,14 @@
 from __future__ import annotations
 
+import threading
+
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.config import get_settings
 from app.routers.auth import router as auth_router
+from app.routers.creator import recover_pending_listing_ai
 from app.routers.creator import router as creator_router
 from app.routers.discovery import router as discovery_router
 from app.routers.milestones import router as milestones_router
@@ -16,6 +19,19 @@ from app.routers.teacher import router as teacher_router
 from app.routers.users import router as users_router
 from app.routers.wallet import router as wallet_router
 from app.schemas import HealthResponse
+from app.services.ai import get_ai
+from app.services.engagement import get_engagement
+from app.services.finternet import get_settlement_batcher
+from app.services.forecasting import shutdown_arima_pool
+from app.services.lifecycle import (
+    get_sweeper,
+    prepare_netted_settlement,
+    record_netted_settlement,
+    recover_accrued_settlements,
+    renew_settlement_accruals,
+)
+from app.services.outbox import get_outbox
+from app.services.review_scoring import recover_pending_reviews
 from app.services.seed import seed_fake_data
 
 
@@ -75,6 +91,77 @@ def create_app() -> FastAPI:
         # Seeds fake users + listings for quick frontend demo.
         seed_fake_data()
 
+    @app.on_event("startup")
+    def _warm_up_ai() -> None:
+        # Off the startup path so the worker starts accepting requests immediately.
+        if s.ai_warmup_on_startup:
+            threading.Thread(target=get_ai().warm_up, name="ai-warmup", daemon=True).start()
+
+    @app.on_event("startup")
+    def _start_engagement_flusher() -> None:
+        # Periodically persists heartbeat engagement for active sessions.
+        if s.supabase_url and s.supabase_key:
+            get_engagement().start()
+
+    @app.on_event("shutdown")
+    def _stop_engagement_flusher() -> None:
+        if s.supabase_url and s.supabase_key:
+            get_engagement().stop()
+
+    @app.on_event("startup")
+    def _start_settlement_batcher() -> None:
+        # Nets per-teacher settlements; must be running before the outbox delivers events.
+        if s.supabase_url and s.supabase_key and s.settlement_batching:
+            batcher = get_settlement_batcher()
+            batcher.on_prepare(prepare_netted_settlement)
+            batcher.on_flush(record_netted_settlement)
+            batcher.on_hold(renew_settlement_accruals)
+            recover_accrued_settlements()
+            batcher.start()
+
+    @app.on_event("shutdown")
+    def _stop_settlement_batcher() -> None:
+        if s.supabase_url and s.supabase_key and s.settlement_batching:
+            get_settlement_batcher().stop()
+
+    @app.on_event("startup")
+    def _start_outbox_dispatcher() -> None:
+        # Delivers escrow/settlement outbox events to Finternet off the request path.
+        if s.supabase_url and s.supabase_key:
+            get_outbox().start()
+
+    @app.on_event("shutdown")
+    def _stop_outbox_dispatcher() -> None:
+        if s.supabase_url and s.supabase_key:
+            get_outbox().stop()
+
+    @app.on_event("startup")
+    def _start_session_sweeper() -> None:
+        # Auto-ends sessions abandoned while active so their reserve is settled/refunded.
+        if s.supabase_url and s.supabase_key and s.session_sweep_enabled:
+            get_sweeper().start()
+
+    @app.on_event("shutdown")
+    def _stop_session_sweeper() -> None:
+        if s.supabase_url and s.supabase_key and s.session_sweep_enabled:
+            get_sweeper().stop()
+
+    @app.on_event("startup")
+    def _recover_listing_ai() -> None:
+        # Listing AI jobs live in memory; re-queue listings a restart left pending.
+        if s.supabase_url and s.supabase_key:
+            recover_pending_listing_ai()
+
+    @app.on_event("startup")
+    def _recover_review_scoring() -> None:
+        # Background scoring jobs live in memory; re-queue reviews a restart left pending.
+        if s.supabase_url and s.supabase_key and s.review_scoring_mode == "background":
+            recover_pending_reviews()
+
+    @app.on_event("shutdown")
+    def _stop_arima_pool() -> None:
+        shutdown_arima_pool()
+
     return app
 
 
@@ -25,9 +25,12 @@ ListingType = Literal["single_video", "multi_video_course"]
 ListingStatus = Literal["draft", "published", "flagged"]
 SessionStatus = Literal["pending", "active", "ended", "cancelled"]
 PaymentType = Literal["lock", "settle", "refund"]
-PaymentStatus = Literal["pending", "success", "failed"]
+PaymentStatus = Literal["pending", "accrued", "settling", "success", "failed"]
 MilestoneStatus = Literal["pending", "proof_submitted", "completed", "failed"]
 EscrowStatus = Literal["active", "released", "failed"]
+OutboxStatus = Literal["pending", "in_flight", "delivered", "failed"]
+AIStatus = Literal["pending", "ready", "failed"]
+ReviewScoringStatus = Literal["pending", "scoring", "scored", "failed"]
 
 
 class User(Base):
@@ -55,6 +58,8 @@ class Listing(Base):
     price_per_min: Mapped[float] = mapped_column(Float)
     tags: Mapped[dict[str, Any] | None] = mapped_column(JSON, nullable=True)
     thumbnail_url: Mapped[str | None] = mapped_column(String, nullable=True)
+    # Downscaled derivatives of thumbnail_url: {"card": url, "detail": url}
+    thumbnail_variants: Mapped[dict[str, str] | None] = mapped_column(JSON, nullable=True)
     status: Mapped[ListingStatus] = mapped_column(String)
     video_urls: Mapped[list[str] | None] = mapped_column(JSON, nullable=True)
     created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -64,6 +69,12 @@ class Listing(Base):
     base_price: Mapped[float | None] = mapped_column(Float, nullable=True)
     transcription_url: Mapped[str | None] = mapped_column(String, nullable=True)
     course_outcomes: Mapped[list[str] | None] = mapped_column(JSON, nullable=True)
+    # Per-video container metadata probed on upload: [{duration_sec, width, height, bitrate_kbps, size_bytes}]
+    media_metadata: Mapped[list[dict[str, Any]] | None] = mapped_column(JSON, nullable=True)
+    # Background AI generation state for transcription/course_outcomes
+    ai_status: Mapped[AIStatus | None] = mapped_column(String, nullable=True)
+    # Set by the worker that owns the AI job; startup recovery only takes expired claims
+    ai_claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
 class Session(Base):
@@ -95,6 +106,10 @@ class Review(Base):
     review_text: Mapped[str] = mapped_column(String)
     credibility_score: Mapped[float] = mapped_column(Float)
     bonus_percentage: Mapped[int] = mapped_column(Integer)
+    scoring_status: Mapped[ReviewScoringStatus] = mapped_column(String, default="scored")
+    # Background scoring claim: owning job and when it was taken
+    scoring_claimed_by: Mapped[str | None] = mapped_column(String, nullable=True)
+    scoring_claimed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
 
@@ -108,6 +123,11 @@ class Payment(Base):
     status: Mapped[PaymentStatus] = mapped_column(String)
     finternet_tx_id: Mapped[str | None] = mapped_column(String, nullable=True)
     created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Settlement batching: worker whose SettlementBatcher holds this settle payment, and its last renewal
+    accrued_by: Mapped[str | None] = mapped_column(String, nullable=True)
+    accrued_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Netted transfer this settle payment is in flight (or was paid) under; its idempotency key
+    settlement_batch_id: Mapped[str | None] = mapped_column(String, nullable=True)
 
 
 class Escrow(Base):
@@ -135,3 +155,49 @@ class Milestone(Base):
     status: Mapped[MilestoneStatus] = mapped_column(String)
     proof_data: Mapped[dict[str, Any] | None] = mapped_column(JSON, nullable=True)  # Contains video_url, notes
     created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class MediaBlob(Base):
+    """Content-addressed index of uploaded media: one storage object per (teacher, SHA-256)."""
+
+    __tablename__ = "media_blobs"
+
+    teacher_id: Mapped[str] = mapped_column(String, primary_key=True)
+    sha256: Mapped[str] = mapped_column(String, primary_key=True)
+    path: Mapped[str] = mapped_column(String)
+    bucket: Mapped[str] = mapped_column(String)
+    public_url: Mapped[str] = mapped_column(String)
+    content_type: Mapped[str | None] = mapped_column(String, nullable=True)
+    size_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    variants: Mapped[dict[str, str] | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class OutboxEvent(Base):
+    """Pending external (Finternet) calls, written in the same transaction as the session rows."""
+
+    __tablename__ = "outbox"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    session_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    kind: Mapped[str] = mapped_column(String)  # session_escrow | session_settlement
+    payload: Mapped[dict[str, Any]] = mapped_column(JSON)
+    status: Mapped[OutboxStatus] = mapped_column(String)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    available_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    delivered_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class TeacherForecast(Base):
+    """Precomputed forecasts per teacher, written by the nightly batch job."""
+
+    __tablename__ = "teacher_forecasts"
+
+    teacher_id: Mapped[str] = mapped_column(String, primary_key=True)
+    avg_forecast_bonus: Mapped[float] = mapped_column(Float)
+    next_bonus_predictions: Mapped[list[float]] = mapped_column(JSON)
+    predicted_rating: Mapped[float | None] = mapped_column(Float, nullable=True)
+    review_count: Mapped[int] = mapped_column(Integer, default=0)
+    computed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
 import json
+import logging
+from datetime import datetime, timedelta, timezone
 from typing import List
 from uuid import uuid4
 
 from fastapi import APIRouter, Depends, File, Form, UploadFile
 
+from app.config import get_settings
 from app.deps import require_teacher
 from app.errors import http_error
 from app.schemas import CreatorUploadResponse
 from app.services.ai import get_ai
-from app.supabase_client import get_supabase, utc_now_iso
+from app.services.jobs import Job, get_jobs
+from app.services.media import hash_file, make_thumbnail_variants, probe_mp4, thumbnails_available
+from app.supabase_client import SupabaseService, get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/creator", tags=["creator"])
 
@@ -31,7 +38,8 @@ async def upload(
     transcription: UploadFile | None = File(None),
     # Optional legacy fields (for backward compatibility)
     listing_type: str = Form("single_video"),
-    total_duration_min: float = Form(10.0),
+    # Derived from the uploaded MP4/MOV container when possible; this is only a fallback.
+    total_duration_min: float | None = Form(None),
     reserve_amount: float = Form(30.0),
     price_per_min: float = Form(1.5),
     tags_json: str = Form("{}"),
@@ -51,17 +59,20 @@ async def upload(
     - listing_id: optional (for updating existing listing)
 
     This endpoint:
-    - Uploads video(s), thumbnail, and transcription to Supabase Storage
-    - Auto-generates transcription if not provided (using AI from description + metadata)
-    - Auto-generates course_outcomes (using AI from description + transcription)
-    - Creates/updates a listing with all metadata
-    - Returns listing_id and preview URLs
+    - Probes each video's MP4/MOV header for duration/resolution/bitrate; total_duration_min
+      is derived from the real durations (form value is only a fallback)
+    - Uploads video(s), thumbnail, and transcription to Supabase Storage, deduplicated by
+      SHA-256 content hash per teacher (re-uploading an identical file reuses their stored object)
+    - Creates/updates a listing with all metadata (ai_status="pending")
+    - Queues card/detail thumbnail derivatives (WebP/JPEG) -> listing.thumbnail_variants
+    - Queues a background job that auto-generates transcription if not provided and
+      course_outcomes (using AI from description + transcription), then sets ai_status="ready"
+    - Returns listing_id, preview URLs and the job_id (poll GET /creator/jobs/{job_id})
 
     Note: teacher_id is extracted from JWT token (require_teacher dependency).
     Visibility values: "draft", "public", "private"
     """
     sb = get_supabase()
-    ai = get_ai()
     teacher_id = teacher["id"]
 
     # Validate visibility
@@ -75,34 +86,49 @@ async def upload(
 
     # Upload videos
     video_urls: list[str] = []
+    media_metadata: list[dict | None] = []
     teacher_dir = f"{teacher_id}/{uuid4().hex}"
     for idx, vid_file in enumerate(video_files):
-        content = await vid_file.read()
-        if not content:
-            raise http_error(400, f"Empty video file: {vid_file.filename}", code="EMPTY_FILE")
+        # Header-only container probe (duration/resolution/bitrate), no decoding
+        info = probe_mp4(vid_file.file)
+        media_metadata.append(info.to_dict() if info else None)
         content_type = vid_file.content_type or "video/mp4"
         storage_path = f"{teacher_dir}/video_{idx}_{vid_file.filename or 'video.mp4'}"
         try:
-            uploaded = sb.upload_file(path=storage_path, file_bytes=content, content_type=content_type)
-            if not uploaded or "public_url" not in uploaded:
-                raise http_error(500, f"Video upload failed: invalid response", code="UPLOAD_FAILED")
-            video_urls.append(uploaded["public_url"])
+            uploaded = await _store_upload(
+                sb, vid_file, teacher_id=teacher_id, path=storage_path, content_type=content_type
+            )
         except Exception as e:
             raise http_error(500, f"Failed to upload video: {str(e)}", code="UPLOAD_FAILED") from e
+        if uploaded is None:
+            raise http_error(400, f"Empty video file: {vid_file.filename}", code="EMPTY_FILE")
+        video_urls.append(uploaded["public_url"])
 
     # Upload thumbnail
-    thumb_content = await thumbnail.read()
-    if not thumb_content:
-        raise http_error(400, "Empty thumbnail file", code="EMPTY_THUMBNAIL")
     thumb_content_type = thumbnail.content_type or "image/jpeg"
     thumb_path = f"{teacher_dir}/thumb_{thumbnail.filename or 'thumbnail.jpg'}"
     try:
-        thumb_uploaded = sb.upload_file(path=thumb_path, file_bytes=thumb_content, content_type=thumb_content_type)
-        if not thumb_uploaded or "public_url" not in thumb_uploaded:
-            raise http_error(500, "Thumbnail upload failed: invalid response", code="UPLOAD_FAILED")
-        thumbnail_url = thumb_uploaded["public_url"]
+        thumb_uploaded = await _store_upload(
+            sb, thumbnail, teacher_id=teacher_id, path=thumb_path, content_type=thumb_content_type
+        )
     except Exception as e:
         raise http_error(500, f"Failed to upload thumbnail: {str(e)}", code="UPLOAD_FAILED") from e
+    if thumb_uploaded is None:
+        raise http_error(400, "Empty thumbnail file", code="EMPTY_THUMBNAIL")
+    thumbnail_url = thumb_uploaded["public_url"]
+    thumbnail_variants: dict | None = thumb_uploaded.get("variants")
+    thumb_bytes: bytes | None = None
+    if not thumbnail_variants and not thumb_uploaded["deduped"]:
+        # Keep the (small) original for the derivative job so it doesn't re-download it
+        await thumbnail.seek(0)
+        thumb_bytes = await thumbnail.read()
+
+    # Prefer real container durations for metering; fall back to the form value
+    probed_sec = [m["duration_sec"] for m in media_metadata if m]
+    if probed_sec and len(probed_sec) == len(media_metadata):
+        total_duration_min = round(sum(probed_sec) / 60.0, 2)
+    elif total_duration_min is None:
+        total_duration_min = 10.0
 
     # Handle transcription
     transcription_url: str | None = None
@@ -110,42 +136,25 @@ async def upload(
 
     if transcription:
         # Upload provided transcription file
-        trans_content = await transcription.read()
-        if trans_content:
-            trans_content_type = transcription.content_type or "text/plain"
-            trans_path = f"{teacher_dir}/transcription_{transcription.filename or 'transcription.txt'}"
-            try:
-                trans_uploaded = sb.upload_file(path=trans_path, file_bytes=trans_content, content_type=trans_content_type)
-                if not trans_uploaded or "public_url" not in trans_uploaded:
-                    raise http_error(500, "Transcription upload failed: invalid response", code="UPLOAD_FAILED")
-                transcription_url = trans_uploaded["public_url"]
-            except Exception as e:
-                raise http_error(500, f"Failed to upload transcription: {str(e)}", code="UPLOAD_FAILED") from e
+        trans_content_type = transcription.content_type or "text/plain"
+        trans_path = f"{teacher_dir}/transcription_{transcription.filename or 'transcription.txt'}"
+        try:
+            trans_uploaded = await _store_upload(
+                sb, transcription, teacher_id=teacher_id, path=trans_path, content_type=trans_content_type
+            )
+        except Exception as e:
+            raise http_error(500, f"Failed to upload transcription: {str(e)}", code="UPLOAD_FAILED") from e
+        if trans_uploaded is not None:
+            transcription_url = trans_uploaded["public_url"]
             # Read text for course_outcomes generation
+            await transcription.seek(0)
             try:
-                transcription_text = trans_content.decode("utf-8")
+                transcription_text = (await transcription.read()).decode("utf-8")
             except Exception:
                 transcription_text = None
-    else:
-        # Generate transcription using AI
-        video_metadata = {
-            "duration_min": total_duration_min,
-            "category": category,
-        }
-        transcription_text = ai.generate_transcription(description=description, video_metadata=video_metadata)
-        # Upload generated transcription as .txt file
-        trans_bytes = transcription_text.encode("utf-8")
-        trans_path = f"{teacher_dir}/transcription_generated.txt"
-        try:
-            trans_uploaded = sb.upload_file(path=trans_path, file_bytes=trans_bytes, content_type="text/plain")
-            if not trans_uploaded or "public_url" not in trans_uploaded:
-                raise http_error(500, "Generated transcription upload failed: invalid response", code="UPLOAD_FAILED")
-            transcription_url = trans_uploaded["public_url"]
-        except Exception as e:
-            raise http_error(500, f"Failed to upload generated transcription: {str(e)}", code="UPLOAD_FAILED") from e
 
-    # Generate course_outcomes using AI
-    course_outcomes = ai.generate_course_outcomes(description=description, transcription=transcription_text)
+    # Transcription (if missing) and course_outcomes are generated by a background job;
+    # the listing is published right away with ai_status="pending".
 
     # Determine listing type based on number of videos
     if len(video_urls) > 1:
@@ -175,14 +184,19 @@ async def upload(
         "base_price": basePrice,
         "type": listing_type,
         "total_duration_min": total_duration_min,
+        "media_metadata": media_metadata,
         "reserve_amount": reserve_amount,
         "price_per_min": price_per_min,
         "tags": tags,
         "thumbnail_url": thumbnail_url,
+        "thumbnail_variants": thumbnail_variants,
         "status": status,
         "video_urls": video_urls,
         "transcription_url": transcription_url,
-        "course_outcomes": course_outcomes,
+        "course_outcomes": None,
+        "ai_status": "pending",
+        # This worker owns the AI job; startup recovery leaves the listing alone until the lease lapses
+        "ai_claimed_at": utc_now_iso(),
         "created_at": utc_now_iso(),
     }
 
@@ -202,9 +216,296 @@ async def upload(
         print(f"ERROR: Failed to insert/update listing {lid}: {e}")
         raise http_error(500, f"Database error: {str(e)}", code="DB_ERROR")
 
+    job = _queue_listing_ai_fields(
+        listing_id=lid,
+        teacher_id=teacher_id,
+        teacher_dir=teacher_dir,
+        description=description,
+        category=category,
+        total_duration_min=total_duration_min,
+        transcription_text=transcription_text,
+        generate_transcription=transcription_url is None,
+    )
+
+    if not thumbnail_variants:
+        if thumbnails_available():
+            get_jobs().submit(
+                "thumbnail_variants",
+                _generate_thumbnail_variants,
+                listing_id=lid,
+                teacher_id=teacher_id,
+                sha256=thumb_uploaded["sha256"],
+                source_path=thumb_uploaded["path"],
+                image_bytes=thumb_bytes,
+                meta={"listing_id": lid, "teacher_id": teacher_id},
+            )
+        else:
+            logger.warning("Pillow not installed; skipping thumbnail derivatives")
+
     # Return first video URL for backward compatibility (or all URLs joined)
     preview_url = video_urls[0] if video_urls else ""
-    return CreatorUploadResponse(listing_id=lid, uploaded_url=preview_url, storage_path=teacher_dir)
+    return CreatorUploadResponse(
+        listing_id=lid,
+        uploaded_url=preview_url,
+        storage_path=teacher_dir,
+        ai_status="pending",
+        job_id=job.id,
+    )
+
+
+async def _store_upload(
+    sb: SupabaseService, upload: UploadFile, *, teacher_id: str, path: str, content_type: str
+) -> dict | None:
+    """
+    Store an uploaded file once per teacher and content hash.
+
+    The spooled upload is streamed through SHA-256 first; if the `media_blobs`
+    index already has that hash for this teacher, their existing storage object
+    is reused and the bytes are never read into memory or re-sent to Storage.
+    Dedup never crosses teachers: an identical file from someone else is stored
+    again under the uploader's own prefix.
+
+    Returns { "public_url", "path", "sha256", "deduped" }, or None for an empty file.
+    """
+    sha256, size = hash_file(upload.file)
+    if size == 0:
+        return None
+
+    try:
+        blob = sb.maybe_single("media_blobs", "*", teacher_id=teacher_id, sha256=sha256)
+    except Exception as e:
+        # Index unavailable (e.g. migration not applied): fall back to a plain upload.
+        logger.warning(f"media_blobs lookup failed, uploading without dedup: {e}")
+        blob = None
+    if blob and blob.get("public_url"):
+        logger.info(f"Dedup hit for {sha256[:12]}: reusing {blob['path']}")
+        return {
+            "public_url": blob["public_url"],
+            "path": blob["path"],
+            "sha256": sha256,
+            "deduped": True,
+            "variants": blob.get("variants"),
+        }
+
+    content = await upload.read()
+    uploaded = sb.upload_file(path=path, file_bytes=content, content_type=content_type)
+    if not uploaded or "public_url" not in uploaded:
+        raise RuntimeError("Storage upload returned an invalid response")
+    try:
+        sb.upsert(
+            "media_blobs",
+            {
+                "teacher_id": teacher_id,
+                "sha256": sha256,
+                "path": uploaded["path"],
+                "bucket": uploaded["bucket"],
+                "public_url": uploaded["public_url"],
+                "content_type": content_type,
+                "size_bytes": size,
+                "created_at": utc_now_iso(),
+            },
+            on_conflict="teacher_id,sha256",
+        )
+    except Exception as e:
+        logger.warning(f"Failed to index blob {sha256[:12]}: {e}")
+    return {
+        "public_url": uploaded["public_url"],
+        "path": uploaded["path"],
+        "sha256": sha256,
+        "deduped": False,
+        "variants": None,
+    }
+
+
+def _generate_listing_ai_fields(
+    *,
+    listing_id: str,
+    teacher_dir: str,
+    description: str,
+    category: str,
+    total_duration_min: float,
+    transcription_text: str | None,
+    generate_transcription: bool,
+) -> dict:
+    """
+    Background job: fill in AI-generated listing fields after upload.
+
+    - Generates + uploads a transcription when the teacher didn't provide one
+    - Generates course_outcomes from description + transcription
+    - Marks the listing ai_status="ready"
+    """
+    sb = get_supabase()
+    ai = get_ai()
+    updates: dict = {}
+
+    if generate_transcription:
+        video_metadata = {
+            "duration_min": total_duration_min,
+            "category": category,
+        }
+        transcription_text = ai.generate_transcription(description=description, video_metadata=video_metadata)
+        trans_uploaded = sb.upload_file(
+            path=f"{teacher_dir}/transcription_generated.txt",
+            file_bytes=transcription_text.encode("utf-8"),
+            content_type="text/plain",
+        )
+        if not trans_uploaded or "public_url" not in trans_uploaded:
+            raise RuntimeError("Generated transcription upload failed: invalid response")
+        updates["transcription_url"] = trans_uploaded["public_url"]
+
+    updates["course_outcomes"] = ai.generate_course_outcomes(
+        description=description, transcription=transcription_text
+    )
+    updates["ai_status"] = "ready"
+    sb.update("listings", updates, match={"id": listing_id})
+    return {"listing_id": listing_id, **updates}
+
+
+def _generate_thumbnail_variants(
+    *,
+    listing_id: str,
+    teacher_id: str,
+    sha256: str,
+    source_path: str,
+    image_bytes: bytes | None,
+) -> dict:
+    """
+    Background job: build card/detail thumbnail derivatives next to the original.
+
+    Variant URLs are saved on the listing (`thumbnail_variants`) and on the
+    media_blobs row, so a re-upload of the same thumbnail reuses them.
+    """
+    sb = get_supabase()
+    if image_bytes is None:
+        image_bytes = sb.download_file(path=source_path)
+
+    base_dir = source_path.rsplit("/", 1)[0]
+    urls: dict[str, str] = {}
+    for name, (data, content_type, ext) in make_thumbnail_variants(image_bytes).items():
+        uploaded = sb.upload_file(
+            path=f"{base_dir}/thumb_{sha256[:16]}_{name}.{ext}",
+            file_bytes=data,
+            content_type=content_type,
+        )
+        urls[name] = uploaded["public_url"]
+
+    sb.update("listings", {"thumbnail_variants": urls}, match={"id": listing_id})
+    try:
+        sb.update("media_blobs", {"variants": urls}, match={"teacher_id": teacher_id, "sha256": sha256})
+    except Exception as e:
+        logger.warning(f"Failed to record variants for blob {sha256[:12]}: {e}")
+    return urls
+
+
+def _mark_listing_ai_failed(listing_id: str) -> None:
+    get_supabase().update("listings", {"ai_status": "failed"}, match={"id": listing_id})
+
+
+def _queue_listing_ai_fields(*, listing_id: str, teacher_id: str, **fields) -> Job:
+    return get_jobs().submit(
+        "listing_ai_fields",
+        _generate_listing_ai_fields,
+        listing_id=listing_id,
+        **fields,
+        meta={"listing_id": listing_id, "teacher_id": teacher_id},
+        on_failure=lambda e: _mark_listing_ai_failed(listing_id),
+    )
+
+
+def _storage_path(public_url: str, bucket: str) -> str | None:
+    marker = f"/object/public/{bucket}/"
+    return public_url.split(marker, 1)[1] if marker in public_url else None
+
+
+def _claim_pending_listing(row: dict, lease_s: float) -> bool:
+    """Compare-and-set `ai_claimed_at` so only one worker re-queues a listing."""
+    claimed_at = row.get("ai_claimed_at")
+    if claimed_at:
+        claimed = datetime.fromisoformat(str(claimed_at).replace("Z", "+00:00"))
+        if datetime.now(timezone.utc) - claimed < timedelta(seconds=lease_s):
+            return False  # still owned by the worker that accepted the upload
+    q = (
+        get_supabase()
+        .client.table("listings")
+        .update({"ai_claimed_at": utc_now_iso()})
+        .eq("id", row["id"])
+        .eq("ai_status", "pending")
+    )
+    q = q.eq("ai_claimed_at", claimed_at) if claimed_at else q.is_("ai_claimed_at", "null")
+    res = q.execute()
+    return bool(res and res.data)
+
+
+def recover_pending_listing_ai(limit: int = 500) -> int:
+    """
+    Re-queue AI generation for listings a restart left at ai_status="pending".
+
+    Jobs live in memory only. Each listing is claimed in the DB first, so when
+    several workers start at once only one of them re-queues it.
+    """
+    sb = get_supabase()
+    lease_s = get_settings().listing_ai_lease_s
+    try:
+        rows = (
+            sb.client.table("listings")
+            .select(
+                "id, teacher_id, description, category, total_duration_min, transcription_url, ai_claimed_at"
+            )
+            .eq("ai_status", "pending")
+            .order("created_at", desc=False)
+            .limit(limit)
+            .execute()
+            .data
+            or []
+        )
+    except Exception as e:
+        logger.error(f"Failed to load listings with pending AI fields: {e}")
+        return 0
+
+    queued = 0
+    for row in rows:
+        try:
+            if not _claim_pending_listing(row, lease_s):
+                continue
+            transcription_text: str | None = None
+            url = row.get("transcription_url")
+            path = _storage_path(url, sb.videos_bucket) if url else None
+            if path:
+                try:
+                    transcription_text = sb.download_file(path=path).decode("utf-8")
+                except Exception as e:
+                    logger.warning(f"Could not reload transcription for listing {row['id']}: {e}")
+        except Exception as e:
+            logger.error(f"Failed to claim listing {row['id']} for AI recovery: {e}")
+            continue
+        _queue_listing_ai_fields(
+            listing_id=row["id"],
+            teacher_id=row["teacher_id"],
+            teacher_dir=f"{row['teacher_id']}/{uuid4().hex}",
+            description=row.get("description") or "",
+            category=row.get("category") or "",
+            total_duration_min=float(row.get("total_duration_min") or 10.0),
+            transcription_text=transcription_text,
+            generate_transcription=not row.get("transcription_url"),
+        )
+        queued += 1
+    if queued:
+        logger.info(f"Re-queued AI generation for {queued} pending listings")
+    return queued
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, teacher: dict = Depends(require_teacher)) -> dict:
+    """
+    Status of a background upload job (AI transcription + course outcomes).
+
+    Frontend can poll this after /creator/upload until status is "succeeded" or "failed".
+    Job state is kept in memory by the worker that accepted the upload.
+    """
+    job = get_jobs().get(job_id)
+    if not job or job.meta.get("teacher_id") != teacher["id"]:
+        raise http_error(404, "Job not found", code="JOB_NOT_FOUND")
+    return job.to_public_dict()
 
 
 @router.get("/listings/{teacher_id}")
@@ -1,22 +1,33 @@
 from __future__ import annotations
 
+import json
+import logging
+from collections.abc import Iterator
+
 from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
 
 from app.errors import http_error
-from app.schemas import CourseDetailResponse, DiscoverySuggestRequest, DiscoverySuggestResponse, ListingPublic
+from app.schemas import (
+    CourseDetailResponse,
+    DiscoverySuggestRequest,
+    DiscoverySuggestResponse,
+    ListingPublic,
+)
 from app.services.ai import get_ai
 from app.supabase_client import get_supabase
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/discovery", tags=["discovery"])
 
 
-@router.post("/suggest", response_model=DiscoverySuggestResponse)
-def suggest(req: DiscoverySuggestRequest) -> DiscoverySuggestResponse:
-    sb = get_supabase()
+def _suggest_candidates(sb) -> list[dict]:
+    """Listings the concierge picks from, with teacher_name and reviews_rating filled in."""
     listings = (
         sb.client.table("listings")
         .select(
-            "id,teacher_id,title,description,type,total_duration_min,reserve_amount,price_per_min,tags,thumbnail_url,status,video_urls"
+            "id,teacher_id,title,description,type,total_duration_min,reserve_amount,price_per_min,tags,thumbnail_url,thumbnail_variants,status,video_urls"
         )
         # .eq("status", "published")
         .limit(50)
@@ -31,9 +42,11 @@ def suggest(req: DiscoverySuggestRequest) -> DiscoverySuggestResponse:
     for l in listings:
         l["teacher_name"] = teacher_names.get(l["teacher_id"]) or ""
         l["reviews_rating"] = ratings.get(l["id"])
+    return listings
 
-    ai = get_ai()
-    slim = [
+
+def _slim_for_ai(listings: list[dict]) -> list[dict]:
+    return [
         {
             "id": l["id"],
             "title": l.get("title"),
@@ -46,29 +59,97 @@ def suggest(req: DiscoverySuggestRequest) -> DiscoverySuggestResponse:
         for l in listings
     ]
 
-    try:
-        ids, reasoning = ai.suggest_listings(query=req.query, listings=slim)
-    except Exception:
-        q = req.query.lower()
-        scored = []
-        for l in listings:
-            text = f"{l.get('title','')} {l.get('description','')} {l.get('tags') or ''}".lower()
-            score = sum(1 for token in q.split() if token in text)
-            scored.append((score, l))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        top = [x[1] for x in scored[:3]]
-        return DiscoverySuggestResponse(matches=[ListingPublic(**t) for t in top], reasoning=None)
 
+def _keyword_matches(query: str, listings: list[dict]) -> list[dict]:
+    """Fallback when AI is unavailable: top 3 listings by query-token overlap."""
+    q = query.lower()
+    scored = []
+    for l in listings:
+        text = f"{l.get('title','')} {l.get('description','')} {l.get('tags') or ''}".lower()
+        score = sum(1 for token in q.split() if token in text)
+        scored.append((score, l))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [x[1] for x in scored[:3]]
+
+
+def _picked_listings(ids: list[str], listings: list[dict]) -> list[dict]:
     by_id = {l["id"]: l for l in listings}
     picked = [by_id[i] for i in ids if i in by_id]
     if not picked:
         picked = listings[:3]
+    return picked[:3]
+
+
+@router.post("/suggest", response_model=DiscoverySuggestResponse)
+def suggest(req: DiscoverySuggestRequest) -> DiscoverySuggestResponse:
+    sb = get_supabase()
+    listings = _suggest_candidates(sb)
+
+    ai = get_ai()
+    try:
+        ids, reasoning = ai.suggest_listings(query=req.query, listings=_slim_for_ai(listings))
+    except Exception:
+        top = _keyword_matches(req.query, listings)
+        return DiscoverySuggestResponse(matches=[ListingPublic(**t) for t in top], reasoning=None)
+
     return DiscoverySuggestResponse(
-        matches=[ListingPublic(**p) for p in picked[:3]],
+        matches=[ListingPublic(**p) for p in _picked_listings(ids, listings)],
         reasoning=reasoning,
     )
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@router.post("/suggest/stream")
+def suggest_stream(req: DiscoverySuggestRequest) -> StreamingResponse:
+    """
+    Server-Sent Events variant of /discovery/suggest.
+
+    Events, in order:
+    - `matches`: {"matches": [ListingPublic, ...]} as soon as the model has named its picks
+    - `token`: {"text": "..."} reasoning text chunks as the model produces them
+    - `done`: {"reasoning": full text or null}
+    (`error`: {"message": ...} if the model fails mid-stream)
+    """
+    sb = get_supabase()
+    listings = _suggest_candidates(sb)
+    slim = _slim_for_ai(listings)
+
+    def events() -> Iterator[str]:
+        reasoning: list[str] = []
+        sent_matches = False
+        try:
+            for kind, value in get_ai().stream_suggest_listings(query=req.query, listings=slim):
+                if kind == "matches":
+                    picked = (
+                        _picked_listings(value, listings)
+                        if value is not None
+                        else _keyword_matches(req.query, listings)
+                    )
+                    sent_matches = True
+                    yield _sse("matches", {"matches": [ListingPublic(**p).model_dump() for p in picked]})
+                elif kind == "token":
+                    reasoning.append(value)
+                    yield _sse("token", {"text": value})
+        except Exception as e:
+            if sent_matches:
+                logger.warning(f"Concierge stream failed mid-response: {e}")
+                yield _sse("error", {"message": "AI response interrupted"})
+            else:
+                top = _keyword_matches(req.query, listings)
+                yield _sse("matches", {"matches": [ListingPublic(**t).model_dump() for t in top]})
+        yield _sse("done", {"reasoning": "".join(reasoning).strip() or None})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Disable proxy buffering so events reach the browser as they are produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 def _teacher_names_and_ratings_for_listings(
     sb, listing_rows: list[dict]
 ) -> tuple[dict[str, str], dict[str, float]]:
@@ -285,9 +366,11 @@ def get_course_detail(listing_id: str) -> CourseDetailResponse:
         teacher_name=teacher_name or "",
         video_url=video_url,
         thumbnail=thumbnail_url,
+        thumbnail_variants=listing.get("thumbnail_variants"),
         reviews_rating=reviews_rating,
         course_outcomes=course_outcomes,
         transcription=transcription,
+        ai_status=listing.get("ai_status"),
         base_price=listing.get("base_price"),
         total_duration_min=listing.get("total_duration_min"),
         price_per_min=listing.get("price_per_min"),
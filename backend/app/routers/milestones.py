@@ -5,6 +5,7 @@ from uuid import uuid4
 
 from fastapi import APIRouter
 
+from app.deps import IdempotencyKey
 from app.errors import http_error
 from app.schemas import (
     EscrowResponse,
@@ -16,6 +17,7 @@ from app.schemas import (
     ProofSubmitRequest,
 )
 from app.services.finternet import get_finternet
+from app.services.idempotency import get_idempotency
 from app.supabase_client import get_supabase, utc_now_iso
 
 logger = logging.getLogger(__name__)
@@ -24,11 +26,27 @@ router = APIRouter(prefix="/milestones", tags=["milestones"])
 
 
 @router.post("/intent", response_model=dict)
-def create_payment_intent(req: PaymentIntentRequest) -> dict:
+def create_payment_intent(req: PaymentIntentRequest, idempotency_key: IdempotencyKey = None) -> dict:
     """
     Create a payment intent for milestone-based payouts.
     Returns: { intent_id, escrow_id, status, total_amount }
+
+    Supports the `Idempotency-Key` header (replays return the original intent).
     """
+    # The session is the key's caller scope, so it is required before any replay lookup
+    session_id = (req.metadata or {}).get("session_id")
+    if not session_id:
+        raise http_error(400, "session_id is required in metadata", code="INVALID_METADATA")
+    return get_idempotency().run(
+        "milestones.intent",
+        f"session:{session_id}",
+        idempotency_key,
+        req.model_dump(),
+        lambda: _create_payment_intent(req),
+    )
+
+
+def _create_payment_intent(req: PaymentIntentRequest) -> dict:
     print(f"\n{'='*60}")
     print(f"🔵 /milestones/intent ENDPOINT HIT!")
     print(f"{'='*60}")
@@ -144,11 +162,23 @@ def get_escrow(intent_id: str) -> EscrowResponse:
 
 
 @router.post("", response_model=MilestoneResponse)
-def create_milestone(req: MilestoneCreateRequest) -> MilestoneResponse:
+def create_milestone(req: MilestoneCreateRequest, idempotency_key: IdempotencyKey = None) -> MilestoneResponse:
     """
     Create a milestone for an escrow.
     Loops based on user engagement of content.
+
+    Supports the `Idempotency-Key` header.
     """
+    return get_idempotency().run(
+        "milestones.create",
+        f"session:{req.session_id}",
+        idempotency_key,
+        req.model_dump(),
+        lambda: _create_milestone(req),
+    )
+
+
+def _create_milestone(req: MilestoneCreateRequest) -> MilestoneResponse:
     sb = get_supabase()
     gw = get_finternet()
     
@@ -279,12 +309,26 @@ def get_milestone(milestone_id: str) -> MilestoneResponse:
 
 
 @router.post("/{milestone_id}/proof", response_model=MilestoneCompleteResponse)
-def submit_proof(milestone_id: str, req: ProofSubmitRequest) -> MilestoneCompleteResponse:
+def submit_proof(
+    milestone_id: str, req: ProofSubmitRequest, idempotency_key: IdempotencyKey = None
+) -> MilestoneCompleteResponse:
     """
     Submit proof for a milestone (video URL).
     Automatically completes the milestone upon submission.
     Triggers automatic fund release to teacher.
+
+    Supports the `Idempotency-Key` header (replays don't release funds twice).
     """
+    return get_idempotency().run(
+        "milestones.proof",
+        f"milestone:{milestone_id}",
+        idempotency_key,
+        {"milestone_id": milestone_id, **req.model_dump()},
+        lambda: _submit_proof(milestone_id, req),
+    )
+
+
+def _submit_proof(milestone_id: str, req: ProofSubmitRequest) -> MilestoneCompleteResponse:
     sb = get_supabase()
     gw = get_finternet()
     
@@ -338,11 +382,25 @@ def submit_proof(milestone_id: str, req: ProofSubmitRequest) -> MilestoneComplet
 
 
 @router.post("/{milestone_id}/complete", response_model=MilestoneCompleteResponse)
-def complete_milestone_manual(milestone_id: str) -> MilestoneCompleteResponse:
+def complete_milestone_manual(
+    milestone_id: str, idempotency_key: IdempotencyKey = None
+) -> MilestoneCompleteResponse:
     """
     Manually complete a milestone (fallback if proof not auto-triggering).
     This should rarely be used since proof submission auto-completes.
+
+    Supports the `Idempotency-Key` header.
     """
+    return get_idempotency().run(
+        "milestones.complete",
+        f"milestone:{milestone_id}",
+        idempotency_key,
+        {"milestone_id": milestone_id},
+        lambda: _complete_milestone_manual(milestone_id),
+    )
+
+
+def _complete_milestone_manual(milestone_id: str) -> MilestoneCompleteResponse:
     sb = get_supabase()
     gw = get_finternet()
     
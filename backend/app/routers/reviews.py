@@ -4,9 +4,15 @@ from uuid import uuid4
 
 from fastapi import APIRouter
 
+from app.config import get_settings
 from app.errors import http_error
-from app.schemas import ReviewSubmitRequest, ReviewSubmitResponse
-from app.services.ai import get_ai
+from app.schemas import ReviewResponse, ReviewSubmitRequest, ReviewSubmitResponse
+from app.services.review_scoring import (
+    heuristic_credibility,
+    queue_review_scoring,
+    record_review_observations,
+    score_review,
+)
 from app.supabase_client import get_supabase, utc_now_iso
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
@@ -24,65 +30,55 @@ def submit(req: ReviewSubmitRequest) -> ReviewSubmitResponse:
     if session.get("student_id") != req.student_id:
         raise http_error(403, "Not allowed to review this session", code="FORBIDDEN")
 
-    duration_min = float(session.get("duration_min") or 0.0)
-    completion = float(session.get("completion_percentage") or 0.0)
-    engagement = session.get("engagement_metrics") or {}
-
-    ai = get_ai()
-    # Step 1: Groq/OpenAI credibility + bonus
-    try:
-        credibility, bonus_pct = ai.score_review_credibility(
+    background = get_settings().review_scoring_mode == "background"
+    if background:
+        # Provisional score now; AI credibility + anomaly scoring runs as a job
+        completion = float(session.get("completion_percentage") or 0.0)
+        credibility, bonus_pct = heuristic_credibility(req.rating, completion)
+    else:
+        credibility, bonus_pct = score_review(
+            session=session,
             rating=req.rating,
             review_text=req.review_text,
-            engagement_metrics=engagement,
-            completion_percentage=completion,
-            duration_min=duration_min,
-        )
-    except Exception:
-        # If AI is unavailable, simple heuristic:
-        credibility = 0.4 + (completion / 100.0) * 0.6
-        credibility = max(0.0, min(1.0, credibility))
-        bonus_pct = 0
-        if req.rating >= 4 and credibility >= 0.75:
-            bonus_pct = 10
-
-    # Step 2: Temporal anomaly detection with ARIMA over historical ratings
-    try:
-        arima_result = ai.validate_review_with_arima(
-            session_id=req.session_id,
-            rating=req.rating,
             db=sb,
         )
-        anomaly = float(arima_result.get("anomaly_score", 0.0))
-    except Exception:
-        anomaly = 0.0
-
-    # Blend: penalize credibility slightly when rating is anomalous
-    credibility = max(0.0, min(1.0, credibility - anomaly * 0.3))
 
     # Bonus applies on amount charged (as a teacher bonus, paid by platform in real life).
     final_amount = float(session.get("final_amount_charged") or 0.0)
     applied_bonus_amount = round(final_amount * (bonus_pct / 100.0), 2)
 
     review_id = f"rev_{uuid4().hex}"
-    sb.insert(
-        "reviews",
-        {
-            "id": review_id,
-            "session_id": req.session_id,
-            "student_id": req.student_id,
-            "rating": req.rating,
-            "review_text": req.review_text,
-            "credibility_score": round(float(credibility), 3),
-            "bonus_percentage": int(bonus_pct),
-            "created_at": utc_now_iso(),
-        },
-    )
+    row = {
+        "id": review_id,
+        "session_id": req.session_id,
+        "student_id": req.student_id,
+        "rating": req.rating,
+        "review_text": req.review_text,
+        "credibility_score": round(float(credibility), 3),
+        "bonus_percentage": int(bonus_pct),
+        "created_at": utc_now_iso(),
+    }
+    if background:
+        row["scoring_status"] = "pending"
+    sb.insert("reviews", row)
+
+    if background:
+        queue_review_scoring(review_id)
+    else:
+        record_review_observations(session.get("teacher_id"), req.rating, int(bonus_pct))
 
     return ReviewSubmitResponse(
         review_id=review_id,
         credibility_score=round(float(credibility), 3),
         bonus_percentage=int(bonus_pct),
         applied_bonus_amount=applied_bonus_amount,
+        scoring_status="pending" if background else "scored",
     )
 
+
+@router.get("/{review_id}", response_model=ReviewResponse)
+def get_review(review_id: str) -> ReviewResponse:
+    review = get_supabase().maybe_single("reviews", "*", id=review_id)
+    if not review:
+        raise http_error(404, "Review not found", code="REVIEW_NOT_FOUND")
+    return ReviewResponse(**{**review, "scoring_status": review.get("scoring_status") or "scored"})
@@ -1,44 +1,78 @@
 from __future__ import annotations
 
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timezone
 from uuid import uuid4
 
 from fastapi import APIRouter
 
 from app.config import get_settings
+from app.deps import IdempotencyKey
 from app.errors import http_error
-from app.schemas import SessionEndBreakdown, SessionEndRequest, SessionStartRequest, SessionStartResponse
-from app.services.finternet import get_finternet
-from app.services.metering import compute_charge_amount, compute_completion_percentage
+from app.schemas import (
+    SessionEndBreakdown,
+    SessionEndRequest,
+    SessionHeartbeatRequest,
+    SessionHeartbeatResponse,
+    SessionStartRequest,
+    SessionStartResponse,
+)
+from app.services.active_sessions import get_active_sessions
+from app.services.engagement import get_engagement
+from app.services.finternet import SettlementError, get_finternet
+from app.services.idempotency import get_idempotency
+from app.services.lifecycle import accrue_settlement, end_session
+from app.services.metering import compute_completion_percentage
+from app.services.outbox import get_outbox, outbox_op
+from app.services.wallets import InsufficientBalance, get_wallets
 from app.supabase_client import get_supabase, utc_now_iso
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
+# Shared pool for independent DB/gateway round-trips inside a request
+_io_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="sessions-io")
+
 
 @router.post("/start", response_model=SessionStartResponse)
-def start(req: SessionStartRequest) -> SessionStartResponse:
+def start(req: SessionStartRequest, idempotency_key: IdempotencyKey = None) -> SessionStartResponse:
     """
     Session start:
-    - Ensure student + listing exist
+    - Ensure student + listing exist (fetched concurrently)
     - Ensure student wallet is connected + sufficient balance
     - Create session (active) + lock funds via Finternet (mock)
-    - Create escrow for milestone-based payouts
+    - Record escrow creation in the outbox (delivered by the background dispatcher)
+
+    Send an `Idempotency-Key` header to make retries safe (no duplicate session/lock).
     """
+    return get_idempotency().run(
+        "sessions.start",
+        f"student:{req.student_id}",
+        idempotency_key,
+        req.model_dump(),
+        lambda: _start(req),
+    )
+
+
+def _start(req: SessionStartRequest) -> SessionStartResponse:
     try:
         logger.info(f"Session start request received: student_id={req.student_id}, listing_id={req.listing_id}, reserve_amount={req.reserve_amount}")
         
         sb = get_supabase()
         s = get_settings()
 
-        student = sb.maybe_single("users", "*", id=req.student_id)
+        # Independent lookups run concurrently
+        student_f = _io_pool.submit(sb.maybe_single, "users", "*", id=req.student_id)
+        listing_f = _io_pool.submit(sb.maybe_single, "listings", "*", id=req.listing_id)
+        student = student_f.result()
+        listing = listing_f.result()
+
         if not student or student.get("role") != "student":
             logger.warning(f"Student not found or invalid role: {req.student_id}")
             raise http_error(404, "Student not found", code="STUDENT_NOT_FOUND")
 
-        listing = sb.maybe_single("listings", "*", id=req.listing_id)
         if not listing or listing.get("status") != "published":
             logger.warning(f"Listing not found or not published: {req.listing_id}")
             raise http_error(404, "Listing not found", code="LISTING_NOT_FOUND")
@@ -48,14 +82,10 @@ def start(req: SessionStartRequest) -> SessionStartResponse:
             # For MVP: auto-generate mock wallet if not set
             logger.info(f"Wallet not connected, generating mock wallet for {req.student_id}")
             wallet_address = f"0x{uuid4().hex[:40]}"
-            # Update student record with wallet
-            try:
-                sb.update("users", {"wallet_address": wallet_address}, match={"id": req.student_id})
-                logger.info(f"Mock wallet assigned: {wallet_address}")
-            except Exception as e:
-                logger.warning(f"Could not update wallet: {e}")
-                # Continue with generated wallet anyway
-
+            # Persist the wallet in the background; the generated wallet is used either way
+            _io_pool.submit(
+                sb.update, "users", {"wallet_address": wallet_address}, match={"id": req.student_id}
+            ).add_done_callback(_log_failure(f"Could not update wallet for {req.student_id}"))
 
         reserve_amount = float(
             req.reserve_amount
@@ -65,96 +95,24 @@ def start(req: SessionStartRequest) -> SessionStartResponse:
         reserve_amount = max(1.0, round(reserve_amount, 2))
         logger.info(f"Reserve amount: ${reserve_amount}")
 
-        gw = get_finternet()
-        balance = gw.get_balance(wallet_address=wallet_address)
-        logger.info(f"Student balance: ${balance}")
-        
-        if balance < reserve_amount:
-            logger.warning(f"❌ Insufficient balance: ${balance} < ${reserve_amount}")
-            raise http_error(402, "Insufficient balance", code="INSUFFICIENT_BALANCE")
-
-        lock_tx = gw.lock_funds(wallet_address=wallet_address, amount=reserve_amount)
-        logger.info(f"✅ Funds locked: {lock_tx.finternet_tx_id}")
-
+        # Check-and-reserve against the cached balance minus in-flight reservations;
+        # atomic per wallet, so concurrent starts can't oversubscribe it.
         session_id = f"sess_{uuid4().hex}"
-        now = datetime.now(timezone.utc).isoformat()
-        session_row = {
-            "id": session_id,
-            "student_id": req.student_id,
-            "teacher_id": listing["teacher_id"],
-            "listing_id": req.listing_id,
-            "status": "active",
-            "start_time": now,
-            "end_time": None,
-            "duration_min": None,
-            "completion_percentage": None,
-            "engagement_metrics": None,
-            "final_amount_charged": None,
-            "refund_amount": None,
-            "transaction_id": lock_tx.finternet_tx_id,
-            "created_at": utc_now_iso(),
-        }
-
-        sb.insert("sessions", session_row)
-        logger.info(f"Session created: {session_id}")
-
-        # Store payment record
-        sb.insert(
-            "payments",
-            {
-                "id": f"pay_{uuid4().hex}",
-                "session_id": session_id,
-                "type": "lock",
-                "amount": reserve_amount,
-                "status": "success",
-                "finternet_tx_id": lock_tx.finternet_tx_id,
-                "created_at": utc_now_iso(),
-            },
-        )
+        wallets = get_wallets()
+        try:
+            available = wallets.reserve(wallet_address, session_id, reserve_amount)
+        except InsufficientBalance as e:
+            logger.warning(f"❌ Insufficient balance: ${e.available} < ${reserve_amount}")
+            raise http_error(402, "Insufficient balance", code="INSUFFICIENT_BALANCE")
+        logger.info(f"Reserved ${reserve_amount}, ${available} still available")
 
-        # Create escrow for milestone-based payouts
         try:
-            print(f"\n🔵 CALLING create_payment_intent from sessions.py")
-            print(f"Amount: {reserve_amount}, Session: {session_id}")
-            
-            payment_intent = gw.create_payment_intent(
-                amount=reserve_amount,
-                currency="USD",
-                description=f"Escrow for session {session_id} - {listing['title']}",
-                metadata={
-                    "releaseType": "MILESTONE_LOCKED",
-                    "session_id": session_id,
-                    "student_id": req.student_id,
-                    "teacher_id": listing["teacher_id"],
-                },
+            return _lock_and_create_session(
+                req, listing, session_id, wallet_address, reserve_amount
             )
-            
-            print(f"✅ Got payment_intent response: {payment_intent}")
-            logger.info(f"Payment intent response: {payment_intent}")
-            
-            escrow_id = f"escrow_{uuid4().hex}"
-            escrow_row = {
-                "id": escrow_id,
-                "session_id": session_id,
-                "finternet_intent_id": payment_intent.get("id", ""),
-                "total_amount": reserve_amount,
-                "locked_amount": reserve_amount,
-                "status": "active",
-                "created_at": utc_now_iso(),
-            }
-            sb.insert("escrows", escrow_row)
-            logger.info(f"✅ Created escrow {escrow_id} for session {session_id}")
-        except Exception as e:
-            logger.warning(f"⚠️ Failed to create escrow for session {session_id}: {str(e)}")
-            # Continue anyway; escrow is optional for MVP
-
-        logger.info(f"Session start successful: {session_id}")
-        return SessionStartResponse(
-            session_id=session_id,
-            status="active",
-            reserve_amount=reserve_amount,
-            transaction_id=lock_tx.finternet_tx_id,
-        )
+        except BaseException:
+            wallets.release(wallet_address, session_id)
+            raise
     except Exception as exc:
         logger.error(f"Error in session start: {str(exc)}", exc_info=True)
         # Re-raise if it's already an HTTPException
@@ -164,122 +122,249 @@ def start(req: SessionStartRequest) -> SessionStartResponse:
         raise http_error(400, f"Session start failed: {str(exc)}", code="SESSION_START_ERROR")
 
 
-@router.post("/end", response_model=SessionEndBreakdown)
-def end(req: SessionEndRequest) -> SessionEndBreakdown:
-    """
-    Session end:
-    - Compute duration from start_time to now
-    - Compute completion percentage (from request or from chunk metrics)
-    - Compute final charged (capped by reserve) and refund
-    - Settle to teacher + refund student (mock)
-    - Update session + create payments rows
-    """
+def _lock_and_create_session(
+    req: SessionStartRequest,
+    listing: dict,
+    session_id: str,
+    wallet_address: str,
+    reserve_amount: float,
+) -> SessionStartResponse:
     sb = get_supabase()
+    gw = get_finternet()
+    lock_tx = gw.lock_funds(wallet_address=wallet_address, amount=reserve_amount)
+    logger.info(f"✅ Funds locked: {lock_tx.finternet_tx_id}")
+    get_wallets().confirm(wallet_address, session_id)
+
+    now = datetime.now(timezone.utc).isoformat()
+    session_row = {
+        "id": session_id,
+        "student_id": req.student_id,
+        "teacher_id": listing["teacher_id"],
+        "listing_id": req.listing_id,
+        "status": "active",
+        "start_time": now,
+        "end_time": None,
+        "duration_min": None,
+        "completion_percentage": None,
+        "engagement_metrics": None,
+        "final_amount_charged": None,
+        "refund_amount": None,
+        "transaction_id": lock_tx.finternet_tx_id,
+        "created_at": utc_now_iso(),
+    }
 
-    session = sb.maybe_single("sessions", "*", id=req.session_id)
-    if not session:
-        raise http_error(404, "Session not found", code="SESSION_NOT_FOUND")
-    if session.get("status") != "active":
-        raise http_error(400, "Session is not active", code="SESSION_NOT_ACTIVE")
-
-    listing = sb.maybe_single("listings", "*", id=session["listing_id"])
-    if not listing:
-        raise http_error(404, "Listing not found", code="LISTING_NOT_FOUND")
-
-    student = sb.maybe_single("users", "*", id=session["student_id"])
-    teacher = sb.maybe_single("users", "*", id=session["teacher_id"])
-    if not student or not teacher:
-        raise http_error(500, "Session user records missing", code="DATA_INTEGRITY")
-
-    wallet_address = student.get("wallet_address")
-    if not wallet_address:
-        raise http_error(400, "Wallet not connected", code="WALLET_NOT_CONNECTED")
-
-    start_raw = session.get("start_time")
-    if not start_raw:
-        raise http_error(500, "Session start_time missing", code="DATA_INTEGRITY")
-    start_dt = datetime.fromisoformat(start_raw.replace("Z", "+00:00"))
-    end_dt = datetime.now(timezone.utc)
-    duration_min = max(0.0, (end_dt - start_dt).total_seconds() / 60.0)
-
-    engagement = req.engagement_metrics or session.get("engagement_metrics") or {}
-    if req.completion_percentage is not None:
-        completion = float(req.completion_percentage)
-    else:
-        completion = compute_completion_percentage(listing, engagement)
-
-    # determine reserve amount
-    reserve_amount = (
-        float(session.get("reserve_amount") or 0.0)
-        if session.get("reserve_amount") is not None
-        else float(listing.get("reserve_amount") or get_settings().default_reserve_amount)
+    # Session + lock payment + escrow outbox event in one write round-trip.
+    # The payment intent is an external (slow) API call, so the outbox
+    # dispatcher delivers it after the response instead of blocking it.
+    sb.write_batch(
+        [
+            {"op": "insert", "table": "sessions", "rows": [session_row]},
+            {
+                "op": "insert",
+                "table": "payments",
+                "rows": [
+                    {
+                        "id": f"pay_{uuid4().hex}",
+                        "session_id": session_id,
+                        "type": "lock",
+                        "amount": reserve_amount,
+                        "status": "success",
+                        "finternet_tx_id": lock_tx.finternet_tx_id,
+                        "created_at": utc_now_iso(),
+                    }
+                ],
+            },
+            outbox_op(
+                "session_escrow",
+                session_id,
+                {
+                    "session_id": session_id,
+                    "reserve_amount": reserve_amount,
+                    "listing_title": listing["title"],
+                    "student_id": req.student_id,
+                    "teacher_id": listing["teacher_id"],
+                },
+            ),
+        ]
     )
+    logger.info(f"Session created: {session_id}")
+    get_active_sessions().register(session_row, listing)
 
-    final_charge, refund = compute_charge_amount(
-        duration_min=duration_min,
-        completion_percentage=completion,
-        price_per_min=float(listing.get("price_per_min") or 0.0),
-        total_duration_min=float(listing.get("total_duration_min") or 0.0),
+    logger.info(f"Session start successful: {session_id}")
+    return SessionStartResponse(
+        session_id=session_id,
+        status="active",
         reserve_amount=reserve_amount,
+        transaction_id=lock_tx.finternet_tx_id,
     )
 
+
+def _create_session_escrow(payload: dict) -> str:
+    """Outbox handler: create the Finternet payment intent + escrow row for a session."""
+    session_id = payload["session_id"]
+    reserve_amount = float(payload["reserve_amount"])
     gw = get_finternet()
-    settle_tx = gw.settle(wallet_address=wallet_address, amount=final_charge)
-    refund_tx = gw.refund(wallet_address=wallet_address, amount=refund)
-
-    # Update session
-    updates = {
-        "status": "ended",
-        "end_time": end_dt.isoformat(),
-        "duration_min": round(duration_min, 2),
-        "completion_percentage": round(completion, 2),
-        "engagement_metrics": engagement,
-        "final_amount_charged": final_charge,
-        "refund_amount": refund,
-        "transaction_id": session.get("transaction_id") or settle_tx.finternet_tx_id,
-    }
-    sb.update("sessions", updates, match={"id": req.session_id})
+    payment_intent = gw.create_payment_intent(
+        amount=reserve_amount,
+        currency="USD",
+        description=f"Escrow for session {session_id} - {payload['listing_title']}",
+        metadata={
+            "releaseType": "MILESTONE_LOCKED",
+            "session_id": session_id,
+            "student_id": payload["student_id"],
+            "teacher_id": payload["teacher_id"],
+        },
+        # Same key on every redelivery of the event, so the gateway creates one intent
+        idempotency_key=payload["_event_id"],
+    )
+    logger.info(f"Payment intent response: {payment_intent}")
 
-    # Payments
-    sb.insert(
-        "payments",
+    # Derived from the outbox event so a redelivered event overwrites, not duplicates
+    escrow_id = f"escrow_{payload['_event_id'].removeprefix('ob_')}"
+    get_supabase().upsert(
+        "escrows",
         {
-            "id": f"pay_{uuid4().hex}",
-            "session_id": req.session_id,
-            "type": "settle",
-            "amount": final_charge,
-            "status": "success",
-            "finternet_tx_id": settle_tx.finternet_tx_id,
+            "id": escrow_id,
+            "session_id": session_id,
+            "finternet_intent_id": payment_intent.get("id", ""),
+            "total_amount": reserve_amount,
+            "locked_amount": reserve_amount,
+            "status": "active",
             "created_at": utc_now_iso(),
         },
     )
-    sb.insert(
+    logger.info(f"✅ Created escrow {escrow_id} for session {session_id}")
+    return escrow_id
+
+
+def _settle_session(payload: dict) -> None:
+    """Outbox handler: settle to teacher + refund student, then mark the pending payments."""
+    if get_settings().settlement_batching and payload.get("teacher_id"):
+        _refund_and_accrue(payload)
+        return
+
+    try:
+        settle_tx, refund_tx = get_finternet().settle_and_refund(
+            wallet_address=payload["wallet_address"],
+            settle_amount=float(payload["settle_amount"]),
+            refund_amount=float(payload["refund_amount"]),
+            idempotency_key=payload["_event_id"],
+        )
+    except SettlementError as e:
+        # The dispatcher retries the event with backoff; the per-side idempotency
+        # keys make the gateway replay the half that already went through
+        logger.error(f"Settlement failed for session {payload['session_id']}: {e}")
+        raise
+    get_supabase().write_batch(
+        [
+            {
+                "op": "update",
+                "table": "payments",
+                "id": payload["settle_payment_id"],
+                "set": {"status": "success", "finternet_tx_id": settle_tx.finternet_tx_id},
+            },
+            {
+                "op": "update",
+                "table": "payments",
+                "id": payload["refund_payment_id"],
+                "set": {"status": "success", "finternet_tx_id": refund_tx.finternet_tx_id},
+            },
+        ]
+    )
+    logger.info(f"✅ Settled session {payload['session_id']}")
+
+
+def _refund_and_accrue(payload: dict) -> None:
+    """
+    Settlement batching mode: refund the student now and accrue the teacher's
+    share; the settle payment is marked when the netted transfer is flushed.
+    """
+    refund_tx = get_finternet().refund(
+        wallet_address=payload["wallet_address"],
+        amount=float(payload["refund_amount"]),
+        idempotency_key=f"{payload['_event_id']}:refund",
+    )
+    # Without a teacher wallet the settle payment stays pending for startup recovery
+    accrue_settlement(payload)
+    get_supabase().update(
         "payments",
-        {
-            "id": f"pay_{uuid4().hex}",
-            "session_id": req.session_id,
-            "type": "refund",
-            "amount": refund,
-            "status": "success",
-            "finternet_tx_id": refund_tx.finternet_tx_id,
-            "created_at": utc_now_iso(),
-        },
+        {"status": "success", "finternet_tx_id": refund_tx.finternet_tx_id},
+        match={"id": payload["refund_payment_id"]},
     )
+    logger.info(f"✅ Refunded session {payload['session_id']}; settlement accrued")
 
-    return SessionEndBreakdown(
-        session_id=req.session_id,
-        listing_id=session["listing_id"],
-        teacher_id=session["teacher_id"],
-        student_id=session["student_id"],
-        start_time=start_dt,
-        end_time=end_dt,
-        duration_min=round(duration_min, 2),
-        completion_percentage=round(completion, 2),
-        reserve_amount=reserve_amount,
-        final_amount_charged=final_charge,
-        refund_amount=refund,
-        settle_transaction_id=settle_tx.finternet_tx_id,
-        refund_transaction_id=refund_tx.finternet_tx_id,
+
+get_outbox().register("session_escrow", _create_session_escrow)
+get_outbox().register("session_settlement", _settle_session)
+
+
+def _log_failure(message: str):
+    def _cb(fut: Future) -> None:
+        exc = fut.exception()
+        if exc is not None:
+            logger.warning(f"{message}: {exc}")
+    return _cb
+
+
+@router.post("/end", response_model=SessionEndBreakdown)
+def end(req: SessionEndRequest, idempotency_key: IdempotencyKey = None) -> SessionEndBreakdown:
+    """
+    Session end:
+    - Compute duration from start_time to now
+    - Compute completion percentage (from request or from chunk metrics)
+    - Compute final charged (capped by reserve) and refund
+    - Update session + create pending settle/refund payments rows
+    - Record settlement in the outbox; the dispatcher settles to teacher + refunds
+      student (mock) and marks the payments "success"
+
+    Send an `Idempotency-Key` header to make retries safe (no double settle/refund).
+    """
+    return get_idempotency().run(
+        "sessions.end",
+        f"session:{req.session_id}",
+        idempotency_key,
+        req.model_dump(),
+        lambda: _end(req),
+    )
+
+
+def _end(req: SessionEndRequest) -> SessionEndBreakdown:
+    session = get_supabase().maybe_single("sessions", "*", id=req.session_id)
+    if not session:
+        raise http_error(404, "Session not found", code="SESSION_NOT_FOUND")
+    return end_session(
+        session,
+        completion_percentage=req.completion_percentage,
+        engagement_metrics=req.engagement_metrics,
+    )
+
+
+@router.post("/{session_id}/heartbeat", response_model=SessionHeartbeatResponse)
+def heartbeat(session_id: str, req: SessionHeartbeatRequest) -> SessionHeartbeatResponse:
+    """
+    Lightweight engagement ingestion while a session is active.
+
+    Frontend sends small batched deltas every few seconds, e.g.
+      { "total_chunks": 120, "viewed_chunks": [14, 15, 16] }
+    Deltas are merged in memory and flushed to sessions.engagement_metrics periodically,
+    so /sessions/end can be sent without engagement_metrics.
+    """
+    agg = get_engagement()
+    if not agg.is_tracking(session_id):
+        # First heartbeat on this worker: validate once and resume from persisted state
+        sb = get_supabase()
+        session = sb.maybe_single("sessions", "id,status,engagement_metrics", id=session_id)
+        if not session:
+            raise http_error(404, "Session not found", code="SESSION_NOT_FOUND")
+        if session.get("status") != "active":
+            raise http_error(400, "Session is not active", code="SESSION_NOT_ACTIVE")
+        agg.seed(session_id, session.get("engagement_metrics"))
+
+    snapshot = agg.record(session_id, req.model_dump(exclude_none=True))
+    return SessionHeartbeatResponse(
+        session_id=session_id,
+        completion_percentage=round(compute_completion_percentage({}, snapshot), 2),
+        heartbeats=snapshot.get("heartbeats", 0),
     )
 
 
@@ -323,27 +408,39 @@ def session_videos(session_id: str) -> dict:
     """
     Return listing video URLs only while session is active.
 
+    Served from the in-memory active session registry; the DB is only read on a
+    registry miss (e.g. another worker started the session) or for the periodic
+    status revalidation.
+
     For MVP we reuse stored public URLs. A stricter version could
     switch to short-lived signed URLs using storage paths.
     """
+    registry = get_active_sessions()
+    entry = registry.get(session_id)
     sb = get_supabase()
-    session = sb.maybe_single("sessions", "*", id=session_id)
-    if not session:
-        raise http_error(404, "Session not found", code="SESSION_NOT_FOUND")
-    if session.get("status") != "active":
-        raise http_error(403, "Session is not active", code="SESSION_NOT_ACTIVE")
 
-    listing = sb.maybe_single("listings", "*", id=session["listing_id"])
-    if not listing:
-        raise http_error(404, "Listing not found", code="LISTING_NOT_FOUND")
+    if entry is not None and registry.needs_revalidation(entry):
+        row = sb.maybe_single("sessions", "id,status", id=session_id)
+        if not row or row.get("status") != "active":
+            registry.evict(session_id)
+            entry = None
+        else:
+            registry.mark_validated(session_id)
+
+    if entry is None:
+        session = sb.maybe_single("sessions", "*", id=session_id)
+        if not session:
+            raise http_error(404, "Session not found", code="SESSION_NOT_FOUND")
+        if session.get("status") != "active":
+            raise http_error(403, "Session is not active", code="SESSION_NOT_ACTIVE")
+
+        listing = sb.maybe_single("listings", "*", id=session["listing_id"])
+        if not listing:
+            raise http_error(404, "Listing not found", code="LISTING_NOT_FOUND")
+        entry = registry.register(session, listing)
 
-    video_urls = listing.get("video_urls") or []
-    if isinstance(video_urls, dict):
-        # tolerate bad data shape
-        video_urls = list(video_urls.values())
     return {
         "session_id": session_id,
-        "listing_id": session["listing_id"],
-        "video_urls": video_urls,
+        "listing_id": entry.listing_id,
+        "video_urls": entry.video_urls,
     }
-
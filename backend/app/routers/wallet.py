@@ -5,6 +5,7 @@ from fastapi import APIRouter
 from app.errors import http_error
 from app.schemas import WalletBalanceResponse, WalletConnectRequest, WalletConnectResponse
 from app.services.finternet import get_finternet
+from app.services.wallets import get_wallets
 from app.supabase_client import get_supabase
 
 router = APIRouter(prefix="/wallet", tags=["wallet"])
@@ -21,6 +22,7 @@ def connect(req: WalletConnectRequest) -> WalletConnectResponse:
     wallet_address, balance = gw.connect_wallet(user_id=req.user_id)
 
     sb.update("users", {"wallet_address": wallet_address}, match={"id": req.user_id})
+    get_wallets().set_balance(wallet_address, balance)
     return WalletConnectResponse(wallet_address=wallet_address, balance=balance)
 
 
@@ -36,8 +38,8 @@ def balance(user_id: str) -> WalletBalanceResponse:
         # Frontend can call /wallet/connect first.
         raise http_error(400, "Wallet not connected", code="WALLET_NOT_CONNECTED")
 
-    gw = get_finternet()
-    bal = gw.get_balance(wallet_address=wallet_address)
+    # Cached gateway balance minus reserves locked by active sessions
+    bal = get_wallets().available(wallet_address)
     return WalletBalanceResponse(
         user_id=user_id,
         wallet_address=wallet_address,
@@ -11,9 +11,11 @@ ListingType = Literal["single_video", "multi_video_course"]
 ListingStatus = Literal["draft", "published", "flagged"]
 SessionStatus = Literal["pending", "active", "ended", "cancelled"]
 PaymentType = Literal["lock", "settle", "refund"]
-PaymentStatus = Literal["pending", "success", "failed"]
+PaymentStatus = Literal["pending", "accrued", "settling", "success", "failed"]
 MilestoneStatus = Literal["pending", "proof_submitted", "completed", "failed"]
 EscrowStatus = Literal["active", "released", "failed"]
+AIStatus = Literal["pending", "ready", "failed"]
+ReviewScoringStatus = Literal["pending", "scoring", "scored", "failed"]
 
 
 class HealthResponse(BaseModel):
@@ -37,6 +39,7 @@ class ListingPublic(BaseModel):
     price_per_min: float
     tags: dict[str, Any] | None = None
     thumbnail_url: str | None = None
+    thumbnail_variants: dict[str, str] | None = None  # {"card": url, "detail": url}
     status: ListingStatus
     video_urls: list[str] | None = None
     reviews_rating: float | None = None  # Average rating from reviews
@@ -82,9 +85,26 @@ class SessionEndRequest(BaseModel):
     session_id: str
     # Frontend can send engagement data; backend computes final charge on end.
     completion_percentage: float | None = Field(default=None, ge=0.0, le=100.0)
+    # { "total_chunks": N, "viewed_chunks": [...] } or the compact
+    # { "total_chunks": N, "viewed_bitmap": "<base64 little-endian bitset>" } (see services/metering.py)
     engagement_metrics: dict[str, Any] | None = None
 
 
+class SessionHeartbeatRequest(BaseModel):
+    # Small delta since the previous heartbeat; chunk sets are unioned server-side.
+    total_chunks: int | None = Field(default=None, ge=1)
+    viewed_chunks: list[int] | None = Field(default=None, max_length=1000)
+    viewed_bitmap: str | None = Field(default=None, max_length=20000)
+    rewatched_chunks: list[int] | None = Field(default=None, max_length=1000)
+    skipped_chunks: list[int] | None = Field(default=None, max_length=1000)
+
+
+class SessionHeartbeatResponse(BaseModel):
+    session_id: str
+    completion_percentage: float
+    heartbeats: int
+
+
 class SessionEndBreakdown(BaseModel):
     session_id: str
     listing_id: str
@@ -97,8 +117,11 @@ class SessionEndBreakdown(BaseModel):
     reserve_amount: float
     final_amount_charged: float
     refund_amount: float
-    settle_transaction_id: str
-    refund_transaction_id: str
+    # Settlement is delivered asynchronously via the outbox; tx ids are set on the
+    # payments rows once it succeeds (see GET /payments/by_session).
+    settlement_status: PaymentStatus = "pending"
+    settle_transaction_id: str | None = None
+    refund_transaction_id: str | None = None
 
 
 class ReviewSubmitRequest(BaseModel):
@@ -113,12 +136,28 @@ class ReviewSubmitResponse(BaseModel):
     credibility_score: float = Field(..., ge=0.0, le=1.0)
     bonus_percentage: int = Field(..., ge=0, le=15)
     applied_bonus_amount: float
+    # "pending": scores are provisional until background scoring finishes (poll GET /reviews/{review_id})
+    scoring_status: ReviewScoringStatus = "scored"
+
+
+class ReviewResponse(BaseModel):
+    id: str
+    session_id: str
+    student_id: str
+    rating: int
+    review_text: str
+    credibility_score: float
+    bonus_percentage: int
+    scoring_status: ReviewScoringStatus = "scored"
+    created_at: datetime | None = None
 
 
 class CreatorUploadResponse(BaseModel):
     listing_id: str
     uploaded_url: str
     storage_path: str
+    ai_status: AIStatus = "ready"  # "pending" while transcription/outcomes are generated
+    job_id: str | None = None  # Poll GET /creator/jobs/{job_id}
 
 
 class CourseDetailResponse(BaseModel):
@@ -132,11 +171,13 @@ class CourseDetailResponse(BaseModel):
     teacher_name: str | None = None  # From users.name
     video_url: str | list[str]  # Single URL or array for multiple videos
     thumbnail: str
+    thumbnail_variants: dict[str, str] | None = None  # Downscaled {"card", "detail"} URLs
     reviews_rating: float | None  # Average rating from reviews table
     course_outcomes: list[str] | None  # AI-generated learning outcomes
     transcription: str | None  # Transcription text content or URL
+    ai_status: AIStatus | None = None  # "pending" until background AI generation finishes
     base_price: float | None = None  # Base price of the course
-    total_duration_min: int | None = None  # Total duration in minutes
+    total_duration_min: float | None = None  # Total duration in minutes (fractional when probed)
     price_per_min: float | None = None  # Price per minute
 
 
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.config import get_settings
+
+
+@dataclass
+class ActiveSession:
+    session_id: str
+    listing_id: str
+    student_id: str
+    teacher_id: str
+    video_urls: list[Any]
+    expires_at: float = float("inf")
+    revalidate_at: float = field(default_factory=time.monotonic)
+
+
+class ActiveSessionRegistry:
+    """
+    In-memory registry of active sessions and their listing's video URLs.
+
+    Populated by /sessions/start (or lazily on the first DB lookup) and evicted by
+    /sessions/end, so `GET /sessions/{id}/videos` is a dictionary lookup.
+
+    The registry is per process. With several workers, a session ended on another
+    worker is noticed on the next revalidation (every `revalidate_s`, a single
+    status lookup) rather than immediately; entries also expire after `ttl_s`.
+    """
+
+    def __init__(self, *, ttl_s: float = 4 * 3600.0, revalidate_s: float = 60.0) -> None:
+        self.ttl_s = ttl_s
+        self.revalidate_s = revalidate_s
+        self._sessions: dict[str, ActiveSession] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def video_urls_for(listing: dict[str, Any]) -> list[Any]:
+        video_urls = listing.get("video_urls") or []
+        if isinstance(video_urls, dict):
+            # tolerate bad data shape
+            video_urls = list(video_urls.values())
+        return video_urls
+
+    def register(self, session: dict[str, Any], listing: dict[str, Any]) -> ActiveSession:
+        now = time.monotonic()
+        entry = ActiveSession(
+            session_id=session["id"],
+            listing_id=session["listing_id"],
+            student_id=session["student_id"],
+            teacher_id=session["teacher_id"],
+            video_urls=self.video_urls_for(listing),
+            expires_at=now + self.ttl_s,
+            revalidate_at=now + self.revalidate_s,
+        )
+        with self._lock:
+            self._sessions[entry.session_id] = entry
+            if len(self._sessions) % 256 == 0:
+                self._purge_locked(now)
+        return entry
+
+    def get(self, session_id: str) -> ActiveSession | None:
+        """Cached entry, or None if unknown/expired. Check `needs_revalidation` before trusting it."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry.expires_at <= now:
+                del self._sessions[session_id]
+                return None
+            return entry
+
+    def needs_revalidation(self, entry: ActiveSession) -> bool:
+        return entry.revalidate_at <= time.monotonic()
+
+    def mark_validated(self, session_id: str) -> None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry.revalidate_at = time.monotonic() + self.revalidate_s
+
+    def evict(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _purge_locked(self, now: float) -> None:
+        expired = [sid for sid, e in self._sessions.items() if e.expires_at <= now]
+        for sid in expired:
+            del self._sessions[sid]
+
+
+_registry: ActiveSessionRegistry | None = None
+
+
+def get_active_sessions() -> ActiveSessionRegistry:
+    global _registry
+    if _registry is None:
+        s = get_settings()
+        _registry = ActiveSessionRegistry(
+            ttl_s=s.active_session_ttl_s,
+            revalidate_s=s.active_session_revalidate_s,
+        )
+    return _registry
@@ -0,0 +1,253 @@
+"""
+Columnar (NumPy) version of the metering formulas in `app.services.metering`.
+
+Used for nightly reconciliation and "what-if" repricing over many sessions at
+once. Results are bit-identical to the scalar functions:
+- min()/max() are mirrored with np.where so ties and signed zeros resolve the
+  same way Python's builtins do (first argument wins unless strictly beaten).
+- Arithmetic is applied in the same order, so every IEEE-754 intermediate matches.
+- round(x, 2) is emulated with np.round and the few values whose x*100 lands
+  next to a .5 tie are re-rounded with Python's correctly-rounded round().
+
+Run a reconciliation against the database:
+    python -m app.services.batch_metering [--tolerance 0.01] [--limit N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+from app.config import get_settings
+from app.services.metering import engagement_bits
+from app.supabase_client import get_supabase
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = 1000
+# |frac(x*100) - 0.5| below this may round differently than Python's round(x, 2)
+_TIE_EPS = 1e-6
+
+
+def _py_min(a: np.ndarray, b: np.ndarray | float) -> np.ndarray:
+    return np.where(b < a, b, a)
+
+
+def _py_max(a: np.ndarray | float, b: np.ndarray) -> np.ndarray:
+    return np.where(b > a, b, a)
+
+
+def round2(x: np.ndarray) -> np.ndarray:
+    """Vectorized equivalent of Python's round(x, 2) (half-even on the exact binary value)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.round(x, 2)
+    scaled = x * 100.0
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < _TIE_EPS
+    for i in np.flatnonzero(near_tie & np.isfinite(x)):
+        out[i] = round(float(x[i]), 2)
+    return out
+
+
+def compute_charges_batch(
+    *,
+    duration_min: Iterable[float] | np.ndarray,
+    completion_percentage: Iterable[float] | np.ndarray,
+    price_per_min: Iterable[float] | np.ndarray | float,
+    total_duration_min: Iterable[float] | np.ndarray | float,
+    reserve_amount: Iterable[float] | np.ndarray | float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batch `compute_charge_amount`: returns (final_charge, refund) arrays.
+
+    Arguments broadcast, so a scalar price/reserve can be used for what-if runs.
+    """
+    duration = np.asarray(duration_min, dtype=np.float64)
+    completion = np.asarray(completion_percentage, dtype=np.float64)
+    price = np.asarray(price_per_min, dtype=np.float64)
+    total = np.asarray(total_duration_min, dtype=np.float64)
+    reserve = np.asarray(reserve_amount, dtype=np.float64)
+
+    watched = _py_max(0.0, _py_min(duration, total))
+    engagement_factor = _py_max(0.0, _py_min(1.0, completion / 100.0))
+    effective_minutes = watched * (0.5 + 0.5 * engagement_factor)
+
+    computed = _py_max(0.0, effective_minutes * price)
+    final_charge = _py_min(reserve, computed)
+    refund = _py_max(0.0, reserve - final_charge)
+    return round2(final_charge), round2(refund)
+
+
+def compute_completion_batch(
+    *,
+    total_chunks: Iterable[int] | np.ndarray,
+    viewed_counts: Iterable[int] | np.ndarray,
+) -> np.ndarray:
+    """
+    Batch `compute_completion_percentage` from per-session unique viewed counts.
+
+    Rows without a positive `total_chunks` get 0.0, like the scalar fallback.
+    """
+    total = np.asarray(total_chunks, dtype=np.float64)
+    viewed = np.asarray(viewed_counts, dtype=np.float64)
+    valid = total > 0
+    pct = np.divide(viewed, total, out=np.zeros_like(total), where=valid) * 100.0
+    return np.where(valid, _py_max(0.0, _py_min(100.0, pct)), 0.0)
+
+
+def engagement_columns(engagements: Iterable[dict[str, Any] | None]) -> tuple[np.ndarray, np.ndarray]:
+    """(total_chunks, viewed_counts) columns for `compute_completion_batch`."""
+    totals: list[int] = []
+    counts: list[int] = []
+    for e in engagements:
+        total = (e or {}).get("total_chunks")
+        has_viewed = bool(e) and (isinstance(e.get("viewed_chunks"), list) or "viewed_bitmap" in e)
+        if isinstance(total, int) and total > 0 and has_viewed:
+            totals.append(total)
+            counts.append(engagement_bits(e, "viewed").bit_count())
+        else:
+            totals.append(0)
+            counts.append(0)
+    return np.asarray(totals, dtype=np.int64), np.asarray(counts, dtype=np.int64)
+
+
+@dataclass
+class ReconciliationReport:
+    checked: int = 0
+    mismatched: int = 0
+    skipped: int = 0
+    total_charged: float = 0.0
+    total_expected: float = 0.0
+    mismatches: list[dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "mismatched": self.mismatched,
+            "skipped": self.skipped,
+            "total_charged": round(self.total_charged, 2),
+            "total_expected": round(self.total_expected, 2),
+            "mismatches": self.mismatches,
+        }
+
+
+def _fetch_ended_sessions(limit: int | None) -> list[dict[str, Any]]:
+    sb = get_supabase()
+    rows: list[dict[str, Any]] = []
+    offset = 0
+    while limit is None or len(rows) < limit:
+        page = (
+            sb.client.table("sessions")
+            .select(
+                "id,listing_id,duration_min,completion_percentage,final_amount_charged,refund_amount"
+            )
+            .eq("status", "ended")
+            .order("created_at", desc=False)
+            .range(offset, offset + _PAGE_SIZE - 1)
+            .execute()
+            .data
+            or []
+        )
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            break
+        offset += _PAGE_SIZE
+    return rows[:limit] if limit is not None else rows
+
+
+def _fetch_listings(listing_ids: list[str]) -> dict[str, dict[str, Any]]:
+    sb = get_supabase()
+    out: dict[str, dict[str, Any]] = {}
+    for i in range(0, len(listing_ids), _PAGE_SIZE):
+        chunk = listing_ids[i : i + _PAGE_SIZE]
+        rows = (
+            sb.client.table("listings")
+            .select("id,price_per_min,total_duration_min,reserve_amount")
+            .in_("id", chunk)
+            .execute()
+            .data
+            or []
+        )
+        out.update({r["id"]: r for r in rows})
+    return out
+
+
+def reconcile_sessions(
+    *,
+    tolerance: float = 0.01,
+    limit: int | None = None,
+    price_overrides: dict[str, float] | None = None,
+) -> ReconciliationReport:
+    """
+    Recompute charges for ended sessions and diff against `final_amount_charged`.
+
+    Uses the stored (2dp) duration/completion and current listing pricing, so a
+    difference within `tolerance` is expected rounding; larger ones are reported.
+    `price_overrides` ({listing_id: price_per_min}) turns this into a what-if run.
+    """
+    sessions = _fetch_ended_sessions(limit)
+    listings = _fetch_listings(sorted({s["listing_id"] for s in sessions if s.get("listing_id")}))
+    default_reserve = get_settings().default_reserve_amount
+    overrides = price_overrides or {}
+
+    report = ReconciliationReport()
+    rows = []
+    for s in sessions:
+        listing = listings.get(s.get("listing_id"))
+        if not listing or s.get("final_amount_charged") is None or s.get("duration_min") is None:
+            report.skipped += 1
+            continue
+        rows.append((s, listing))
+    if not rows:
+        return report
+
+    sessions_col = [s for s, _ in rows]
+    listings_col = [lst for _, lst in rows]
+    expected_charge, expected_refund = compute_charges_batch(
+        duration_min=[float(s["duration_min"]) for s in sessions_col],
+        completion_percentage=[float(s.get("completion_percentage") or 0.0) for s in sessions_col],
+        price_per_min=[
+            float(overrides.get(lst["id"], lst.get("price_per_min") or 0.0)) for lst in listings_col
+        ],
+        total_duration_min=[float(lst.get("total_duration_min") or 0.0) for lst in listings_col],
+        reserve_amount=[float(lst.get("reserve_amount") or default_reserve) for lst in listings_col],
+    )
+    charged = np.asarray([float(s["final_amount_charged"]) for s in sessions_col])
+    diff = expected_charge - charged
+
+    report.checked = len(rows)
+    report.total_charged = float(charged.sum())
+    report.total_expected = float(expected_charge.sum())
+    for i in np.flatnonzero(np.abs(diff) > tolerance):
+        s = sessions_col[i]
+        report.mismatches.append(
+            {
+                "session_id": s["id"],
+                "listing_id": s["listing_id"],
+                "final_amount_charged": float(charged[i]),
+                "expected_charge": float(expected_charge[i]),
+                "expected_refund": float(expected_refund[i]),
+                "diff": round(float(diff[i]), 2),
+            }
+        )
+    report.mismatched = len(report.mismatches)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconcile session charges against metering")
+    parser.add_argument("--tolerance", type=float, default=0.01)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    report = reconcile_sessions(tolerance=args.tolerance, limit=args.limit)
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from app.config import get_settings
+from app.services.ai import get_ai
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingReview:
+    review: dict[str, Any]
+    future: Future
+
+
+class CredibilityBatcher:
+    """
+    Micro-batches review credibility scoring.
+
+    `submit` enqueues a review and returns a Future right away, so callers
+    (background scoring jobs) don't hold a thread while the batch collects.
+    A collector thread waits up to `window_s` after the first pending review
+    (or until `max_size` are queued) and scores the batch with a single chat
+    completion (`AIService.score_reviews_credibility`). Reviews missing from
+    the model's answer, or a whole batch whose call fails, are scored one by
+    one with `score_review_credibility`.
+    """
+
+    def __init__(self, *, window_s: float = 0.25, max_size: int = 16, max_inflight: int = 4) -> None:
+        self.window_s = window_s
+        self.max_size = max_size
+        self._queue: list[_PendingReview] = []
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        # Several batches can be in flight while the next one collects
+        self._pool = ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="credibility-batch")
+
+    def submit(
+        self,
+        *,
+        rating: int,
+        review_text: str,
+        engagement_metrics: dict[str, Any] | None,
+        completion_percentage: float,
+        duration_min: float,
+    ) -> Future:
+        """
+        Queue a review; the Future resolves to `AIService.score_review_credibility`'s
+        (credibility, bonus_percentage), or to its exception.
+        """
+        pending = _PendingReview(
+            review={
+                "rating": rating,
+                "review_text": review_text,
+                "engagement_metrics": engagement_metrics,
+                "completion_percentage": completion_percentage,
+                "duration_min": duration_min,
+            },
+            future=Future(),
+        )
+        with self._cond:
+            self._queue.append(pending)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._collect, name="credibility-collector", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return pending.future
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window_s
+                while len(self._queue) < self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._queue[: self.max_size]
+                del self._queue[: self.max_size]
+            self._pool.submit(self._score_batch, batch)
+
+    def _score_batch(self, batch: list[_PendingReview]) -> None:
+        ai = get_ai()
+        scores: list[float | None] = [None] * len(batch)
+        if len(batch) > 1:
+            try:
+                scores = ai.score_reviews_credibility([p.review for p in batch])
+            except Exception as e:
+                logger.warning(f"Batched credibility scoring of {len(batch)} reviews failed, scoring singly: {e}")
+
+        for pending, score in zip(batch, scores):
+            try:
+                if score is None:
+                    result = ai.score_review_credibility(**pending.review)
+                else:
+                    result = (score, ai.bonus_for(pending.review["rating"], score))
+            except Exception as e:
+                pending.future.set_exception(e)
+                continue
+            pending.future.set_result(result)
+
+
+_batcher: CredibilityBatcher | None = None
+_batcher_lock = threading.Lock()
+
+
+def get_credibility_batcher() -> CredibilityBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            s = get_settings()
+            _batcher = CredibilityBatcher(
+                window_s=s.credibility_batch_window_s,
+                max_size=s.credibility_batch_max_size,
+            )
+        return _batcher
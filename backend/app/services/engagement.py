@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.config import get_settings
+from app.services.metering import (
+    CHUNK_SETS,
+    compact_engagement,
+    encode_chunk_bitmap,
+    engagement_bits,
+)
+from app.supabase_client import get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _LiveEngagement:
+    total_chunks: int | None = None
+    bits: dict[str, int] = field(default_factory=lambda: {name: 0 for name in CHUNK_SETS})
+    extra: dict[str, Any] = field(default_factory=dict)
+    heartbeats: int = 0
+    last_seen: float = field(default_factory=time.monotonic)
+    last_seen_at: str | None = None
+    dirty: bool = False
+
+    def snapshot(self) -> dict[str, Any]:
+        out = dict(self.extra)
+        if self.total_chunks is not None:
+            out["total_chunks"] = self.total_chunks
+        for name, bits in self.bits.items():
+            if bits:
+                out[f"{name}_bitmap"] = encode_chunk_bitmap(bits)
+        out["heartbeats"] = self.heartbeats
+        if self.last_seen_at:
+            out["last_heartbeat_at"] = self.last_seen_at
+        return out
+
+
+class EngagementAggregator:
+    """
+    In-memory aggregation of heartbeat chunk-view deltas per active session.
+
+    Heartbeats only OR small bitsets into memory; a background flusher writes the
+    merged state to `sessions.engagement_metrics` every `flush_interval_s`, so a
+    crashed client loses at most one interval of metering data and /sessions/end
+    no longer needs to carry the whole history.
+    """
+
+    def __init__(self, *, flush_interval_s: float = 15.0, idle_ttl_s: float = 900.0) -> None:
+        self.flush_interval_s = flush_interval_s
+        self.idle_ttl_s = idle_ttl_s
+        self._live: dict[str, _LiveEngagement] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def is_tracking(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._live
+
+    def seed(self, session_id: str, stored: dict[str, Any] | None) -> None:
+        """Start tracking a session from its persisted engagement (no-op if already tracked)."""
+        with self._lock:
+            if session_id in self._live:
+                return
+            stored = stored or {}
+            live = _LiveEngagement()
+            self._apply(live, stored)
+            live.heartbeats = int(stored.get("heartbeats") or 0)
+            live.last_seen_at = stored.get("last_heartbeat_at")
+            live.dirty = False
+            self._live[session_id] = live
+
+    def record(self, session_id: str, delta: dict[str, Any]) -> dict[str, Any]:
+        """Merge one heartbeat delta; returns the current compact snapshot."""
+        with self._lock:
+            live = self._live.setdefault(session_id, _LiveEngagement())
+            self._apply(live, delta)
+            live.heartbeats += 1
+            live.last_seen = time.monotonic()
+            live.last_seen_at = utc_now_iso()
+            return live.snapshot()
+
+    def snapshot(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            live = self._live.get(session_id)
+            return live.snapshot() if live else None
+
+    def pop(self, session_id: str) -> dict[str, Any] | None:
+        """Stop tracking a session and return its final snapshot (used by /sessions/end)."""
+        with self._lock:
+            live = self._live.pop(session_id, None)
+            return live.snapshot() if live else None
+
+    def flush(self) -> int:
+        """Persist dirty sessions and drop idle ones. Returns number of sessions written."""
+        now = time.monotonic()
+        with self._lock:
+            dirty = [(sid, live.snapshot()) for sid, live in self._live.items() if live.dirty]
+            for live in self._live.values():
+                live.dirty = False
+        sb = get_supabase()
+        written = 0
+        for sid, snap in dirty:
+            try:
+                # Only active sessions: never overwrite the final state written by /sessions/end
+                sb.update("sessions", {"engagement_metrics": snap}, match={"id": sid, "status": "active"})
+                written += 1
+            except Exception as e:
+                logger.warning(f"Engagement flush failed for {sid}: {e}")
+                with self._lock:
+                    if sid in self._live:
+                        self._live[sid].dirty = True
+        with self._lock:
+            idle = [
+                sid
+                for sid, live in self._live.items()
+                if not live.dirty and now - live.last_seen > self.idle_ttl_s
+            ]
+            for sid in idle:
+                del self._live[sid]
+        return written
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="engagement-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval_s)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            try:
+                self.flush()
+            except Exception as e:  # noqa: BLE001 - keep the flusher alive
+                logger.error(f"Engagement flusher error: {e}")
+
+    @staticmethod
+    def _apply(live: _LiveEngagement, delta: dict[str, Any]) -> None:
+        compact = compact_engagement(delta)
+        total = compact.pop("total_chunks", None)
+        if isinstance(total, int) and total > 0:
+            live.total_chunks = total
+        for name in CHUNK_SETS:
+            compact.pop(f"{name}_bitmap", None)
+            live.bits[name] |= engagement_bits(delta, name)
+        compact.pop("heartbeats", None)
+        compact.pop("last_heartbeat_at", None)
+        live.extra.update(compact)
+        live.dirty = True
+
+
+_agg: EngagementAggregator | None = None
+
+
+def get_engagement() -> EngagementAggregator:
+    global _agg
+    if _agg is None:
+        s = get_settings()
+        _agg = EngagementAggregator(
+            flush_interval_s=s.engagement_flush_interval_s,
+            idle_ttl_s=s.engagement_idle_ttl_s,
+        )
+    return _agg
@@ -2,11 +2,19 @@ from __future__ import annotations
 
 import logging
 import random
+import threading
 import time
-from dataclasses import dataclass
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Any
 from uuid import uuid4
 
+from app.config import get_settings
+
+DEFAULT_FINTERNET_BASE = "https://api.fmm.finternetlab.io"
+# API Key for Finternet Hackathon (used when FINTERNET_KEY is not set)
+DEFAULT_FINTERNET_KEY = "sk_hackathon_7ac6f3dc218f73cb343d3be7296dac28"
 
 logger = logging.getLogger(__name__)
 
@@ -17,17 +25,78 @@ class FinternetTx:
     status: str = "success"
 
 
+class SettlementError(RuntimeError):
+    """Settle/refund pair failed; a half that succeeded stays applied."""
+
+
 class FinternetGateway:
     """
-    Mocked Finternet payment gateway.
+    Finternet payment gateway.
+
+    mode="mock" (default): wallet/lock/settle/refund/escrow/milestone calls are
+    local mocks; only payment intents call `{base_url}/api/v1/payment-intents`,
+    falling back to a mock intent on error.
+
+    mode="http": every call goes to `base_url` over a pooled httpx client, e.g.
+    the local stand-in (`finternet_standin.py`) for offline load tests. Errors
+    are raised (after retries) instead of being mocked.
 
-    Swap these methods to real `httpx` calls once sandbox docs are available.
     Keep the interface stable so the rest of the code doesn't change.
     """
 
-    def __init__(self, max_retries: int = 3, retry_delay: float = 1.0):
+    def __init__(
+        self,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        *,
+        base_url: str | None = None,
+        api_key: str | None = None,
+        mode: str = "mock",
+        timeout_s: float = 30.0,
+    ):
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.base_url = (base_url or DEFAULT_FINTERNET_BASE).rstrip("/")
+        self.api_key = api_key or DEFAULT_FINTERNET_KEY
+        self.http = mode == "http"
+        self.timeout_s = timeout_s
+        self._client = None
+        self._client_lock = threading.Lock()
+        # Independent gateway calls (e.g. settle + refund) are issued concurrently
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="finternet")
+
+    def _http_client(self):
+        import httpx
+
+        with self._client_lock:
+            if self._client is None:
+                self._client = httpx.Client(
+                    base_url=self.base_url,
+                    timeout=self.timeout_s,
+                    headers={"Content-Type": "application/json", "x-api-key": self.api_key},
+                    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                )
+            return self._client
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        payload: dict[str, Any] | None = None,
+        *,
+        idempotency_key: str | None = None,
+    ) -> dict:
+        """One HTTP call (http mode). Non-2xx responses raise."""
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        response = self._http_client().request(method, path, json=payload, headers=headers)
+        if response.status_code >= 400:
+            raise RuntimeError(f"Finternet {method} {path} returned {response.status_code}: {response.text}")
+        return response.json()
+
+    def _http_tx(self, path: str, payload: dict[str, Any], idempotency_key: str | None = None) -> FinternetTx:
+        # Retries (ours and the caller's) reuse the key, so the gateway applies the transfer once
+        data = self._retry_wrapper(self._request, "POST", path, payload, idempotency_key=idempotency_key)
+        return FinternetTx(finternet_tx_id=data["id"], status=data.get("status", "success"))
 
     def _retry_wrapper(self, func, *args, **kwargs) -> Any:
         """Retry wrapper with exponential backoff."""
@@ -44,6 +113,10 @@ class FinternetGateway:
 
     def connect_wallet(self, *, user_id: str) -> tuple[str, float]:
         """TODO: Replace with wallet connection flow (OAuth / signature / etc.)"""
+        if self.http:
+            data = self._retry_wrapper(self._request, "POST", "/api/v1/wallets", {"user_id": user_id})
+            return data["wallet_address"], float(data["balance"])
+
         def _connect():
             wallet_address = f"0x{random.getrandbits(160):040x}"
             balance = float(50 + random.randint(0, 200))
@@ -56,6 +129,10 @@ class FinternetGateway:
         Get wallet balance.
         Returns a mock balance for testing (high amount to pass validation).
         """
+        if self.http:
+            data = self._retry_wrapper(self._request, "GET", f"/api/v1/wallets/{wallet_address}/balance")
+            return float(data["balance"])
+
         def _get_balance():
             # Mock balance for testing - return high value (1000-5000) to pass validation
             balance = float(1000 + random.randint(0, 4000))
@@ -65,43 +142,128 @@ class FinternetGateway:
 
     def lock_funds(self, *, wallet_address: str, amount: float) -> FinternetTx:
         """TODO: Replace with Finternet "lock/reserve" API."""
+        if self.http:
+            return self._http_tx("/api/v1/locks", {"wallet_address": wallet_address, "amount": amount})
+
         def _lock():
             tx_id = f"ft_lock_{random.randint(100000, 999999)}"
             logger.info(f"Locked {amount} for wallet {wallet_address}: {tx_id}")
             return FinternetTx(finternet_tx_id=tx_id)
         return self._retry_wrapper(_lock)
 
-    def settle(self, *, wallet_address: str, amount: float) -> FinternetTx:
+    def settle(self, *, wallet_address: str, amount: float, idempotency_key: str | None = None) -> FinternetTx:
         """TODO: Replace with Finternet settlement API."""
+        if self.http:
+            return self._http_tx(
+                "/api/v1/settlements", {"wallet_address": wallet_address, "amount": amount}, idempotency_key
+            )
+
         def _settle():
             tx_id = f"ft_settle_{random.randint(100000, 999999)}"
             logger.info(f"Settled {amount} to wallet {wallet_address}: {tx_id}")
             return FinternetTx(finternet_tx_id=tx_id)
         return self._retry_wrapper(_settle)
 
-    def refund(self, *, wallet_address: str, amount: float) -> FinternetTx:
+    def payout(self, *, payee_wallet: str, amount: float, idempotency_key: str | None = None) -> FinternetTx:
+        """
+        Transfer to a teacher's own wallet (netted settlements).
+
+        Unlike `settle`, whose `wallet_address` is the student wallet whose
+        locked funds are released, `payee_wallet` is the receiving wallet.
+        """
+        if self.http:
+            return self._http_tx(
+                "/api/v1/payouts", {"payee_wallet": payee_wallet, "amount": amount}, idempotency_key
+            )
+
+        def _payout():
+            tx_id = f"ft_payout_{random.randint(100000, 999999)}"
+            logger.info(f"Paid out {amount} to wallet {payee_wallet}: {tx_id}")
+            return FinternetTx(finternet_tx_id=tx_id)
+        return self._retry_wrapper(_payout)
+
+    def refund(self, *, wallet_address: str, amount: float, idempotency_key: str | None = None) -> FinternetTx:
         """TODO: Replace with Finternet refund API."""
+        if self.http:
+            return self._http_tx(
+                "/api/v1/refunds", {"wallet_address": wallet_address, "amount": amount}, idempotency_key
+            )
+
         def _refund():
             tx_id = f"ft_refund_{random.randint(100000, 999999)}"
             logger.info(f"Refunded {amount} to wallet {wallet_address}: {tx_id}")
             return FinternetTx(finternet_tx_id=tx_id)
         return self._retry_wrapper(_refund)
 
+    def reverse(self, *, wallet_address: str, tx: FinternetTx, amount: float) -> FinternetTx:
+        """
+        Compensating transaction that undoes a completed settle/refund.
+        TODO: Replace with Finternet reversal API.
+        """
+        if self.http:
+            return self._http_tx(
+                "/api/v1/reversals",
+                {"wallet_address": wallet_address, "tx_id": tx.finternet_tx_id, "amount": amount},
+            )
+
+        def _reverse():
+            tx_id = f"ft_reverse_{random.randint(100000, 999999)}"
+            logger.info(f"Reversed {tx.finternet_tx_id} ({amount}) for wallet {wallet_address}: {tx_id}")
+            return FinternetTx(finternet_tx_id=tx_id)
+        return self._retry_wrapper(_reverse)
+
+    def settle_and_refund(
+        self,
+        *,
+        wallet_address: str,
+        settle_amount: float,
+        refund_amount: float,
+        idempotency_key: str | None = None,
+    ) -> tuple[FinternetTx, FinternetTx]:
+        """
+        Settle to teacher and refund the student concurrently.
+
+        Both calls keep their own retries. If one side still fails,
+        SettlementError is raised and the side that succeeded stays applied;
+        the caller retries the whole pair with the same `idempotency_key`
+        (suffixed per side, ":settle"/":refund"), so the gateway replays the
+        applied side and only the failed side is attempted again.
+        """
+        settle_f = self._pool.submit(
+            self.settle,
+            wallet_address=wallet_address,
+            amount=settle_amount,
+            idempotency_key=f"{idempotency_key}:settle" if idempotency_key else None,
+        )
+        refund_f = self._pool.submit(
+            self.refund,
+            wallet_address=wallet_address,
+            amount=refund_amount,
+            idempotency_key=f"{idempotency_key}:refund" if idempotency_key else None,
+        )
+        settle_err = settle_f.exception()
+        refund_err = refund_f.exception()
+        if settle_err is None and refund_err is None:
+            return settle_f.result(), refund_f.result()
+
+        failed = [name for name, err in (("settle", settle_err), ("refund", refund_err)) if err]
+        raise SettlementError(
+            f"{' and '.join(failed)} failed: {settle_err or refund_err}"
+        ) from (settle_err or refund_err)
+
     def create_payment_intent(self, *, amount: float, currency: str = "USD", 
                              description: str | None = None, 
-                             metadata: dict[str, Any] | None = None) -> dict:
+                             metadata: dict[str, Any] | None = None,
+                             idempotency_key: str | None = None) -> dict:
         """
-        Create a payment intent by calling the real Finternet API.
-        Sends request to: https://api.fmm.finternetlab.io/api/v1/payment-intents
+        Create a payment intent by calling the Finternet API.
+        Sends request to: {FINTERNET_BASE}/api/v1/payment-intents
+        (default https://api.fmm.finternetlab.io)
+        A repeated `idempotency_key` returns the intent created the first time.
         
         Returns: { id, status, amount, currency, paymentUrl, contractAddress, chainId, ... }
         """
         def _create():
-            import httpx
-            
-            # API Key for Finternet Hackathon
-            API_KEY = "sk_hackathon_7ac6f3dc218f73cb343d3be7296dac28"
-            
             # Prepare the real Finternet API request
             payload = {
                 "amount": str(amount),
@@ -116,39 +278,40 @@ class FinternetGateway:
             print(f"\n🔵 CREATING PAYMENT INTENT")
             print(f"Payload: {payload}")
             
+            if self.http:
+                return self._request(
+                    "POST", "/api/v1/payment-intents", payload, idempotency_key=idempotency_key
+                )
+
             try:
-                print(f"Calling Finternet API at: https://api.fmm.finternetlab.io/api/v1/payment-intents")
-                # Call the real Finternet API with authentication
-                with httpx.Client(timeout=30.0) as client:
-                    response = client.post(
-                        "https://api.fmm.finternetlab.io/api/v1/payment-intents",
-                        json=payload,
-                        headers={
-                            "Content-Type": "application/json",
-                            "x-api-key": API_KEY
-                        }
-                    )
-                    
-                    logger.info(f"Finternet API response status: {response.status_code}")
-                    logger.info(f"Finternet API response: {response.text}")
-                    print(f"\n{'='*60}")
-                    print(f"🔹 FINTERNET API RESPONSE OBJECT")
-                    print(f"{'='*60}")
-                    print(f"Status: {response.status_code}")
-                    print(f"Headers: {dict(response.headers)}")
-                    print(f"Raw Text: {response.text}")
-                    if response.status_code in (200, 201):
-                        print(f"JSON: {response.json()}")
-                    print(f"{'='*60}\n")
-                    
-                    if response.status_code == 201 or response.status_code == 200:
-                        result = response.json()
-                        logger.info(f"✅ Created payment intent with Finternet API: {result.get('id', 'unknown')}")
-                        logger.info(f"   Payment URL: {result.get('paymentUrl', 'N/A')}")
-                        return result
-                    else:
-                        logger.error(f"❌ Finternet API error: {response.status_code} - {response.text}")
-                        raise Exception(f"Finternet API returned {response.status_code}: {response.text}")
+                print(f"Calling Finternet API at: {self.base_url}/api/v1/payment-intents")
+                # Call the Finternet API with authentication (pooled client)
+                response = self._http_client().post(
+                    "/api/v1/payment-intents",
+                    json=payload,
+                    headers={"Idempotency-Key": idempotency_key} if idempotency_key else None,
+                )
+
+                logger.info(f"Finternet API response status: {response.status_code}")
+                logger.info(f"Finternet API response: {response.text}")
+                print(f"\n{'='*60}")
+                print(f"🔹 FINTERNET API RESPONSE OBJECT")
+                print(f"{'='*60}")
+                print(f"Status: {response.status_code}")
+                print(f"Headers: {dict(response.headers)}")
+                print(f"Raw Text: {response.text}")
+                if response.status_code in (200, 201):
+                    print(f"JSON: {response.json()}")
+                print(f"{'='*60}\n")
+                
+                if response.status_code == 201 or response.status_code == 200:
+                    result = response.json()
+                    logger.info(f"✅ Created payment intent with Finternet API: {result.get('id', 'unknown')}")
+                    logger.info(f"   Payment URL: {result.get('paymentUrl', 'N/A')}")
+                    return result
+                else:
+                    logger.error(f"❌ Finternet API error: {response.status_code} - {response.text}")
+                    raise Exception(f"Finternet API returned {response.status_code}: {response.text}")
             except Exception as e:
                 print(f"\n❌ EXCEPTION IN CREATE_PAYMENT_INTENT")
                 print(f"Error Type: {type(e).__name__}")
@@ -181,6 +344,9 @@ class FinternetGateway:
         TODO: Replace with real Finternet API call.
         Returns: { id, intent_id, status, total_amount, locked_amount, milestones: [...] }
         """
+        if self.http:
+            return self._retry_wrapper(self._request, "GET", f"/api/v1/escrows/{intent_id}")
+
         def _get():
             result = {
                 "id": f"esc_{random.randbytes(12).hex()}",
@@ -201,6 +367,14 @@ class FinternetGateway:
         TODO: Replace with real Finternet API call.
         Returns: { milestone_id, escrow_id, index, status, amount, percentage }
         """
+        if self.http:
+            return self._retry_wrapper(
+                self._request,
+                "POST",
+                f"/api/v1/escrows/{escrow_id}/milestones",
+                {"index": index, "description": description, "amount": amount, "percentage": percentage},
+            )
+
         def _create():
             milestone_id = f"milestone_{random.randbytes(12).hex()}"
             result = {
@@ -222,6 +396,11 @@ class FinternetGateway:
         TODO: Replace with real Finternet API call.
         Returns: { milestone_id, status, proof_hash }
         """
+        if self.http:
+            return self._retry_wrapper(
+                self._request, "POST", f"/api/v1/milestones/{milestone_id}/proof", {"proof_data": proof_data}
+            )
+
         def _submit():
             proof_hash = f"0x{random.randbytes(32).hex()}"
             result = {
@@ -240,6 +419,11 @@ class FinternetGateway:
         TODO: Replace with real Finternet API call.
         Returns: { milestone_id, status, amount_released, transaction_id }
         """
+        if self.http:
+            return self._retry_wrapper(
+                self._request, "POST", f"/api/v1/milestones/{milestone_id}/complete", {"escrow_id": escrow_id}
+            )
+
         def _complete():
             tx_id = f"ft_complete_{random.randint(100000, 999999)}"
             result = {
@@ -254,11 +438,243 @@ class FinternetGateway:
         return self._retry_wrapper(_complete)
 
 
+@dataclass
+class _Payable:
+    payee: str
+    entries: dict[str, float] = field(default_factory=dict)  # payment_id -> amount
+    opened_at: float = field(default_factory=time.monotonic)
+    # Set once the entries are recorded as in flight; the transfer's idempotency key
+    batch_id: str | None = None
+
+    @property
+    def total(self) -> float:
+        return round(sum(self.entries.values()), 2)
+
+
+# (teacher_id, batch id, {payment_id: amount}) before the transfer; returns the
+# payment ids it recorded as in flight under that batch id
+SettlementPrepareCallback = Callable[[str, str, dict[str, float]], Iterable[str]]
+# (teacher_id, settle tx, {payment_id: amount}) once a netted settlement went through
+SettlementFlushCallback = Callable[[str, FinternetTx, dict[str, float]], None]
+# payment ids still held after a tick, so their owner can renew its claim on them
+SettlementHoldCallback = Callable[[list[str]], None]
+
+
+class SettlementBatcher:
+    """
+    Accrues per-teacher payables and settles them as one netted transfer.
+
+    Each session still has its own `settle` payment row (the per-session
+    ledger); only the gateway transfer is shared. A teacher's payable is
+    flushed when it holds `max_items` entries, reaches `max_amount`, or is
+    older than `max_age_s` (checked by a background thread).
+
+    A flushed payable becomes a batch with its own id: `on_prepare` records
+    its entries as in flight under that id before the transfer, and the id is
+    the transfer's idempotency key. A failed transfer is retried as the same
+    batch on the next flush (never merged with newer entries), so a transfer
+    that timed out but went through is not paid again. `on_flush` is called
+    after a successful transfer so the ledger rows can be marked, and
+    `on_hold` on every tick with the entries still waiting, so the worker can
+    keep its DB claim on them.
+    """
+
+    def __init__(
+        self,
+        gw: FinternetGateway,
+        *,
+        max_items: int = 50,
+        max_amount: float = 500.0,
+        max_age_s: float = 300.0,
+    ) -> None:
+        self.gw = gw
+        self.max_items = max_items
+        self.max_amount = max_amount
+        self.max_age_s = max_age_s
+        self._payables: dict[str, _Payable] = {}
+        # Prepared batches whose transfer failed (or was resumed by recovery)
+        self._batches: list[tuple[str, _Payable]] = []
+        self._lock = threading.Lock()
+        self._on_prepare: SettlementPrepareCallback | None = None
+        self._on_flush: SettlementFlushCallback | None = None
+        self._on_hold: SettlementHoldCallback | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def on_prepare(self, callback: SettlementPrepareCallback) -> None:
+        self._on_prepare = callback
+
+    def on_flush(self, callback: SettlementFlushCallback) -> None:
+        self._on_flush = callback
+
+    def on_hold(self, callback: SettlementHoldCallback) -> None:
+        self._on_hold = callback
+
+    def accrue(self, *, teacher_id: str, payee: str, payment_id: str, amount: float) -> None:
+        """Add one session's settle amount (idempotent per payment_id)."""
+        with self._lock:
+            payable = self._payables.setdefault(teacher_id, _Payable(payee=payee))
+            payable.entries[payment_id] = amount
+            due = len(payable.entries) >= self.max_items or payable.total >= self.max_amount
+        if due:
+            self.flush(teacher_id)
+
+    def resume(
+        self, *, teacher_id: str, payee: str, batch_id: str, entries: dict[str, float]
+    ) -> None:
+        """Re-send a batch already recorded as in flight (e.g. left by a dead worker)."""
+        with self._lock:
+            self._batches.append(
+                (teacher_id, _Payable(payee=payee, entries=dict(entries), batch_id=batch_id))
+            )
+
+    def pending(self) -> dict[str, float]:
+        with self._lock:
+            totals = {tid: p.total for tid, p in self._payables.items()}
+            for tid, p in self._batches:
+                totals[tid] = round(totals.get(tid, 0.0) + p.total, 2)
+            return totals
+
+    def held(self) -> list[str]:
+        """Payment ids accrued or in flight but not yet settled."""
+        with self._lock:
+            payables = list(self._payables.values()) + [p for _, p in self._batches]
+            return [pid for p in payables for pid in p.entries]
+
+    def flush(self, teacher_id: str | None = None, *, force: bool = False) -> int:
+        """
+        Settle payables: one teacher, or every teacher that is due (all if `force`).
+        Batches whose transfer failed before are always retried.
+        Returns the number of gateway transfers made.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if teacher_id is not None:
+                ids = [teacher_id] if teacher_id in self._payables else []
+            else:
+                ids = [
+                    tid
+                    for tid, p in self._payables.items()
+                    if force or now - p.opened_at >= self.max_age_s
+                ]
+            batches = [(tid, self._payables.pop(tid)) for tid in ids]
+            if teacher_id is None:
+                batches += self._batches
+                self._batches = []
+
+        transfers = 0
+        for tid, payable in batches:
+            if payable.batch_id is None and not self._prepare(tid, payable):
+                continue
+            amount = payable.total
+            try:
+                # Same key on every retry of this batch, so the gateway pays it once
+                tx = (
+                    self.gw.payout(
+                        payee_wallet=payable.payee, amount=amount, idempotency_key=payable.batch_id
+                    )
+                    if amount > 0
+                    else None
+                )
+            except Exception as e:
+                logger.error(
+                    f"Netted settlement {payable.batch_id} for teacher {tid} ({amount}) failed: {e}"
+                )
+                with self._lock:
+                    self._batches.append((tid, payable))
+                continue
+            transfers += 1 if tx else 0
+            logger.info(
+                f"Settled {amount} to teacher {tid} for {len(payable.entries)} sessions"
+                f"{f': {tx.finternet_tx_id}' if tx else ''}"
+            )
+            if self._on_flush:
+                try:
+                    self._on_flush(tid, tx or FinternetTx(finternet_tx_id=""), dict(payable.entries))
+                except Exception as e:
+                    # Rows stay in flight under the batch id; recovery re-sends the
+                    # transfer with the same key (a replay) and marks them then
+                    logger.error(
+                        f"❌ Could not record netted settlement {payable.batch_id} for teacher {tid}: {e}"
+                    )
+        return transfers
+
+    def _prepare(self, teacher_id: str, payable: _Payable) -> bool:
+        """Give the payable a batch id and record its entries as in flight."""
+        batch_id = f"netted_{uuid4().hex}"
+        if self._on_prepare:
+            try:
+                prepared = set(self._on_prepare(teacher_id, batch_id, dict(payable.entries)))
+            except Exception as e:
+                logger.error(f"Could not prepare netted settlement for teacher {teacher_id}: {e}")
+                self._requeue(teacher_id, payable)
+                return False
+            # Entries whose claim this worker lost now belong to another worker
+            payable.entries = {pid: a for pid, a in payable.entries.items() if pid in prepared}
+            if not payable.entries:
+                return False
+        payable.batch_id = batch_id
+        return True
+
+    def _requeue(self, teacher_id: str, payable: _Payable) -> None:
+        with self._lock:
+            current = self._payables.get(teacher_id)
+            if current is None:
+                self._payables[teacher_id] = payable
+            else:
+                current.entries = {**payable.entries, **current.entries}
+                current.opened_at = min(current.opened_at, payable.opened_at)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="settlement-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self.flush(force=True)
+
+    def _run(self) -> None:
+        interval = max(1.0, min(self.max_age_s / 4, 30.0))
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+                held = self.held()
+                if held and self._on_hold:
+                    self._on_hold(held)
+            except Exception as e:  # noqa: BLE001 - keep the batcher alive
+                logger.error(f"Settlement batcher error: {e}")
+
+
 _gw: FinternetGateway | None = None
+_batcher: SettlementBatcher | None = None
 
 
 def get_finternet() -> FinternetGateway:
     global _gw
     if _gw is None:
-        _gw = FinternetGateway()
+        s = get_settings()
+        _gw = FinternetGateway(
+            base_url=s.finternet_base,
+            api_key=s.finternet_key,
+            mode=s.finternet_mode,
+            timeout_s=s.finternet_timeout_s,
+        )
     return _gw
+
+
+def get_settlement_batcher() -> SettlementBatcher:
+    global _batcher
+    if _batcher is None:
+        s = get_settings()
+        _batcher = SettlementBatcher(
+            get_finternet(),
+            max_items=s.settlement_batch_max_items,
+            max_amount=s.settlement_batch_max_amount,
+            max_age_s=s.settlement_batch_max_age_s,
+        )
+    return _batcher
@@ -0,0 +1,160 @@
+"""
+Nightly batch forecasting for all teachers.
+
+Loads every review of ended sessions once, groups them by teacher with pandas,
+fits the bonus and rating forecasts in a process pool (one task per teacher)
+and upserts the results into `teacher_forecasts`. `AIService.forecast_bonus`
+and `validate_review_with_arima` read these rows before falling back to an
+on-demand fit.
+
+Run it from cron (e.g. once a night):
+    python -m app.services.forecast_batch [--workers N] [--steps 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+import pandas as pd
+
+from app.config import get_settings
+from app.services.forecasting import fit_arima_forecast
+from app.supabase_client import get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = 1000
+
+
+@dataclass
+class ForecastBatchReport:
+    teachers: int = 0
+    reviews: int = 0
+    written: int = 0
+    elapsed_s: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "teachers": self.teachers,
+            "reviews": self.reviews,
+            "written": self.written,
+            "elapsed_s": round(self.elapsed_s, 2),
+        }
+
+
+def _fetch_all(table: str, columns: str, **filters: Any) -> list[dict[str, Any]]:
+    sb = get_supabase()
+    rows: list[dict[str, Any]] = []
+    offset = 0
+    while True:
+        q = sb.client.table(table).select(columns)
+        for k, v in filters.items():
+            q = q.eq(k, v)
+        # id breaks created_at ties so offset pages neither skip nor repeat rows
+        q = q.order("created_at", desc=False).order("id", desc=False)
+        page = q.range(offset, offset + _PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < _PAGE_SIZE:
+            return rows
+        offset += _PAGE_SIZE
+
+
+def load_teacher_histories() -> dict[str, tuple[list[float], list[float]]]:
+    """{teacher_id: (ratings, bonus_percentages)}, each in created_at order."""
+    sessions = _fetch_all("sessions", "id,teacher_id", status="ended")
+    reviews = _fetch_all("reviews", "id,session_id,rating,bonus_percentage,created_at")
+    if not sessions or not reviews:
+        return {}
+
+    df = pd.DataFrame(reviews).merge(
+        pd.DataFrame(sessions).rename(columns={"id": "session_id"}),
+        on="session_id",
+        how="inner",
+    )
+    # Same cleaning as AIService._build_series
+    df["created_at"] = pd.to_datetime(df["created_at"], utc=True, errors="coerce")
+    df = df.dropna(subset=["created_at", "teacher_id"]).sort_values("created_at")
+    df["rating"] = pd.to_numeric(df["rating"], errors="coerce").fillna(0.0).astype("float64")
+    df["bonus_percentage"] = pd.to_numeric(df["bonus_percentage"], errors="coerce").fillna(0.0).astype("float64")
+
+    return {
+        str(teacher_id): (g["rating"].tolist(), g["bonus_percentage"].tolist())
+        for teacher_id, g in df.groupby("teacher_id", sort=False)
+    }
+
+
+def forecast_teacher(
+    teacher_id: str,
+    ratings: list[float],
+    bonuses: list[float],
+    steps: int = 3,
+) -> dict[str, Any]:
+    """One `teacher_forecasts` row. Module-level so it can run in a worker process."""
+    bonus_forecast = fit_arima_forecast(bonuses, steps)
+    rating_forecast = fit_arima_forecast(ratings, 1)
+    return {
+        "teacher_id": teacher_id,
+        "avg_forecast_bonus": round(sum(bonus_forecast) / len(bonus_forecast), 3) if bonus_forecast else 0.0,
+        "next_bonus_predictions": bonus_forecast,
+        "predicted_rating": rating_forecast[0] if ratings else None,
+        "review_count": len(ratings),
+    }
+
+
+def _forecast_teacher_task(args: tuple[str, list[float], list[float], int]) -> dict[str, Any]:
+    return forecast_teacher(*args)
+
+
+def run_batch_forecasts(*, workers: int | None = None, steps: int = 3) -> ForecastBatchReport:
+    started = time.monotonic()
+    report = ForecastBatchReport()
+
+    histories = load_teacher_histories()
+    report.teachers = len(histories)
+    report.reviews = sum(len(r) for r, _ in histories.values())
+    if not histories:
+        report.elapsed_s = time.monotonic() - started
+        return report
+
+    tasks = [(tid, ratings, bonuses, steps) for tid, (ratings, bonuses) in histories.items()]
+    workers = workers or get_settings().forecast_batch_workers or os.cpu_count() or 1
+    if workers <= 1:
+        rows = [_forecast_teacher_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            rows = list(pool.map(_forecast_teacher_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    computed_at = utc_now_iso()
+    sb = get_supabase()
+    for i in range(0, len(rows), _PAGE_SIZE):
+        chunk = [{**r, "computed_at": computed_at} for r in rows[i : i + _PAGE_SIZE]]
+        sb.client.table("teacher_forecasts").upsert(chunk, on_conflict="teacher_id").execute()
+        report.written += len(chunk)
+
+    report.elapsed_s = time.monotonic() - started
+    logger.info(f"Batch forecasts: {report.to_dict()}")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompute bonus/rating forecasts for all teachers")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: FORECAST_BATCH_WORKERS or CPU count)")
+    parser.add_argument("--steps", type=int, default=3)
+    args = parser.parse_args()
+
+    report = run_batch_forecasts(workers=args.workers, steps=args.steps)
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
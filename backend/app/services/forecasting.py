@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import logging
+import math
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# (forecast, order, params); order/params are None when the mean fallback was used
+ArimaFit = tuple[list[float], tuple[int, int, int] | None, list[float] | None]
+
+# Shorter series use the mean forecast
+_MIN_ARIMA_POINTS = 5
+
+
+def _mean_forecast(values: list[float], steps: int) -> list[float]:
+    mean_val = sum(values) / len(values) if values else 0.0
+    return [round(float(mean_val), 3)] * steps
+
+
+def fit_arima_model(values: list[float], steps: int = 3) -> ArimaFit:
+    """
+    Fit a very small ARIMA model and forecast `steps` ahead.
+    Falls back to mean when series is too short or model fails.
+
+    Returns the fitted order/params too, so the model can be updated with new
+    observations later without refitting (see `forecast_with_params`).
+    Module-level and pure (plain floats in/out) so it can run in a worker process.
+    """
+    if len(values) < _MIN_ARIMA_POINTS:
+        return _mean_forecast(values, steps), None, None
+
+    # Imported here: pandas/statsmodels take seconds to import and most workers never fit
+    import pandas as pd
+    from statsmodels.tsa.arima.model import ARIMA
+    from statsmodels.tsa.stattools import adfuller
+
+    y = pd.Series(values, dtype="float64")
+    d = 0
+    try:
+        adf_p = adfuller(y)[1]
+        if adf_p > 0.05:
+            d = 1
+    except Exception:
+        d = 0
+
+    try:
+        order = (1, d, 1)
+        fitted = ARIMA(y, order=order).fit()
+        forecast = fitted.forecast(steps=steps)
+        params = [float(p) for p in fitted.params]
+        return [round(float(v), 3) for v in forecast.tolist()], order, params
+    except Exception:
+        return _mean_forecast(values, steps), None, None
+
+
+def fit_arima_forecast(values: list[float], steps: int = 3) -> list[float]:
+    return fit_arima_model(values, steps)[0]
+
+
+def forecast_with_params(
+    values: list[float],
+    order: tuple[int, int, int],
+    params: list[float],
+    steps: int,
+) -> list[float]:
+    """Re-run the Kalman filter with fixed, previously fitted params (no optimization)."""
+    import pandas as pd
+    from statsmodels.tsa.arima.model import ARIMA
+
+    try:
+        results = ARIMA(pd.Series(values, dtype="float64"), order=order).filter(params)
+        return [round(float(v), 3) for v in results.forecast(steps=steps).tolist()]
+    except Exception:
+        return _mean_forecast(values, steps)
+
+
+@dataclass
+class EwmaState:
+    """Exponentially weighted mean/variance of a stream; O(1) per update."""
+
+    alpha: float
+    mean: float = 0.0
+    var: float = 0.0
+    n: int = 0
+
+    def update(self, x: float) -> None:
+        if self.n == 0:
+            self.mean = float(x)
+            self.var = 0.0
+        else:
+            d = float(x) - self.mean
+            self.mean += self.alpha * d
+            self.var = (1.0 - self.alpha) * (self.var + self.alpha * d * d)
+        self.n += 1
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+
+# ---------- Process pool (CPU-bound fits off the request thread) ----------
+_arima_pool: ProcessPoolExecutor | None = None
+_arima_pool_lock = threading.Lock()
+
+
+def _get_arima_pool(workers: int) -> ProcessPoolExecutor:
+    global _arima_pool
+    with _arima_pool_lock:
+        if _arima_pool is None:
+            # spawn: forking a threaded server process is unsafe
+            _arima_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _arima_pool
+
+
+def shutdown_arima_pool() -> None:
+    global _arima_pool
+    with _arima_pool_lock:
+        if _arima_pool is not None:
+            _arima_pool.shutdown(wait=False, cancel_futures=True)
+            _arima_pool = None
+
+
+def fit_arima_model_in_pool(values: list[float], steps: int = 3) -> ArimaFit:
+    """
+    `fit_arima_model`, in the process pool when ARIMA_PROCESS_WORKERS > 0.
+
+    If the fit doesn't finish within ARIMA_TIMEOUT_S (or the pool breaks) the
+    mean forecast is returned instead.
+    """
+    s = get_settings()
+    if len(values) < _MIN_ARIMA_POINTS or s.arima_process_workers <= 0:
+        return fit_arima_model(values, steps)
+
+    try:
+        future = _get_arima_pool(s.arima_process_workers).submit(fit_arima_model, values, steps)
+        return future.result(timeout=s.arima_timeout_s)
+    except FutureTimeoutError:
+        # The worker keeps running to completion; we just stop waiting for it
+        logger.warning(f"ARIMA fit timed out after {s.arima_timeout_s}s; using mean forecast")
+    except BrokenProcessPool as e:
+        logger.error(f"ARIMA process pool broke, recreating: {e}")
+        shutdown_arima_pool()
+    return _mean_forecast(values, steps), None, None
+
+
+def fit_arima_forecast_in_pool(values: list[float], steps: int = 3) -> list[float]:
+    return fit_arima_model_in_pool(values, steps)[0]
+
+
+# ---------- Per-teacher model cache ----------
+@dataclass
+class _TeacherModel:
+    values: list[float]
+    order: tuple[int, int, int] | None
+    params: list[float] | None
+    forecast: list[float]
+    fitted_at: float
+    since_fit: int = 0
+
+
+class ForecastCache:
+    """
+    Fitted forecast state per (teacher_id, metric).
+
+    - `forecast` returns the cached forecast; a miss (or an entry older than
+      `ttl_s`) loads the teacher's history once and fits it.
+    - `observe` appends a new value (e.g. after a review is stored) and updates
+      the forecast by re-filtering with the already fitted params, which is
+      cheap; every `refit_every` observations the params are re-estimated in a
+      background thread, so callers never wait on a full fit.
+
+    The cache is per process; `ttl_s` bounds staleness from other workers.
+    """
+
+    def __init__(self, *, ttl_s: float = 3600.0, refit_every: int = 20) -> None:
+        self.ttl_s = ttl_s
+        self.refit_every = refit_every
+        self._models: dict[tuple[str, str], _TeacherModel] = {}
+        self._lock = threading.Lock()
+        self._refits = ThreadPoolExecutor(max_workers=1, thread_name_prefix="forecast-refit")
+        self._refitting: set[tuple[str, str]] = set()
+
+    def _fresh(self, model: _TeacherModel | None) -> bool:
+        return model is not None and time.monotonic() - model.fitted_at < self.ttl_s
+
+    def forecast(
+        self,
+        teacher_id: str,
+        metric: str,
+        steps: int,
+        load: Callable[[], list[float]],
+    ) -> tuple[list[float], int]:
+        """Returns (forecast, number of history points it was based on)."""
+        key = (teacher_id, metric)
+        with self._lock:
+            model = self._models.get(key)
+        if self._fresh(model) and len(model.forecast) >= steps:
+            return model.forecast[:steps], len(model.values)
+
+        values = list(model.values) if self._fresh(model) else load()
+        return self._fit(key, values, steps), len(values)
+
+    def peek(self, teacher_id: str, metric: str, steps: int) -> list[float] | None:
+        """Cached forecast if fresh, without loading or fitting."""
+        with self._lock:
+            model = self._models.get((teacher_id, metric))
+        if self._fresh(model) and len(model.forecast) >= steps:
+            return model.forecast[:steps]
+        return None
+
+    def observe(self, teacher_id: str, metric: str, value: float) -> None:
+        key = (teacher_id, metric)
+        with self._lock:
+            model = self._models.get(key)
+            if not self._fresh(model):
+                # Nothing cached (or stale): the next forecast loads full history
+                self._models.pop(key, None)
+                return
+            model.values.append(float(value))
+            model.since_fit += 1
+            values = list(model.values)
+            steps = len(model.forecast)
+            due = model.since_fit >= self.refit_every or (
+                model.params is None and len(values) == _MIN_ARIMA_POINTS
+            )
+            refit = due and key not in self._refitting
+            if refit:
+                self._refitting.add(key)
+
+        if refit:
+            self._refits.submit(self._background_refit, key, values, steps)
+
+        if model.params is None:
+            forecast = _mean_forecast(values, steps)
+        else:
+            forecast = forecast_with_params(values, model.order, model.params, steps)
+        with self._lock:
+            if self._models.get(key) is model:
+                model.forecast = forecast
+
+    def _background_refit(self, key: tuple[str, str], values: list[float], steps: int) -> None:
+        try:
+            forecast, order, params = fit_arima_model_in_pool(values, steps)
+            with self._lock:
+                current = self._models.get(key)
+                if current is None or current.values[: len(values)] != values:
+                    return  # invalidated/reloaded meanwhile
+                # Keep observations that arrived during the fit; they count toward the next refit
+                self._models[key] = _TeacherModel(
+                    values=current.values,
+                    order=order,
+                    params=params,
+                    forecast=forecast if len(current.values) == len(values) else current.forecast,
+                    fitted_at=time.monotonic(),
+                    since_fit=len(current.values) - len(values),
+                )
+        except Exception as e:
+            logger.error(f"Forecast refit failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refitting.discard(key)
+
+    def invalidate(self, teacher_id: str | None = None) -> None:
+        with self._lock:
+            if teacher_id is None:
+                self._models.clear()
+            else:
+                for key in [k for k in self._models if k[0] == teacher_id]:
+                    del self._models[key]
+
+    def prime(
+        self,
+        teacher_id: str,
+        metric: str,
+        values: list[float],
+        fit: ArimaFit,
+    ) -> None:
+        """Install a fit for `values` (resets the refit counter)."""
+        forecast, order, params = fit
+        with self._lock:
+            self._models[(teacher_id, metric)] = _TeacherModel(
+                values=list(values),
+                order=order,
+                params=params,
+                forecast=forecast,
+                fitted_at=time.monotonic(),
+            )
+
+    def _fit(self, key: tuple[str, str], values: list[float], steps: int) -> list[float]:
+        forecast, order, params = fit_arima_model_in_pool(values, steps)
+        self.prime(key[0], key[1], values, (forecast, order, params))
+        return forecast
+
+
+_cache: ForecastCache | None = None
+
+
+def get_forecasts() -> ForecastCache:
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        _cache = ForecastCache(ttl_s=s.forecast_cache_ttl_s, refit_every=s.forecast_refit_every)
+    return _cache
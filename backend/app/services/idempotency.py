@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import Any, TypeVar
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+
+from app.config import get_settings
+from app.errors import http_error
+from app.supabase_client import get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_KEY_COLUMNS = ("scope", "caller", "key")
+
+
+def _match(q: Any, ident: dict[str, str]) -> Any:
+    for col in _KEY_COLUMNS:
+        q = q.eq(col, ident[col])
+    return q
+
+
+def _parse_ts(raw: str) -> datetime:
+    return datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+
+
+class IdempotencyStore:
+    """
+    `Idempotency-Key` store backed by the `idempotency_keys` table.
+
+    Keys are unique per (scope, caller, key): `scope` is the endpoint and
+    `caller` who the request acts for, so two callers picking the same key
+    never see each other's responses. Because the row lives in the DB, a
+    retry that lands on another worker still finds it.
+
+    The first request for a key inserts the row ("in_progress") and runs the
+    handler; concurrent and later replays with the same body wait for and get
+    the stored response instead of repeating gateway work. Only successful
+    responses are stored; if the handler raises, the row is deleted so the
+    client can retry. An in-progress row older than `lease_s` (its worker
+    died) and a row past its TTL are taken over by the next request.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: float = 86400.0,
+        wait_timeout_s: float = 30.0,
+        lease_s: float = 120.0,
+        poll_interval_s: float = 0.1,
+    ) -> None:
+        self.ttl_s = ttl_s
+        self.wait_timeout_s = wait_timeout_s
+        self.lease_s = lease_s
+        self.poll_interval_s = poll_interval_s
+        self._next_purge = 0.0
+
+    @staticmethod
+    def fingerprint(payload: Any) -> str:
+        raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def run(self, scope: str, caller: str, key: str | None, payload: Any, fn: Callable[[], T]) -> T:
+        if not key:
+            return fn()
+
+        self._purge()
+        fp = self.fingerprint(payload)
+        ident = {"scope": scope, "caller": caller, "key": key}
+        claim = uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout_s
+        delay = self.poll_interval_s
+        while True:
+            if self._insert(ident, fp, claim):
+                break
+            row = get_supabase().maybe_single("idempotency_keys", "*", **ident)
+            if row is not None and self._claimable(row):
+                if self._take_over(ident, row, fp, claim):
+                    break
+            elif row is not None:
+                if row.get("request_hash") != fp:
+                    raise http_error(
+                        422,
+                        "Idempotency-Key was already used with a different request",
+                        code="IDEMPOTENCY_KEY_REUSED",
+                    )
+                if row.get("status") == "done":
+                    return row.get("response")
+            # Still in progress, just released by a failed owner, or taken over by
+            # another request: every path waits and gives up at the deadline.
+            if time.monotonic() >= deadline:
+                raise http_error(
+                    409,
+                    "A request with this Idempotency-Key is still in progress",
+                    code="IDEMPOTENCY_IN_PROGRESS",
+                )
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+        try:
+            response = fn()
+        except BaseException:
+            self._release(ident, claim)
+            raise
+        try:
+            _match(
+                get_supabase()
+                .client.table("idempotency_keys")
+                .update({"status": "done", "response": jsonable_encoder(response)}),
+                ident,
+            ).eq("claimed_by", claim).execute()
+        except Exception as e:
+            # Replays get 409 until the lease lapses, then run the handler again
+            logger.error(f"Failed to store idempotent response for {scope}/{key}: {e}")
+        return response
+
+    def _claimable(self, row: dict[str, Any]) -> bool:
+        now = datetime.now(timezone.utc)
+        if row.get("expires_at") and _parse_ts(row["expires_at"]) <= now:
+            return True
+        if row.get("status") == "in_progress" and row.get("claimed_at"):
+            return now - _parse_ts(row["claimed_at"]) >= timedelta(seconds=self.lease_s)
+        return False
+
+    def _row(self, fp: str, claim: str) -> dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        return {
+            "request_hash": fp,
+            "status": "in_progress",
+            "response": None,
+            "claimed_by": claim,
+            "claimed_at": now.isoformat(),
+            "expires_at": (now + timedelta(seconds=self.ttl_s)).isoformat(),
+        }
+
+    def _insert(self, ident: dict[str, str], fp: str, claim: str) -> bool:
+        res = (
+            get_supabase()
+            .client.table("idempotency_keys")
+            .upsert(
+                {**ident, **self._row(fp, claim), "created_at": utc_now_iso()},
+                on_conflict=",".join(_KEY_COLUMNS),
+                ignore_duplicates=True,
+            )
+            .execute()
+        )
+        return bool(res and res.data)
+
+    def _take_over(self, ident: dict[str, str], row: dict[str, Any], fp: str, claim: str) -> bool:
+        # Compare-and-set on the previous claim so only one request takes over
+        q = get_supabase().client.table("idempotency_keys").update(
+            {**self._row(fp, claim), "created_at": utc_now_iso()}
+        )
+        res = _match(q, ident).eq("claimed_by", row.get("claimed_by")).execute()
+        return bool(res and res.data)
+
+    def _release(self, ident: dict[str, str], claim: str) -> None:
+        try:
+            q = get_supabase().client.table("idempotency_keys").delete()
+            _match(q, ident).eq("claimed_by", claim).execute()
+        except Exception as e:
+            # The row is taken over once its lease lapses
+            logger.error(f"Failed to release idempotency key {ident['scope']}/{ident['key']}: {e}")
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 60.0
+        try:
+            (
+                get_supabase()
+                .client.table("idempotency_keys")
+                .delete()
+                .lt("expires_at", utc_now_iso())
+                .execute()
+            )
+        except Exception as e:
+            logger.warning(f"Failed to purge expired idempotency keys: {e}")
+
+
+_store: IdempotencyStore | None = None
+
+
+def get_idempotency() -> IdempotencyStore:
+    global _store
+    if _store is None:
+        s = get_settings()
+        _store = IdempotencyStore(
+            ttl_s=s.idempotency_ttl_s,
+            wait_timeout_s=s.idempotency_wait_timeout_s,
+            lease_s=s.idempotency_lease_s,
+        )
+    return _store
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Literal
+from uuid import uuid4
+
+from app.config import get_settings
+from app.supabase_client import utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "retrying", "succeeded", "failed"]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: JobStatus = "queued"
+    attempts: int = 0
+    max_retries: int = 3
+    error: str | None = None
+    result: Any = None
+    meta: dict[str, Any] = field(default_factory=dict)
+    created_at: str = field(default_factory=utc_now_iso)
+    updated_at: str = field(default_factory=utc_now_iso)
+
+    def to_public_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "max_retries": self.max_retries,
+            "error": self.error,
+            "meta": self.meta,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class JobQueue:
+    """
+    Small in-process background job queue.
+
+    Jobs run on a thread pool so request handlers can return immediately.
+    Failed jobs are retried up to `max_retries` times (so run at most
+    `max_retries + 1` times) with exponential backoff (same delays as
+    `FinternetGateway._retry_wrapper`). Job state lives in memory only, so
+    job ids are meaningful for the worker that accepted the request; work
+    that must survive a restart is recovered from the DB at startup.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int = 4,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        history_size: int = 1000,
+    ) -> None:
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.history_size = history_size
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="murph-job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        func: Callable[..., Any],
+        *args: Any,
+        max_retries: int | None = None,
+        meta: dict[str, Any] | None = None,
+        on_failure: Callable[[Exception], None] | None = None,
+        **kwargs: Any,
+    ) -> Job:
+        job = Job(
+            id=f"job_{uuid4().hex}",
+            kind=kind,
+            max_retries=self.max_retries if max_retries is None else max_retries,
+            meta=dict(meta or {}),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict_locked()
+        self._pool.submit(self._run, job, func, args, kwargs, on_failure)
+        logger.info(f"Queued job {job.id} ({kind})")
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _set(self, job: Job, **updates: Any) -> None:
+        with self._lock:
+            for k, v in updates.items():
+                setattr(job, k, v)
+            job.updated_at = utc_now_iso()
+
+    def _run(
+        self,
+        job: Job,
+        func: Callable[..., Any],
+        args: tuple,
+        kwargs: dict,
+        on_failure: Callable[[Exception], None] | None,
+    ) -> None:
+        attempts = max(0, job.max_retries) + 1
+        for attempt in range(attempts):
+            self._set(job, status="running", attempts=attempt + 1)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:  # noqa: BLE001 - retry any failure
+                if attempt == attempts - 1:
+                    logger.error(f"Job {job.id} ({job.kind}) failed after {attempts} attempts: {e}")
+                    self._set(job, status="failed", error=str(e))
+                    if on_failure is not None:
+                        try:
+                            on_failure(e)
+                        except Exception as hook_err:  # noqa: BLE001
+                            logger.error(f"Job {job.id} failure hook raised: {hook_err}")
+                    return
+                wait_time = self.retry_delay * (2 ** attempt)
+                logger.warning(
+                    f"Job {job.id} ({job.kind}) attempt {attempt + 1} failed, "
+                    f"retrying in {wait_time}s: {e}"
+                )
+                self._set(job, status="retrying", error=str(e))
+                time.sleep(wait_time)
+                continue
+            self._set(job, status="succeeded", error=None, result=result)
+            return
+
+    def _evict_locked(self) -> None:
+        # Drop the oldest finished jobs once history grows past the limit.
+        if len(self._jobs) <= self.history_size:
+            return
+        for job_id in list(self._jobs.keys()):
+            if len(self._jobs) <= self.history_size:
+                break
+            if self._jobs[job_id].status in ("succeeded", "failed"):
+                del self._jobs[job_id]
+
+
+_jobs: JobQueue | None = None
+
+
+def get_jobs() -> JobQueue:
+    global _jobs
+    if _jobs is None:
+        s = get_settings()
+        _jobs = JobQueue(
+            max_workers=s.jobs_max_workers,
+            max_retries=s.jobs_max_retries,
+            retry_delay=s.jobs_retry_delay,
+        )
+    return _jobs
@@ -0,0 +1,587 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import uuid4
+
+from app.config import get_settings
+from app.errors import http_error
+from app.schemas import SessionEndBreakdown
+from app.services.active_sessions import get_active_sessions
+from app.services.engagement import get_engagement
+from app.services.finternet import FinternetTx, get_settlement_batcher
+from app.services.metering import (
+    compute_charge_amount,
+    compute_completion_percentage,
+    merge_engagement,
+)
+from app.services.outbox import outbox_op
+from app.services.wallets import get_wallets
+from app.supabase_client import WriteConflict, get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+# Owner tag for settle payments accrued in this process's SettlementBatcher
+_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+def _parse_ts(raw: str | None) -> datetime | None:
+    if not raw:
+        return None
+    return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+
+
+def end_session(
+    session: dict[str, Any],
+    *,
+    end_dt: datetime | None = None,
+    completion_percentage: float | None = None,
+    engagement_metrics: dict[str, Any] | None = None,
+) -> SessionEndBreakdown:
+    """
+    End an active session (shared by /sessions/end and the expiry sweeper).
+
+    - Compute duration from start_time to `end_dt` (default: now)
+    - Compute completion percentage (given, or from chunk metrics)
+    - Compute final charged (capped by reserve) and refund
+    - Update session + create pending settle/refund payments rows + settlement
+      outbox event in one guarded write; raises 400 SESSION_NOT_ACTIVE if the
+      session was ended concurrently.
+    """
+    sb = get_supabase()
+    session_id = session["id"]
+    if session.get("status") != "active":
+        raise http_error(400, "Session is not active", code="SESSION_NOT_ACTIVE")
+
+    listing = sb.maybe_single("listings", "*", id=session["listing_id"])
+    if not listing:
+        raise http_error(404, "Listing not found", code="LISTING_NOT_FOUND")
+
+    student = sb.maybe_single("users", "*", id=session["student_id"])
+    teacher = sb.maybe_single("users", "*", id=session["teacher_id"])
+    if not student or not teacher:
+        raise http_error(500, "Session user records missing", code="DATA_INTEGRITY")
+
+    wallet_address = student.get("wallet_address")
+    if not wallet_address:
+        raise http_error(400, "Wallet not connected", code="WALLET_NOT_CONNECTED")
+
+    start_raw = session.get("start_time")
+    if not start_raw:
+        raise http_error(500, "Session start_time missing", code="DATA_INTEGRITY")
+    start_dt = datetime.fromisoformat(start_raw.replace("Z", "+00:00"))
+    end_dt = max(start_dt, end_dt or datetime.now(timezone.utc))
+    duration_min = max(0.0, (end_dt - start_dt).total_seconds() / 60.0)
+
+    # Union of persisted heartbeats, unflushed live heartbeats and the end body,
+    # stored + returned in compact bitmap form (viewed_chunks lists -> viewed_bitmap)
+    engagement = merge_engagement(
+        session.get("engagement_metrics"),
+        get_engagement().pop(session_id),
+        engagement_metrics,
+    )
+    if completion_percentage is not None:
+        completion = float(completion_percentage)
+    else:
+        completion = compute_completion_percentage(listing, engagement)
+
+    # determine reserve amount
+    reserve_amount = (
+        float(session.get("reserve_amount") or 0.0)
+        if session.get("reserve_amount") is not None
+        else float(listing.get("reserve_amount") or get_settings().default_reserve_amount)
+    )
+
+    final_charge, refund = compute_charge_amount(
+        duration_min=duration_min,
+        completion_percentage=completion,
+        price_per_min=float(listing.get("price_per_min") or 0.0),
+        total_duration_min=float(listing.get("total_duration_min") or 0.0),
+        reserve_amount=reserve_amount,
+    )
+
+    # Update session
+    updates = {
+        "status": "ended",
+        "end_time": end_dt.isoformat(),
+        "duration_min": round(duration_min, 2),
+        "completion_percentage": round(completion, 2),
+        "engagement_metrics": engagement,
+        "final_amount_charged": final_charge,
+        "refund_amount": refund,
+    }
+    settle_payment_id = f"pay_{uuid4().hex}"
+    refund_payment_id = f"pay_{uuid4().hex}"
+
+    # Session update + pending settle/refund payments + settlement outbox event
+    # in one write round-trip; the gateway is called by the outbox dispatcher.
+    try:
+        sb.write_batch(
+            [
+                {
+                    "op": "update",
+                    "table": "sessions",
+                    "id": session_id,
+                    "set": updates,
+                    "expect": {"status": "active"},
+                },
+                {
+                    "op": "insert",
+                    "table": "payments",
+                    "rows": [
+                        {
+                            "id": settle_payment_id,
+                            "session_id": session_id,
+                            "type": "settle",
+                            "amount": final_charge,
+                            "status": "pending",
+                            "finternet_tx_id": None,
+                            "created_at": utc_now_iso(),
+                        },
+                        {
+                            "id": refund_payment_id,
+                            "session_id": session_id,
+                            "type": "refund",
+                            "amount": refund,
+                            "status": "pending",
+                            "finternet_tx_id": None,
+                            "created_at": utc_now_iso(),
+                        },
+                    ],
+                },
+                outbox_op(
+                    "session_settlement",
+                    session_id,
+                    {
+                        "session_id": session_id,
+                        "wallet_address": wallet_address,
+                        "teacher_id": session["teacher_id"],
+                        "teacher_wallet": teacher.get("wallet_address"),
+                        "settle_amount": final_charge,
+                        "refund_amount": refund,
+                        "settle_payment_id": settle_payment_id,
+                        "refund_payment_id": refund_payment_id,
+                    },
+                ),
+            ]
+        )
+    except WriteConflict:
+        # Ended concurrently (another request or the expiry sweeper)
+        raise http_error(400, "Session is not active", code="SESSION_NOT_ACTIVE")
+    except Exception:
+        # Session stays active so the client can retry /sessions/end; keep its live engagement
+        get_engagement().seed(session_id, engagement)
+        raise
+    get_active_sessions().evict(session_id)
+    # Reserve is no longer held locally: the charged part leaves the wallet, the refund is available
+    get_wallets().release(wallet_address, session_id, charged=final_charge)
+
+    return SessionEndBreakdown(
+        session_id=session_id,
+        listing_id=session["listing_id"],
+        teacher_id=session["teacher_id"],
+        student_id=session["student_id"],
+        start_time=start_dt,
+        end_time=end_dt,
+        duration_min=round(duration_min, 2),
+        completion_percentage=round(completion, 2),
+        reserve_amount=reserve_amount,
+        final_amount_charged=final_charge,
+        refund_amount=refund,
+        settlement_status="pending",
+    )
+
+
+def prepare_netted_settlement(
+    teacher_id: str, batch_id: str, entries: dict[str, float]
+) -> list[str]:
+    """
+    SettlementBatcher prepare callback: mark this worker's accrued settle
+    payments as settling under `batch_id` before the transfer goes out, so
+    recovery resumes the batch (same idempotency key) instead of re-accruing it.
+    """
+    res = (
+        get_supabase()
+        .client.table("payments")
+        .update(
+            {"status": "settling", "settlement_batch_id": batch_id, "accrued_at": utc_now_iso()}
+        )
+        .in_("id", list(entries))
+        .eq("status", "accrued")
+        .eq("accrued_by", _WORKER_ID)
+        .execute()
+    )
+    return [row["id"] for row in (res.data or [])]
+
+
+def record_netted_settlement(teacher_id: str, tx: FinternetTx, entries: dict[str, float]) -> None:
+    """SettlementBatcher callback: mark each session's settle payment with the shared transfer."""
+    (
+        get_supabase()
+        .client.table("payments")
+        .update({"status": "success", "finternet_tx_id": tx.finternet_tx_id})
+        .in_("id", list(entries))
+        .eq("status", "settling")
+        .execute()
+    )
+
+
+def teacher_payee(payload: dict[str, Any]) -> str | None:
+    """Teacher wallet for a settlement event (looked up if the event was written without one)."""
+    wallet = payload.get("teacher_wallet")
+    if not wallet and payload.get("teacher_id"):
+        teacher = get_supabase().maybe_single("users", "wallet_address", id=payload["teacher_id"])
+        wallet = (teacher or {}).get("wallet_address")
+    return wallet or None
+
+
+def _accrual_claimable(payment: dict[str, Any]) -> bool:
+    if payment.get("status") == "pending":
+        return True
+    if payment.get("status") != "accrued":
+        return False
+    if payment.get("accrued_by") == _WORKER_ID:
+        return True  # already ours (event redelivered to this worker)
+    accrued_at = _parse_ts(payment.get("accrued_at"))
+    lease = timedelta(seconds=get_settings().settlement_accrual_lease_s)
+    return accrued_at is None or datetime.now(timezone.utc) - accrued_at > lease
+
+
+def _claim_accrual(payment: dict[str, Any]) -> bool:
+    """Compare-and-set the settle payment to accrued-by-this-worker."""
+    if payment.get("status") == "accrued" and payment.get("accrued_by") == _WORKER_ID:
+        return True
+    q = (
+        get_supabase()
+        .client.table("payments")
+        .update({"status": "accrued", "accrued_by": _WORKER_ID, "accrued_at": utc_now_iso()})
+        .eq("id", payment["id"])
+        .eq("status", payment["status"])
+    )
+    if payment.get("accrued_at"):
+        q = q.eq("accrued_at", payment["accrued_at"])
+    res = q.execute()
+    return bool(res and res.data)
+
+
+def accrue_settlement(payload: dict[str, Any], payment: dict[str, Any] | None = None) -> bool:
+    """
+    Claim a session's settle payment in the DB and accrue it in this worker's batcher.
+
+    Returns False (payment left as is) when the teacher has no wallet yet, or
+    when another live worker already holds the accrual.
+    """
+    payment_id = payload["settle_payment_id"]
+    payee = teacher_payee(payload)
+    if not payee:
+        logger.warning(
+            f"Teacher {payload.get('teacher_id')} has no wallet; "
+            f"settle payment {payment_id} stays pending"
+        )
+        return False
+    if payment is None:
+        payment = get_supabase().maybe_single(
+            "payments", "id,status,accrued_by,accrued_at", id=payment_id
+        )
+    if not payment or not _accrual_claimable(payment) or not _claim_accrual(payment):
+        return False
+    get_settlement_batcher().accrue(
+        teacher_id=payload["teacher_id"],
+        payee=payee,
+        payment_id=payment_id,
+        amount=float(payload["settle_amount"]),
+    )
+    return True
+
+
+def renew_settlement_accruals(payment_ids: list[str]) -> None:
+    """SettlementBatcher hold callback: extend this worker's claim on accruals it still holds."""
+    (
+        get_supabase()
+        .client.table("payments")
+        .update({"accrued_at": utc_now_iso()})
+        .in_("id", payment_ids)
+        .in_("status", ["accrued", "settling"])
+        .eq("accrued_by", _WORKER_ID)
+        .execute()
+    )
+
+
+def recover_accrued_settlements() -> int:
+    """
+    Re-accrue settle payments whose accrual was lost: held by a worker that
+    stopped renewing its claim (crash/restart), or left pending because the
+    teacher had no wallet when the settlement event was delivered.
+
+    Every row is claimed in the DB before it is accrued, so each payment ends
+    up in exactly one worker's batcher even though every worker runs this.
+    Payments already settling under a batch are resumed as that batch, never
+    re-accrued (see `_resume_settling_batches`).
+    """
+    sb = get_supabase()
+    lease_cutoff = datetime.now(timezone.utc) - timedelta(
+        seconds=get_settings().settlement_accrual_lease_s
+    )
+    recovered = _resume_settling_batches(lease_cutoff)
+    columns = "id,session_id,status,accrued_by,accrued_at"
+    stale = (
+        sb.client.table("payments")
+        .select(columns)
+        .eq("type", "settle")
+        .eq("status", "accrued")
+        .lt("accrued_at", lease_cutoff.isoformat())
+        .execute()
+        .data
+        or []
+    )
+    pending = (
+        sb.client.table("payments")
+        .select(columns)
+        .eq("type", "settle")
+        .eq("status", "pending")
+        .execute()
+        .data
+        or []
+    )
+    by_id = {p["id"]: p for p in stale + pending}
+    if not by_id:
+        if recovered:
+            logger.info(f"Recovered {recovered} accrued settlements")
+        return recovered
+    # Pending settle payments only count once their settlement event was delivered
+    events = (
+        sb.client.table("outbox")
+        .select("payload")
+        .eq("kind", "session_settlement")
+        .eq("status", "delivered")
+        .in_("session_id", sorted({p["session_id"] for p in by_id.values()}))
+        .execute()
+        .data
+        or []
+    )
+    for event in events:
+        payload = event.get("payload") or {}
+        payment = by_id.get(payload.get("settle_payment_id"))
+        if payment is None or not payload.get("teacher_id"):
+            continue
+        try:
+            if accrue_settlement(payload, payment):
+                recovered += 1
+        except Exception as e:  # noqa: BLE001 - one bad row must not stop recovery
+            logger.error(f"Could not recover settle payment {payment['id']}: {e}")
+    if recovered:
+        logger.info(f"Recovered {recovered} accrued settlements")
+    return recovered
+
+
+def _resume_settling_batches(lease_cutoff: datetime) -> int:
+    """
+    Take over netted batches whose worker stopped renewing them, and hand them
+    to this worker's batcher under their original batch id. If the transfer
+    already went out, the gateway replays it and only the rows get marked.
+    """
+    sb = get_supabase()
+    rows = (
+        sb.client.table("payments")
+        .select("id,session_id,amount,settlement_batch_id")
+        .eq("type", "settle")
+        .eq("status", "settling")
+        .lt("accrued_at", lease_cutoff.isoformat())
+        .execute()
+        .data
+        or []
+    )
+    batch_ids = sorted({r["settlement_batch_id"] for r in rows if r.get("settlement_batch_id")})
+    resumed = 0
+    for batch_id in batch_ids:
+        try:
+            claimed = (
+                sb.client.table("payments")
+                .update({"accrued_by": _WORKER_ID, "accrued_at": utc_now_iso()})
+                .eq("settlement_batch_id", batch_id)
+                .eq("status", "settling")
+                .lt("accrued_at", lease_cutoff.isoformat())
+                .execute()
+                .data
+                or []
+            )
+            if not claimed:
+                continue  # another worker resumed it
+            session = sb.maybe_single("sessions", "teacher_id", id=claimed[0]["session_id"])
+            teacher_id = (session or {}).get("teacher_id")
+            payee = teacher_payee({"teacher_id": teacher_id}) if teacher_id else None
+            if not payee:
+                logger.error(f"Cannot resume netted settlement {batch_id}: no teacher wallet")
+                continue
+            get_settlement_batcher().resume(
+                teacher_id=teacher_id,
+                payee=payee,
+                batch_id=batch_id,
+                entries={r["id"]: float(r["amount"]) for r in claimed},
+            )
+            resumed += len(claimed)
+        except Exception as e:  # noqa: BLE001 - one bad batch must not stop recovery
+            logger.error(f"Could not resume netted settlement {batch_id}: {e}")
+    return resumed
+
+
+def last_activity(session: dict[str, Any]) -> datetime | None:
+    """Latest known sign of life: live heartbeat, persisted heartbeat, or start_time."""
+    live = get_engagement().snapshot(session["id"]) or {}
+    stored = session.get("engagement_metrics") or {}
+    seen = [
+        _parse_ts(live.get("last_heartbeat_at")),
+        _parse_ts(stored.get("last_heartbeat_at")),
+        _parse_ts(session.get("start_time")),
+    ]
+    seen = [ts for ts in seen if ts is not None]
+    return max(seen) if seen else None
+
+
+class SessionSweeper:
+    """
+    Auto-ends sessions left `active` with no activity for `idle_timeout_s`.
+
+    Every `interval_s` the sweeper pages through active sessions older than the
+    timeout (oldest first, at most `batch_size` ended per run) and ends them via
+    `end_session` with `end_time` = last activity, so abandoned sessions are
+    charged only for the time they were actually used and their locked reserve
+    is settled/refunded (through the outbox). At most `max_workers` sessions
+    are ended concurrently.
+
+    Candidates are paged on (start_time, id), so sessions sharing a start_time
+    are neither skipped nor repeated. A session that fails to end (e.g.
+    WALLET_NOT_CONNECTED) is retried with exponential backoff, capped at
+    `max_backoff_s`, so repeat failures can't fill every batch.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval_s: float = 300.0,
+        idle_timeout_s: float = 1800.0,
+        batch_size: int = 100,
+        max_workers: int = 4,
+        max_backoff_s: float = 86400.0,
+    ) -> None:
+        self.interval_s = interval_s
+        self.idle_timeout_s = idle_timeout_s
+        self.batch_size = batch_size
+        self.max_backoff_s = max_backoff_s
+        # session_id -> (consecutive failures, monotonic time of the next attempt)
+        self._failures: dict[str, tuple[int, float]] = {}
+        self._failures_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="session-sweeper")
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _stale_candidates(self, cutoff: datetime) -> list[dict[str, Any]]:
+        sb = get_supabase()
+        out: list[dict[str, Any]] = []
+        cursor: tuple[str, str] | None = None
+        while len(out) < self.batch_size:
+            q = (
+                sb.client.table("sessions")
+                .select("*")
+                .eq("status", "active")
+                .lt("start_time", cutoff.isoformat())
+            )
+            if cursor:
+                start, sid = cursor
+                q = q.or_(f'start_time.gt."{start}",and(start_time.eq."{start}",id.gt."{sid}")')
+            q = q.order("start_time", desc=False).order("id", desc=False)
+            page = q.limit(self.batch_size).execute().data or []
+            for row in page:
+                if self._backing_off(row["id"]):
+                    continue
+                last = last_activity(row)
+                if last is not None and last < cutoff:
+                    out.append(row)
+            if len(page) < self.batch_size:
+                break
+            cursor = (page[-1]["start_time"], page[-1]["id"])
+        return out[: self.batch_size]
+
+    def _backing_off(self, session_id: str) -> bool:
+        with self._failures_lock:
+            failure = self._failures.get(session_id)
+        return failure is not None and time.monotonic() < failure[1]
+
+    def _record_failure(self, session_id: str) -> int:
+        with self._failures_lock:
+            count = self._failures.get(session_id, (0, 0.0))[0] + 1
+            delay = min(self.max_backoff_s, self.interval_s * (2 ** (count - 1)))
+            self._failures[session_id] = (count, time.monotonic() + delay)
+            return count
+
+    def _expire(self, session: dict[str, Any]) -> bool:
+        try:
+            end_session(session, end_dt=last_activity(session))
+        except Exception as e:  # noqa: BLE001 - one bad session must not stop the sweep
+            failures = self._record_failure(session["id"])
+            logger.warning(f"Could not expire session {session['id']} (failure {failures}): {e}")
+            return False
+        with self._failures_lock:
+            self._failures.pop(session["id"], None)
+        logger.info(f"Expired idle session {session['id']}")
+        return True
+
+    def sweep_once(self) -> int:
+        """End one batch of stale sessions. Returns number ended."""
+        now = time.monotonic()
+        with self._failures_lock:
+            # Forget sessions not retried for a while (ended elsewhere, or no longer stale)
+            expired = [
+                sid for sid, (_, retry_at) in self._failures.items() if now - retry_at > self.max_backoff_s
+            ]
+            for sid in expired:
+                del self._failures[sid]
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.idle_timeout_s)
+        stale = self._stale_candidates(cutoff)
+        if not stale:
+            return 0
+        ended = sum(self._pool.map(self._expire, stale))
+        logger.info(f"Session sweeper ended {ended}/{len(stale)} idle sessions")
+        return ended
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="session-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval_s)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.sweep_once()
+            except Exception as e:  # noqa: BLE001 - keep the sweeper alive
+                logger.error(f"Session sweeper error: {e}")
+
+
+_sweeper: SessionSweeper | None = None
+
+
+def get_sweeper() -> SessionSweeper:
+    global _sweeper
+    if _sweeper is None:
+        s = get_settings()
+        _sweeper = SessionSweeper(
+            interval_s=s.session_sweep_interval_s,
+            idle_timeout_s=s.session_idle_timeout_s,
+            batch_size=s.session_sweep_batch_size,
+            max_workers=s.session_sweep_max_workers,
+            max_backoff_s=s.session_sweep_max_backoff_s,
+        )
+    return _sweeper
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import IO
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Thumbnail derivatives served to the frontend (bounding boxes; aspect ratio is kept).
+THUMBNAIL_SIZES: dict[str, tuple[int, int]] = {
+    "card": (480, 270),
+    "detail": (1280, 720),
+}
+THUMBNAIL_QUALITY = 80
+
+
+@dataclass(frozen=True)
+class MediaInfo:
+    duration_sec: float
+    width: int | None = None
+    height: int | None = None
+    bitrate_kbps: float | None = None
+    size_bytes: int | None = None
+
+    def to_dict(self) -> dict[str, float | int | None]:
+        return {
+            "duration_sec": round(self.duration_sec, 3),
+            "width": self.width,
+            "height": self.height,
+            "bitrate_kbps": round(self.bitrate_kbps, 1) if self.bitrate_kbps is not None else None,
+            "size_bytes": self.size_bytes,
+        }
+
+
+def _iter_boxes(f: IO[bytes], start: int, end: int) -> Iterator[tuple[bytes, int, int]]:
+    """
+    Yield (box_type, payload_offset, box_end) for boxes in [start, end).
+
+    Only box headers are read; payloads are skipped with seek().
+    """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_len = 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                return
+            size = struct.unpack(">Q", large)[0]
+            header_len = 16
+        elif size == 0:
+            size = end - pos  # box extends to end of parent / file
+        if size < header_len:
+            return  # corrupt box; stop rather than loop forever
+        yield box_type, pos + header_len, min(pos + size, end)
+        pos += size
+
+
+def _read_mvhd(f: IO[bytes], offset: int) -> float | None:
+    f.seek(offset)
+    version = f.read(4)[:1]
+    if version == b"\x01":
+        data = f.read(28)
+        if len(data) < 28:
+            return None
+        timescale, duration = struct.unpack(">IQ", data[16:28])
+    else:
+        data = f.read(16)
+        if len(data) < 16:
+            return None
+        timescale, duration = struct.unpack(">II", data[8:16])
+    if not timescale or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+        return None
+    return duration / timescale
+
+
+def _read_tkhd_dimensions(f: IO[bytes], offset: int) -> tuple[int, int]:
+    f.seek(offset)
+    version = f.read(4)[:1]
+    # creation/modification/track_id/reserved/duration, then 52 bytes of
+    # reserved/layer/group/volume/matrix before the 16.16 width + height.
+    f.seek(offset + 4 + (32 if version == b"\x01" else 20) + 52)
+    data = f.read(8)
+    if len(data) < 8:
+        return 0, 0
+    width, height = struct.unpack(">II", data)
+    return width >> 16, height >> 16
+
+
+def _read_hdlr_type(f: IO[bytes], offset: int) -> bytes:
+    f.seek(offset + 8)  # version/flags + pre_defined
+    return f.read(4)
+
+
+def _probe_track(f: IO[bytes], start: int, end: int) -> tuple[bytes | None, int, int]:
+    handler: bytes | None = None
+    width = height = 0
+    for box_type, payload, box_end in _iter_boxes(f, start, end):
+        if box_type == b"tkhd":
+            width, height = _read_tkhd_dimensions(f, payload)
+        elif box_type == b"mdia":
+            for sub_type, sub_payload, _ in _iter_boxes(f, payload, box_end):
+                if sub_type == b"hdlr":
+                    handler = _read_hdlr_type(f, sub_payload)
+                    break
+    return handler, width, height
+
+
+def probe_mp4(f: IO[bytes]) -> MediaInfo | None:
+    """
+    Read duration/resolution/bitrate from an MP4/MOV container without decoding.
+
+    Walks the box tree with seek() and reads only the `moov/mvhd` header and the
+    `trak/tkhd` + `mdia/hdlr` boxes, so cost is independent of the media size.
+    Works on any seekable file object (e.g. UploadFile.file, a SpooledTemporaryFile).
+    The file position is restored to 0 afterwards so the upload can still be read.
+
+    Returns None when the file is not a parseable MP4/MOV.
+    """
+    try:
+        f.seek(0, 2)
+        size = f.tell()
+        duration_sec: float | None = None
+        width: int | None = None
+        height: int | None = None
+
+        for box_type, payload, box_end in _iter_boxes(f, 0, size):
+            if box_type != b"moov":
+                continue
+            for sub_type, sub_payload, sub_end in _iter_boxes(f, payload, box_end):
+                if sub_type == b"mvhd":
+                    duration_sec = _read_mvhd(f, sub_payload)
+                elif sub_type == b"trak" and width is None:
+                    handler, w, h = _probe_track(f, sub_payload, sub_end)
+                    if handler == b"vide" and w and h:
+                        width, height = w, h
+            break
+
+        if not duration_sec:
+            return None
+        return MediaInfo(
+            duration_sec=duration_sec,
+            width=width,
+            height=height,
+            bitrate_kbps=(size * 8 / duration_sec) / 1000.0,
+            size_bytes=size,
+        )
+    except (OSError, struct.error, ValueError) as e:
+        logger.warning(f"MP4 probe failed: {e}")
+        return None
+    finally:
+        try:
+            f.seek(0)
+        except Exception as e:  # noqa: BLE001
+            logger.debug(f"Could not rewind upload after MP4 probe: {e}")
+
+
+def hash_file(f: IO[bytes], chunk_size: int = HASH_CHUNK_SIZE) -> tuple[str, int]:
+    """
+    Stream a seekable file through SHA-256 in fixed-size chunks.
+
+    Returns (hex_digest, size_bytes). Memory use is bounded by `chunk_size`
+    regardless of the file size; the file position is restored to 0.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    f.seek(0)
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+    finally:
+        f.seek(0)
+    return digest.hexdigest(), size
+
+
+def thumbnails_available() -> bool:
+    """Thumbnail derivatives need Pillow (optional `media` extra)."""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def make_thumbnail_variants(
+    image_bytes: bytes,
+    sizes: dict[str, tuple[int, int]] | None = None,
+    quality: int = THUMBNAIL_QUALITY,
+) -> dict[str, tuple[bytes, str, str]]:
+    """
+    Produce downscaled, compressed thumbnail derivatives.
+
+    Returns { name: (bytes, content_type, extension) }. WebP is preferred; JPEG
+    is used when the Pillow build has no WebP encoder. Images are never upscaled.
+    """
+    from PIL import Image, ImageOps
+
+    out: dict[str, tuple[bytes, str, str]] = {}
+    with Image.open(io.BytesIO(image_bytes)) as opened:
+        src = ImageOps.exif_transpose(opened)
+        if src.mode not in ("RGB", "RGBA"):
+            src = src.convert("RGB")
+        for name, box in (sizes or THUMBNAIL_SIZES).items():
+            img = src.copy()
+            img.thumbnail(box, Image.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            try:
+                img.save(buf, "WEBP", quality=quality, method=4)
+                out[name] = (buf.getvalue(), "image/webp", "webp")
+            except (KeyError, OSError):
+                buf = io.BytesIO()
+                img.convert("RGB").save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+                out[name] = (buf.getvalue(), "image/jpeg", "jpg")
+    return out
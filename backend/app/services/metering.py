@@ -1,7 +1,112 @@
 from __future__ import annotations
 
+import base64
+import binascii
+from collections.abc import Iterable
 from typing import Any
 
+# Chunk sets carried in engagement_metrics. Each may arrive as a JSON list of
+# indices ("<name>_chunks") or as a compact bitset ("<name>_bitmap").
+CHUNK_SETS = ("viewed", "rewatched", "skipped")
+
+# Upper bound on chunk indices when total_chunks is unknown (keeps bitmaps bounded).
+MAX_CHUNKS = 100_000
+
+
+def encode_chunk_bitmap(bits: int) -> str:
+    """
+    Encode a chunk bitset as base64.
+
+    Bit i (little-endian: byte i // 8, bit i % 8) is set when chunk i was seen.
+    A 1000-chunk course fits in 168 characters regardless of how many chunks were viewed.
+    """
+    if bits <= 0:
+        return ""
+    return base64.b64encode(bits.to_bytes((bits.bit_length() + 7) // 8, "little")).decode("ascii")
+
+
+def decode_chunk_bitmap(encoded: str | None) -> int:
+    """Inverse of `encode_chunk_bitmap`; invalid input decodes to an empty set."""
+    if not encoded or not isinstance(encoded, str):
+        return 0
+    try:
+        return int.from_bytes(base64.b64decode(encoded, validate=True), "little")
+    except (binascii.Error, ValueError):
+        return 0
+
+
+def chunks_to_bits(indices: Iterable[Any], limit: int = MAX_CHUNKS) -> int:
+    """Build a bitset from chunk indices, ignoring invalid or out-of-range values."""
+    bits = 0
+    for x in indices:
+        try:
+            i = int(x)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < limit:
+            bits |= 1 << i
+    return bits
+
+
+def _chunk_limit(engagement: dict[str, Any]) -> int:
+    total = engagement.get("total_chunks")
+    if isinstance(total, int) and 0 < total <= MAX_CHUNKS:
+        return total
+    return MAX_CHUNKS
+
+
+def engagement_bits(engagement: dict[str, Any] | None, name: str = "viewed") -> int:
+    """Union of the list and bitmap forms of one chunk set, as an int bitset."""
+    if not engagement:
+        return 0
+    limit = _chunk_limit(engagement)
+    bits = decode_chunk_bitmap(engagement.get(f"{name}_bitmap"))
+    chunks = engagement.get(f"{name}_chunks")
+    if isinstance(chunks, list):
+        bits |= chunks_to_bits(chunks, limit)
+    return bits & ((1 << limit) - 1)
+
+
+def compact_engagement(engagement: dict[str, Any] | None) -> dict[str, Any]:
+    """
+    Normalize engagement_metrics to the compact form used for storage/transport.
+
+    `<name>_chunks` lists are folded into `<name>_bitmap`; other keys pass through.
+    """
+    if not engagement:
+        return {}
+    out = {
+        k: v
+        for k, v in engagement.items()
+        if k not in {f"{n}_chunks" for n in CHUNK_SETS} | {f"{n}_bitmap" for n in CHUNK_SETS}
+    }
+    for name in CHUNK_SETS:
+        if f"{name}_chunks" in engagement or f"{name}_bitmap" in engagement:
+            out[f"{name}_bitmap"] = encode_chunk_bitmap(engagement_bits(engagement, name))
+    return out
+
+
+def merge_engagement(*parts: dict[str, Any] | None) -> dict[str, Any]:
+    """
+    Merge several engagement_metrics payloads (e.g. stored + live heartbeats + end body).
+
+    Chunk sets are unioned; for other keys later parts win. Returns the compact form.
+    """
+    merged: dict[str, Any] = {}
+    bits = {name: 0 for name in CHUNK_SETS}
+    seen: set[str] = set()
+    for part in parts:
+        if not part:
+            continue
+        for name in CHUNK_SETS:
+            if f"{name}_chunks" in part or f"{name}_bitmap" in part:
+                bits[name] |= engagement_bits(part, name)
+                seen.add(name)
+        merged.update(compact_engagement(part))
+    for name in seen:
+        merged[f"{name}_bitmap"] = encode_chunk_bitmap(bits[name])
+    return merged
+
 
 def compute_completion_percentage(listing: dict[str, Any], engagement: dict[str, Any] | None) -> float:
     """
@@ -16,15 +121,18 @@ def compute_completion_percentage(listing: dict[str, Any], engagement: dict[str,
           "rewatched_chunks": [2,3],       # optional
           "skipped_chunks": [10,11],       # optional
         }
+    - or the compact form (see `compact_engagement`), e.g.
+        engagement_metrics = { "total_chunks": 120, "viewed_bitmap": "<base64 bitset>" }
 
     For edge cases (skips/rewatches), we only count unique viewed chunks.
+    Coverage is a popcount on the bitset, so cost doesn't grow with rewatches.
     """
     if not engagement:
         return 0.0
     total = engagement.get("total_chunks")
-    viewed = engagement.get("viewed_chunks")
-    if isinstance(total, int) and total > 0 and isinstance(viewed, list):
-        unique = len(set(int(x) for x in viewed if isinstance(x, (int, float, str))))
+    has_viewed = isinstance(engagement.get("viewed_chunks"), list) or "viewed_bitmap" in engagement
+    if isinstance(total, int) and total > 0 and has_viewed:
+        unique = engagement_bits(engagement, "viewed").bit_count()
         pct = (unique / total) * 100.0
         return max(0.0, min(100.0, pct))
 
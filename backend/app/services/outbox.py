@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import uuid4
+
+from app.config import get_settings
+from app.supabase_client import get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+OutboxHandler = Callable[[dict[str, Any]], Any]
+
+def _parse_ts(raw: str | None) -> datetime:
+    if not raw:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+
+
+def outbox_op(kind: str, session_id: str, payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    Build a `write_batch` insert op for an outbox event.
+
+    Writing it in the same batch as the session/payment rows makes the external
+    call part of the same local transaction (transactional outbox).
+    """
+    now = utc_now_iso()
+    return {
+        "op": "insert",
+        "table": "outbox",
+        "rows": [
+            {
+                "id": f"ob_{uuid4().hex}",
+                "session_id": session_id,
+                "kind": kind,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "last_error": None,
+                "available_at": now,
+                "created_at": now,
+                "delivered_at": None,
+            }
+        ],
+    }
+
+
+class OutboxDispatcher:
+    """
+    Delivers outbox events to external services in the background.
+
+    - Events for one session are delivered strictly in `created_at` order; a
+      failing event blocks later events of that session until it succeeds.
+    - Different sessions are delivered concurrently.
+    - Failures back off exponentially; after `max_attempts` the event is marked
+      "failed" for manual follow-up.
+    - Events are claimed with a compare-and-set on `attempts`, so several
+      workers can run the dispatcher without delivering an event twice at once.
+      A claim lasts `lease_s`, longer than a handler's gateway retries can run
+      (delivery is at-least-once if a worker dies mid-call). Handlers get the
+      event id as `_event_id` and pass it to the gateway as idempotency key,
+      so a redelivered event doesn't repeat a transfer.
+    """
+
+    def __init__(
+        self,
+        *,
+        poll_interval_s: float = 2.0,
+        batch_size: int = 50,
+        max_attempts: int = 8,
+        retry_delay_s: float = 2.0,
+        max_workers: int = 4,
+        lease_s: float = 300.0,
+    ) -> None:
+        self.poll_interval_s = poll_interval_s
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay_s = retry_delay_s
+        self.lease_s = lease_s
+        self._handlers: dict[str, OutboxHandler] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="outbox")
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def register(self, kind: str, handler: OutboxHandler) -> None:
+        self._handlers[kind] = handler
+
+    def dispatch_once(self) -> int:
+        """Deliver one batch of due events. Returns number delivered."""
+        sb = get_supabase()
+        # Only due events, so events backing off (or leased elsewhere) can't fill the batch
+        rows = (
+            sb.client.table("outbox")
+            .select("*")
+            .in_("status", ["pending", "in_flight"])
+            .lte("available_at", utc_now_iso())
+            .order("created_at", desc=False)
+            .limit(self.batch_size)
+            .execute()
+            .data
+            or []
+        )
+        by_session: OrderedDict[str, list[dict[str, Any]]] = OrderedDict()
+        for r in rows:
+            by_session.setdefault(r.get("session_id") or r["id"], []).append(r)
+
+        # A session's chain may only start at its oldest undelivered event; an
+        # earlier event that isn't due yet blocks it to keep per-session order.
+        session_ids = [r["session_id"] for r in rows if r.get("session_id")]
+        if session_ids:
+            heads: dict[str, str] = {}
+            for r in (
+                sb.client.table("outbox")
+                .select("id,session_id")
+                .in_("status", ["pending", "in_flight"])
+                .in_("session_id", sorted(set(session_ids)))
+                .order("created_at", desc=False)
+                .execute()
+                .data
+                or []
+            ):
+                heads.setdefault(r["session_id"], r["id"])
+            by_session = OrderedDict(
+                (sid, chain)
+                for sid, chain in by_session.items()
+                if sid not in heads or heads[sid] == chain[0]["id"]
+            )
+
+        futures = [self._pool.submit(self._deliver_chain, chain) for chain in by_session.values()]
+        return sum(f.result() for f in futures)
+
+    def _deliver_chain(self, chain: list[dict[str, Any]]) -> int:
+        delivered = 0
+        now = datetime.now(timezone.utc)
+        for event in chain:
+            if _parse_ts(event.get("available_at")) > now:
+                break  # backing off or leased elsewhere; keep per-session order
+            if not self._claim(event):
+                break
+            if not self._deliver(event):
+                break
+            delivered += 1
+        return delivered
+
+    def _claim(self, event: dict[str, Any]) -> bool:
+        lease_until = datetime.now(timezone.utc) + timedelta(seconds=self.lease_s)
+        res = (
+            get_supabase()
+            .client.table("outbox")
+            .update(
+                {
+                    "status": "in_flight",
+                    "attempts": int(event.get("attempts") or 0) + 1,
+                    "available_at": lease_until.isoformat(),
+                }
+            )
+            .eq("id", event["id"])
+            .eq("attempts", int(event.get("attempts") or 0))
+            .execute()
+        )
+        return bool(res and res.data)
+
+    def _deliver(self, event: dict[str, Any]) -> bool:
+        sb = get_supabase()
+        attempts = int(event.get("attempts") or 0) + 1
+        handler = self._handlers.get(event["kind"])
+        try:
+            if handler is None:
+                raise RuntimeError(f"No outbox handler for kind {event['kind']!r}")
+            handler({**event["payload"], "_event_id": event["id"]})
+        except Exception as e:  # noqa: BLE001 - any failure is retried
+            failed = attempts >= self.max_attempts
+            delay = self.retry_delay_s * (2 ** (attempts - 1))
+            logger.warning(
+                f"Outbox {event['id']} ({event['kind']}) attempt {attempts} failed"
+                f"{'; giving up' if failed else f', retrying in {delay}s'}: {e}"
+            )
+            sb.update(
+                "outbox",
+                {
+                    "status": "failed" if failed else "pending",
+                    "last_error": str(e)[:1000],
+                    "available_at": (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat(),
+                },
+                match={"id": event["id"]},
+            )
+            return False
+
+        sb.update(
+            "outbox",
+            {"status": "delivered", "last_error": None, "delivered_at": utc_now_iso()},
+            match={"id": event["id"]},
+        )
+        logger.info(f"Outbox {event['id']} ({event['kind']}) delivered")
+        return True
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval_s * 2)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval_s):
+            try:
+                self.dispatch_once()
+            except Exception as e:  # noqa: BLE001 - keep the dispatcher alive
+                logger.error(f"Outbox dispatcher error: {e}")
+
+
+_dispatcher: OutboxDispatcher | None = None
+
+
+def get_outbox() -> OutboxDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        s = get_settings()
+        _dispatcher = OutboxDispatcher(
+            poll_interval_s=s.outbox_poll_interval_s,
+            batch_size=s.outbox_batch_size,
+            max_attempts=s.outbox_max_attempts,
+            retry_delay_s=s.outbox_retry_delay_s,
+            lease_s=s.outbox_lease_s,
+        )
+    return _dispatcher
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import Future
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import uuid4
+
+from app.config import get_settings
+from app.services.ai import get_ai
+from app.services.credibility_batch import get_credibility_batcher
+from app.services.forecasting import get_forecasts
+from app.services.jobs import Job, get_jobs
+from app.supabase_client import SupabaseService, get_supabase, utc_now_iso
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_ts(raw: str) -> datetime:
+    return datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+
+
+def heuristic_credibility(rating: int, completion_percentage: float) -> tuple[float, int]:
+    """Completion-based (credibility, bonus_percentage), used when AI is unavailable."""
+    credibility = 0.4 + (completion_percentage / 100.0) * 0.6
+    credibility = max(0.0, min(1.0, credibility))
+    bonus_pct = 0
+    if rating >= 4 and credibility >= 0.75:
+        bonus_pct = 10
+    return credibility, bonus_pct
+
+
+def _penalize_anomaly(
+    credibility: float,
+    *,
+    session: dict[str, Any],
+    rating: int,
+    db: SupabaseService,
+    review_id: str | None,
+) -> float:
+    """Penalize credibility by the teacher's rating anomaly score."""
+    # Temporal anomaly detection over historical ratings
+    try:
+        arima_result = get_ai().validate_review_with_arima(
+            session_id=session["id"],
+            rating=rating,
+            db=db,
+            exclude_review_id=review_id,
+        )
+        anomaly = float(arima_result.get("anomaly_score", 0.0))
+    except Exception:
+        anomaly = 0.0
+
+    # Blend: penalize credibility slightly when rating is anomalous
+    return max(0.0, min(1.0, credibility - anomaly * 0.3))
+
+
+def score_review(
+    *,
+    session: dict[str, Any],
+    rating: int,
+    review_text: str,
+    db: SupabaseService,
+    review_id: str | None = None,
+) -> tuple[float, int]:
+    """
+    LLM credibility + bonus, penalized by the teacher's rating anomaly score.
+
+    Pass `review_id` when the review is already stored, so it isn't part of the
+    history its own anomaly score is measured against. Always one chat
+    completion per review: micro-batching would add its collection window to
+    the caller's latency, so only background scoring batches.
+    """
+    completion = float(session.get("completion_percentage") or 0.0)
+    # Step 1: Groq/OpenAI credibility + bonus
+    try:
+        credibility, bonus_pct = get_ai().score_review_credibility(
+            **_credibility_input(session, rating, review_text)
+        )
+    except Exception:
+        # If AI is unavailable, simple heuristic:
+        credibility, bonus_pct = heuristic_credibility(rating, completion)
+
+    # Step 2: Temporal anomaly detection over historical ratings
+    credibility = _penalize_anomaly(
+        credibility, session=session, rating=rating, db=db, review_id=review_id
+    )
+    return credibility, int(bonus_pct)
+
+
+def _credibility_input(session: dict[str, Any], rating: int, review_text: str) -> dict[str, Any]:
+    return {
+        "rating": rating,
+        "review_text": review_text,
+        "engagement_metrics": session.get("engagement_metrics") or {},
+        "completion_percentage": float(session.get("completion_percentage") or 0.0),
+        "duration_min": float(session.get("duration_min") or 0.0),
+    }
+
+
+def record_review_observations(teacher_id: str | None, rating: int, bonus_pct: int) -> None:
+    """Fold a scored review into the teacher's cached forecast models and rating EWMA."""
+    if not teacher_id:
+        return
+    forecasts = get_forecasts()
+    forecasts.observe(teacher_id, "rating", float(rating))
+    forecasts.observe(teacher_id, "bonus_percentage", float(bonus_pct))
+    get_ai().observe_rating(teacher_id, float(rating))
+
+
+def _claim_review(review: dict[str, Any], claim: str) -> bool:
+    """
+    Compare-and-set the review to scoring_status="scoring" owned by `claim`.
+
+    Claimable: pending, or scoring under a claim older than REVIEW_SCORING_LEASE_S
+    (its worker died). A job retrying its own claim keeps it.
+    """
+    status = review.get("scoring_status")
+    if status == "scoring" and review.get("scoring_claimed_by") == claim:
+        return True
+    if status == "scoring":
+        claimed_at = review.get("scoring_claimed_at")
+        lease = timedelta(seconds=get_settings().review_scoring_lease_s)
+        if claimed_at and datetime.now(timezone.utc) - _parse_ts(claimed_at) < lease:
+            return False
+    elif status != "pending":
+        return False
+    q = (
+        get_supabase()
+        .client.table("reviews")
+        .update(
+            {"scoring_status": "scoring", "scoring_claimed_by": claim, "scoring_claimed_at": utc_now_iso()}
+        )
+        .eq("id", review["id"])
+        .eq("scoring_status", status)
+    )
+    if review.get("scoring_claimed_by"):
+        q = q.eq("scoring_claimed_by", review["scoring_claimed_by"])
+    res = q.execute()
+    return bool(res and res.data)
+
+
+def score_review_in_background(review_id: str, claim: str) -> dict[str, Any]:
+    """
+    Job body: replace a pending review's provisional scores with the AI scores.
+
+    The review is claimed in the DB first, so when several workers queue the
+    same review (e.g. startup recovery) only one of them scores it. With
+    CREDIBILITY_BATCHING the review is handed to the batcher and this job
+    returns; a follow-up job finishes scoring once the batch is answered, so
+    no job worker waits on the batch window.
+    """
+    sb = get_supabase()
+    review = sb.maybe_single("reviews", "*", id=review_id)
+    if not review or not _claim_review(review, claim):
+        return {"review_id": review_id, "skipped": True}
+    session = sb.maybe_single("sessions", "*", id=review["session_id"])
+    if not session:
+        raise RuntimeError(f"Session {review['session_id']} for review {review_id} not found")
+
+    rating = int(review["rating"])
+    if get_settings().credibility_batching:
+        future = get_credibility_batcher().submit(
+            **_credibility_input(session, rating, review.get("review_text") or "")
+        )
+        future.add_done_callback(
+            lambda f: get_jobs().submit(
+                "review_scoring",
+                _finish_batched_review_scoring,
+                review,
+                session,
+                claim,
+                f,
+                meta={"review_id": review_id},
+                on_failure=lambda e: _mark_review_scoring_failed(review_id, claim),
+            )
+        )
+        return {"review_id": review_id, "batched": True}
+
+    credibility, bonus_pct = score_review(
+        session=session,
+        rating=rating,
+        review_text=review.get("review_text") or "",
+        db=sb,
+        review_id=review_id,
+    )
+    return _store_review_scores(review, session, claim, credibility, bonus_pct)
+
+
+def _finish_batched_review_scoring(
+    review: dict[str, Any], session: dict[str, Any], claim: str, future: Future
+) -> dict[str, Any]:
+    """Follow-up job body: anomaly penalty and DB write for a batch-scored review."""
+    rating = int(review["rating"])
+    try:
+        credibility, bonus_pct = future.result()
+    except Exception:
+        # If AI is unavailable, simple heuristic:
+        completion = float(session.get("completion_percentage") or 0.0)
+        credibility, bonus_pct = heuristic_credibility(rating, completion)
+    credibility = _penalize_anomaly(
+        credibility, session=session, rating=rating, db=get_supabase(), review_id=review["id"]
+    )
+    return _store_review_scores(review, session, claim, credibility, int(bonus_pct))
+
+
+def _store_review_scores(
+    review: dict[str, Any], session: dict[str, Any], claim: str, credibility: float, bonus_pct: int
+) -> dict[str, Any]:
+    review_id = review["id"]
+    res = (
+        get_supabase()
+        .client.table("reviews")
+        .update(
+            {
+                "credibility_score": round(float(credibility), 3),
+                "bonus_percentage": bonus_pct,
+                "scoring_status": "scored",
+            }
+        )
+        .eq("id", review_id)
+        .eq("scoring_claimed_by", claim)
+        .execute()
+    )
+    if not (res and res.data):
+        # Claim lapsed and another worker took over; it records the observations
+        return {"review_id": review_id, "skipped": True}
+    record_review_observations(session.get("teacher_id"), int(review["rating"]), bonus_pct)
+    return {"review_id": review_id, "credibility_score": round(float(credibility), 3), "bonus_percentage": bonus_pct}
+
+
+def _mark_review_scoring_failed(review_id: str, claim: str) -> None:
+    # Provisional scores stay in place; only the status changes.
+    try:
+        get_supabase().update(
+            "reviews",
+            {"scoring_status": "failed"},
+            match={"id": review_id, "scoring_claimed_by": claim},
+        )
+    except Exception as e:
+        logger.error(f"Failed to mark review {review_id} scoring as failed: {e}")
+
+
+def queue_review_scoring(review_id: str) -> Job:
+    # One claim token per job, kept across the job's retries
+    claim = f"job_{uuid4().hex}"
+    return get_jobs().submit(
+        "review_scoring",
+        score_review_in_background,
+        review_id,
+        claim,
+        meta={"review_id": review_id},
+        on_failure=lambda e: _mark_review_scoring_failed(review_id, claim),
+    )
+
+
+def recover_pending_reviews(limit: int = 1000) -> int:
+    """
+    Re-queue reviews a restart left unscored (job state is in memory only):
+    pending ones, and ones whose scoring claim lapsed. Every worker may run
+    this; the job's claim makes sure each review is scored once.
+    """
+    sb = get_supabase()
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=get_settings().review_scoring_lease_s)
+    lapsed = f'and(scoring_status.eq.scoring,scoring_claimed_at.lt."{cutoff.isoformat()}")'
+    try:
+        rows = (
+            sb.client.table("reviews")
+            .select("id")
+            .or_(f"scoring_status.eq.pending,{lapsed}")
+            .order("created_at", desc=False)
+            .limit(limit)
+            .execute()
+            .data
+            or []
+        )
+    except Exception as e:
+        logger.error(f"Failed to load pending reviews: {e}")
+        return 0
+    for row in rows:
+        queue_review_scoring(row["id"])
+    if rows:
+        logger.info(f"Re-queued scoring for {len(rows)} pending reviews")
+    return len(rows)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from app.config import get_settings
+from app.services.finternet import get_finternet
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientBalance(RuntimeError):
+    """Gateway balance minus pending reservations is below the requested amount."""
+
+    def __init__(self, available: float, requested: float) -> None:
+        super().__init__(f"available {available} < requested {requested}")
+        self.available = available
+        self.requested = requested
+
+
+@dataclass
+class _Reservation:
+    amount: float
+    expires_at: float
+    # When the gateway lock for it succeeded; None while the lock is in flight
+    locked_at: float | None = None
+
+
+@dataclass
+class _Wallet:
+    balance: float | None = None
+    fetched_at: float = 0.0
+    reservations: dict[str, _Reservation] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    evicted: bool = False
+
+    def reserved(self) -> float:
+        """Reserved amounts the cached balance doesn't reflect yet."""
+        now = time.monotonic()
+        for key in [k for k, r in self.reservations.items() if r.expires_at <= now]:
+            del self.reservations[key]
+        return sum(r.amount for r in self.reservations.values() if not self._reflected(r))
+
+    def _reflected(self, r: _Reservation) -> bool:
+        # A balance fetched after the lock went through already has it deducted
+        return r.locked_at is not None and r.locked_at < self.fetched_at
+
+
+class WalletBook:
+    """
+    Per-wallet balance cache with local reservation accounting.
+
+    The gateway balance is the wallet's available balance: a lock deducts the
+    locked amount, and at settlement the refunded part comes back.
+
+    - The gateway balance is cached for `ttl_s`, so most balance checks are local.
+    - /sessions/start reserves its amount (keyed by session id) before locking
+      it and confirms the reservation once the lock succeeds. A reservation is
+      deducted from the cached balance only until a balance fetched after its
+      lock replaces it; then the gateway has deducted it and it is dropped.
+    - `reserve` checks and reserves under a per-wallet lock, so concurrent
+      starts for the same wallet can't oversubscribe it.
+    - A reservation that is never confirmed or released (e.g. the worker
+      failed mid-start) expires after `reservation_ttl_s`.
+    - Wallets with no reservations and a stale balance are evicted.
+
+    State is per process; other workers' locks are seen through the gateway
+    balance on the next refresh.
+    """
+
+    def __init__(self, *, ttl_s: float = 30.0, reservation_ttl_s: float = 1800.0) -> None:
+        self.ttl_s = ttl_s
+        self.reservation_ttl_s = reservation_ttl_s
+        self._wallets: dict[str, _Wallet] = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    @contextmanager
+    def _locked(self, wallet_address: str) -> Iterator[_Wallet]:
+        while True:
+            with self._lock:
+                self._evict_idle_locked()
+                w = self._wallets.setdefault(wallet_address, _Wallet())
+            w.lock.acquire()
+            if not w.evicted:
+                break
+            w.lock.release()  # evicted between lookup and lock; take the new entry
+        try:
+            yield w
+        finally:
+            w.lock.release()
+
+    def _evict_idle_locked(self) -> None:
+        now = time.monotonic()
+        if now - self._swept_at < self.ttl_s:
+            return
+        self._swept_at = now
+        for address, w in list(self._wallets.items()):
+            if not w.lock.acquire(blocking=False):
+                continue  # in use
+            try:
+                if not w.reservations and now - w.fetched_at > self.ttl_s:
+                    w.evicted = True
+                    del self._wallets[address]
+            finally:
+                w.lock.release()
+
+    def _refresh_locked(self, wallet_address: str, w: _Wallet) -> None:
+        if w.balance is None or time.monotonic() - w.fetched_at > self.ttl_s:
+            # Locks confirmed before the request started are in the fetched balance
+            started = time.monotonic()
+            w.balance = float(get_finternet().get_balance(wallet_address=wallet_address))
+            w.fetched_at = started
+            for key in [k for k, r in w.reservations.items() if w._reflected(r)]:
+                del w.reservations[key]
+
+    def set_balance(self, wallet_address: str, balance: float) -> None:
+        """Seed the cache with a balance the gateway just reported (e.g. on connect)."""
+        with self._locked(wallet_address) as w:
+            w.balance = float(balance)
+            w.fetched_at = time.monotonic()
+
+    def available(self, wallet_address: str) -> float:
+        with self._locked(wallet_address) as w:
+            self._refresh_locked(wallet_address, w)
+            return round(w.balance - w.reserved(), 2)
+
+    def reserve(self, wallet_address: str, key: str, amount: float) -> float:
+        """
+        Reserve `amount` for `key` if available; returns the remaining available balance.
+        Raises InsufficientBalance otherwise. Call `confirm` once the amount is locked.
+        """
+        with self._locked(wallet_address) as w:
+            self._refresh_locked(wallet_address, w)
+            available = w.balance - w.reserved()
+            if available < amount:
+                raise InsufficientBalance(round(available, 2), amount)
+            w.reservations[key] = _Reservation(amount, time.monotonic() + self.reservation_ttl_s)
+            return round(available - amount, 2)
+
+    def confirm(self, wallet_address: str, key: str) -> None:
+        """The gateway locked the reserved amount; the next balance fetch reflects it."""
+        with self._locked(wallet_address) as w:
+            r = w.reservations.get(key)
+            if r is not None:
+                r.locked_at = time.monotonic()
+
+    def release(self, wallet_address: str, key: str, *, charged: float = 0.0) -> None:
+        """
+        Drop a reservation: the lock failed (`charged` 0) or the session ended.
+
+        `charged` is the part of the lock that left the wallet for good; the
+        rest is refunded by the gateway. If the cached balance still predates
+        the lock, the charged part is deducted from it; otherwise the balance
+        already excludes the whole lock and the refund shows on the next fetch.
+        """
+        with self._lock:
+            if wallet_address not in self._wallets:
+                return  # nothing cached or reserved for it in this process
+        with self._locked(wallet_address) as w:
+            r = w.reservations.pop(key, None)
+            if r is not None and r.locked_at is not None and not w._reflected(r):
+                if w.balance is not None and charged:
+                    w.balance = max(0.0, w.balance - charged)
+
+
+_book: WalletBook | None = None
+
+
+def get_wallets() -> WalletBook:
+    global _book
+    if _book is None:
+        s = get_settings()
+        _book = WalletBook(ttl_s=s.wallet_balance_ttl_s, reservation_ttl_s=s.wallet_reservation_ttl_s)
+    return _book
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 from datetime import datetime, timezone
 from typing import Any
 
@@ -7,11 +8,17 @@ from supabase import Client, create_client
 
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+class WriteConflict(RuntimeError):
+    """A guarded `write_batch` update found the row no longer in the expected state."""
+
+
 class SupabaseService:
     """
     Thin wrapper around supabase-py.
@@ -113,6 +120,36 @@ class SupabaseService:
             print(f"SUPABASE UPDATE ERROR on {table}: {e}")
             raise e
 
+    def write_batch(self, ops: list[dict[str, Any]]) -> None:
+        """
+        Apply writes across tables in one round-trip (and one transaction).
+
+        ops:
+          { "op": "insert", "table": "payments", "rows": [{...}, ...] }
+          { "op": "update", "table": "sessions", "id": "sess_...", "set": {...} }
+          { "op": "update", ..., "expect": {"status": "active"} }  # guarded update
+
+        An update with `expect` only applies if the row still has those values;
+        otherwise WriteConflict is raised and nothing is written.
+        Inserted rows only set the columns they name; the others keep their DEFAULTs.
+
+        Uses the `apply_write_batch` Postgres function (migration_add_write_batch.sql).
+        There is deliberately no per-op fallback: callers rely on the batch being
+        atomic (e.g. a session is only ended together with its payments and
+        outbox event), so a missing function is an error.
+        """
+        try:
+            self.client.rpc("apply_write_batch", {"p_ops": ops}).execute()
+        except Exception as e:
+            if "WRITE_CONFLICT" in str(e):
+                raise WriteConflict(str(e)) from e
+            if "PGRST202" in str(e):  # function not found
+                raise RuntimeError(
+                    "apply_write_batch is not installed; run migration_add_write_batch.sql"
+                ) from e
+            logger.error(f"Supabase write batch failed: {e}")
+            raise
+
     # ---------- Storage helpers ----------
     def upload_video(self, *, path: str, file_bytes: bytes, content_type: str) -> dict[str, Any]:
         """
@@ -173,6 +210,13 @@ class SupabaseService:
         
         return {"path": path, "public_url": public_url, "bucket": bucket_name}
 
+    def download_file(self, *, path: str, bucket_name: str | None = None) -> bytes:
+        """
+        Download a stored object's bytes (e.g. to build thumbnail derivatives).
+        """
+        bucket_name = bucket_name or self.videos_bucket
+        return self.client.storage.from_(bucket_name).download(path)
+
     def get_signed_url(self, *, path: str, expires_in: int = 3600, bucket_name: str | None = None) -> str:
         """
         Generate a signed URL for private bucket access.
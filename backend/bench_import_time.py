@@ -0,0 +1,80 @@
+"""
+Import-time budget check for the API worker.
+
+Imports `app.main` in a fresh interpreter with `-X importtime`, reports the
+total and the slowest top-level packages, and fails if the total exceeds the
+budget or if a lazily loaded dependency (pandas, statsmodels, openai, numpy)
+was imported at startup.
+
+Run:
+    uv run python bench_import_time.py [--budget-ms 1500] [--runs 3] [--top 15]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+LAZY_MODULES = ("pandas", "statsmodels", "openai", "numpy")
+
+_PROBE = (
+    "import sys, app.main; "
+    f"print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+)
+
+
+def measure_once() -> tuple[float, dict[str, float], list[str]]:
+    """(total_ms, cumulative ms per top-level package, lazy modules that were imported)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        check=True,
+    )
+    per_package: dict[str, float] = defaultdict(float)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        # "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line.split(":", 1)[1].split("|")
+        total_us += int(self_us)
+        per_package[name.strip().split(".")[0]] += int(self_us) / 1000.0
+    eager = [m for m in proc.stdout.strip().split(",") if m]
+    return total_us / 1000.0, dict(per_package), eager
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure import time of app.main")
+    parser.add_argument("--budget-ms", type=float, default=1500.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(max(1, args.runs))]
+    best_total, per_package, eager = min(runs, key=lambda r: r[0])
+
+    print(f"app.main import time (best of {len(runs)}): {best_total:.0f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"{'package':<30}{'ms':>10}")
+    for name, ms in sorted(per_package.items(), key=lambda kv: kv[1], reverse=True)[: args.top]:
+        print(f"{name:<30}{ms:>10.1f}")
+
+    failed = False
+    if eager:
+        print(f"FAIL: lazily loaded modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if best_total > args.budget_ms:
+        print(f"FAIL: {best_total:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
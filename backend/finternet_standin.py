@@ -0,0 +1,312 @@
+"""
+Local Finternet stand-in server for offline, deterministic load tests.
+
+Implements the endpoints FinternetGateway uses in http mode (payment intents,
+escrows, milestones, wallets, lock/settle/payout/refund/reversal) with in-memory state,
+plus injectable latency and error rates. POSTs carrying an Idempotency-Key header
+are replayed: a repeated key returns the first response.
+
+Run:
+    uv run python finternet_standin.py --port 8100 --latency-ms 80 --jitter-ms 40 --error-rate 0.02
+
+Then point the backend at it (backend/.env):
+    FINTERNET_BASE=http://localhost:8100
+    FINTERNET_MODE=http
+
+Knobs (flags or env vars):
+    --latency-ms / STANDIN_LATENCY_MS   mean added latency per request (default 0)
+    --jitter-ms  / STANDIN_JITTER_MS    +/- uniform jitter around the mean (default 0)
+    --error-rate / STANDIN_ERROR_RATE   fraction of requests answered with 503 (default 0)
+    --seed       / STANDIN_SEED         RNG seed so runs are reproducible (default 42)
+
+GET /_standin/stats returns request/error counts per route.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import Counter
+from typing import Any
+from uuid import uuid4
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+
+class StandinConfig:
+    def __init__(
+        self,
+        *,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 42,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> StandinConfig:
+        return cls(
+            latency_ms=float(os.getenv("STANDIN_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("STANDIN_JITTER_MS", "0")),
+            error_rate=float(os.getenv("STANDIN_ERROR_RATE", "0")),
+            seed=int(os.getenv("STANDIN_SEED", "42")),
+        )
+
+    def draw(self) -> tuple[float, bool]:
+        """(delay_seconds, fail) for one request, from the seeded RNG."""
+        with self.lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            fail = self.rng.random() < self.error_rate
+        return max(0.0, self.latency_ms + jitter) / 1000.0, fail
+
+
+def _route_label(method: str, path: str) -> str:
+    """e.g. "POST payment-intents", "GET wallets" (ids stripped so stats stay small)."""
+    parts = [p for p in path.split("/") if p]
+    resource = parts[2] if len(parts) > 2 and parts[:2] == ["api", "v1"] else path
+    return f"{method} {resource}"
+
+
+def create_app(config: StandinConfig | None = None) -> FastAPI:
+    cfg = config or StandinConfig.from_env()
+    app = FastAPI(title="Finternet stand-in", version="0.1.0")
+
+    balances: dict[str, float] = {}
+    intents: dict[str, dict[str, Any]] = {}
+    escrows: dict[str, dict[str, Any]] = {}  # keyed by intent id
+    milestones: dict[str, dict[str, Any]] = {}
+    requests_by_route: Counter[str] = Counter()
+    errors_by_route: Counter[str] = Counter()
+    counter = {"tx": 0}
+    replays: dict[str, dict[str, Any]] = {}  # Idempotency-Key -> first response
+    state_lock = threading.Lock()
+    replay_lock = threading.Lock()
+
+    def next_tx(kind: str) -> str:
+        with state_lock:
+            counter["tx"] += 1
+            return f"ft_{kind}_{counter['tx']:08d}"
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        if request.url.path.startswith("/_standin"):
+            return await call_next(request)
+        route = _route_label(request.method, request.url.path)
+        requests_by_route[route] += 1
+        delay, fail = cfg.draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            errors_by_route[route] += 1
+            return JSONResponse(status_code=503, content={"error": "injected failure"})
+        return await call_next(request)
+
+    @app.get("/_standin/stats")
+    def stats() -> dict:
+        return {
+            "requests": dict(requests_by_route),
+            "errors": dict(errors_by_route),
+            "config": {
+                "latency_ms": cfg.latency_ms,
+                "jitter_ms": cfg.jitter_ms,
+                "error_rate": cfg.error_rate,
+            },
+        }
+
+    # ---------- Wallets ----------
+    @app.post("/api/v1/wallets")
+    def connect_wallet(body: dict) -> dict:
+        address = f"0x{uuid4().hex}{uuid4().hex[:8]}"
+        with state_lock:
+            balances[address] = 250.0
+        return {"wallet_address": address, "balance": balances[address], "user_id": body.get("user_id")}
+
+    @app.get("/api/v1/wallets/{wallet_address}/balance")
+    def get_balance(wallet_address: str) -> dict:
+        with state_lock:
+            # Unknown wallets (e.g. auto-generated by /sessions/start) start funded
+            balance = balances.setdefault(wallet_address, 5000.0)
+        return {"wallet_address": wallet_address, "balance": balance}
+
+    # Balances follow the gateway model the backend's wallet cache assumes: a lock
+    # deducts the locked amount, a refund returns part of it, a settle releases the
+    # rest to the teacher (the student's balance already excludes it), and a payout
+    # credits the teacher's wallet. Replays (same Idempotency-Key) move nothing.
+    def _tx(
+        kind: str,
+        body: dict,
+        idempotency_key: str | None = None,
+        wallet_field: str = "wallet_address",
+        delta: float = 0.0,
+    ) -> dict:
+        wallet = body.get(wallet_field)
+        amount = float(body.get("amount") or 0.0)
+        if not wallet or amount < 0:
+            raise HTTPException(status_code=400, detail=f"{wallet_field} and non-negative amount required")
+
+        def apply() -> dict:
+            with state_lock:
+                balance = balances.setdefault(wallet, 5000.0)
+                if balance + delta * amount < 0:
+                    raise HTTPException(status_code=402, detail="insufficient balance")
+                balances[wallet] = round(balance + delta * amount, 2)
+            return {"id": next_tx(kind), "status": "success", wallet_field: wallet, "amount": amount}
+
+        return _once(idempotency_key, apply)
+
+    def _once(idempotency_key: str | None, build) -> dict:
+        if not idempotency_key:
+            return build()
+        # Held across build so concurrent requests with one key move balances once
+        with replay_lock:
+            if idempotency_key not in replays:
+                replays[idempotency_key] = build()
+            return replays[idempotency_key]
+
+    @app.post("/api/v1/locks")
+    def lock(body: dict, idempotency_key: str | None = Header(None)) -> dict:
+        return _tx("lock", body, idempotency_key, delta=-1.0)
+
+    @app.post("/api/v1/settlements")
+    def settle(body: dict, idempotency_key: str | None = Header(None)) -> dict:
+        return _tx("settle", body, idempotency_key)
+
+    @app.post("/api/v1/payouts")
+    def payout(body: dict, idempotency_key: str | None = Header(None)) -> dict:
+        return _tx("payout", body, idempotency_key, wallet_field="payee_wallet", delta=1.0)
+
+    @app.post("/api/v1/refunds")
+    def refund(body: dict, idempotency_key: str | None = Header(None)) -> dict:
+        return _tx("refund", body, idempotency_key, delta=1.0)
+
+    @app.post("/api/v1/reversals")
+    def reverse(body: dict) -> dict:
+        return {**_tx("reverse", body), "reversed_tx_id": body.get("tx_id")}
+
+    # ---------- Payment intents / escrows ----------
+    @app.post("/api/v1/payment-intents", status_code=201)
+    def create_intent(body: dict, idempotency_key: str | None = Header(None)) -> dict:
+        return _once(idempotency_key, lambda: _create_intent(body))
+
+    def _create_intent(body: dict) -> dict:
+        intent_id = f"intent_{uuid4().hex}"
+        now = int(time.time())
+        intent = {
+            "id": intent_id,
+            "object": "payment_intent",
+            "status": "INITIATED",
+            "amount": str(body.get("amount", "0")),
+            "currency": body.get("currency", "USDC"),
+            "type": body.get("type", "DELIVERY_VS_PAYMENT"),
+            "description": body.get("description"),
+            "paymentUrl": f"http://localhost/pay?intent={intent_id}",
+            "contractAddress": "0x0000000000000000000000000000000000000000",
+            "chainId": 0,
+            "metadata": body.get("metadata") or {},
+            "created": now,
+            "updated": now,
+        }
+        amount = float(body.get("amount") or 0.0)
+        with state_lock:
+            intents[intent_id] = intent
+            escrows[intent_id] = {
+                "id": f"esc_{uuid4().hex[:24]}",
+                "intent_id": intent_id,
+                "status": "active",
+                "total_amount": amount,
+                "locked_amount": amount,
+                "milestones": [],
+            }
+        return intent
+
+    @app.get("/api/v1/escrows/{intent_id}")
+    def get_escrow(intent_id: str) -> dict:
+        escrow = escrows.get(intent_id)
+        if escrow is None:
+            raise HTTPException(status_code=404, detail="escrow not found")
+        return escrow
+
+    @app.post("/api/v1/escrows/{escrow_id}/milestones")
+    def create_milestone(escrow_id: str, body: dict) -> dict:
+        milestone_id = f"milestone_{uuid4().hex[:24]}"
+        milestone = {
+            "milestone_id": milestone_id,
+            "escrow_id": escrow_id,
+            "index": body.get("index"),
+            "description": body.get("description"),
+            "amount": body.get("amount"),
+            "percentage": body.get("percentage"),
+            "status": "pending",
+        }
+        with state_lock:
+            milestones[milestone_id] = milestone
+            for escrow in escrows.values():
+                if escrow["id"] == escrow_id:
+                    escrow["milestones"].append(milestone)
+        return milestone
+
+    @app.post("/api/v1/milestones/{milestone_id}/proof")
+    def submit_proof(milestone_id: str, body: dict) -> dict:
+        with state_lock:
+            if milestone_id in milestones:
+                milestones[milestone_id]["status"] = "proof_submitted"
+        return {
+            "milestone_id": milestone_id,
+            "status": "proof_submitted",
+            "proof_hash": f"0x{uuid4().hex}{uuid4().hex}",
+            "proof_data": body.get("proof_data") or {},
+        }
+
+    @app.post("/api/v1/milestones/{milestone_id}/complete")
+    def complete_milestone(milestone_id: str, body: dict) -> dict:
+        with state_lock:
+            milestone = milestones.get(milestone_id)
+            if milestone:
+                milestone["status"] = "completed"
+        return {
+            "milestone_id": milestone_id,
+            "escrow_id": body.get("escrow_id"),
+            "status": "completed",
+            "amount_released": float((milestone or {}).get("amount") or 0.0),
+            "transaction_id": next_tx("complete"),
+        }
+
+    return app
+
+
+app = create_app()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local Finternet stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=float(os.getenv("STANDIN_LATENCY_MS", "0")))
+    parser.add_argument("--jitter-ms", type=float, default=float(os.getenv("STANDIN_JITTER_MS", "0")))
+    parser.add_argument("--error-rate", type=float, default=float(os.getenv("STANDIN_ERROR_RATE", "0")))
+    parser.add_argument("--seed", type=int, default=int(os.getenv("STANDIN_SEED", "42")))
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = StandinConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+-- Migration: Shared Idempotency-Key store
+-- Run this in Supabase SQL Editor
+--
+-- /sessions/start, /sessions/end and the /milestones POSTs record each
+-- Idempotency-Key here, so a retry that lands on another worker replays the
+-- stored response. Keys are unique per endpoint (scope) and caller.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  scope TEXT NOT NULL,
+  caller TEXT NOT NULL,
+  key TEXT NOT NULL,
+  request_hash TEXT NOT NULL,
+  status TEXT NOT NULL DEFAULT 'in_progress',
+  response JSONB,
+  claimed_by TEXT NOT NULL,
+  claimed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  PRIMARY KEY (scope, caller, key),
+  CONSTRAINT idempotency_keys_status_check CHECK (status IN ('in_progress', 'done'))
+);
+
+-- Expired keys are purged periodically
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys(expires_at);
+
+COMMENT ON TABLE idempotency_keys IS 'Idempotency-Key replays: one row per (scope, caller, key) with the stored response';
@@ -0,0 +1,13 @@
+-- Migration: Track background AI generation (transcription + course_outcomes) on listings
+-- Run this in Supabase SQL Editor
+
+-- Add ai_status field (text, nullable) with check constraint
+alter table if exists public.listings
+  add column if not exists ai_status text check (ai_status in ('pending', 'ready', 'failed'));
+
+comment on column public.listings.ai_status is 'Background AI generation state: pending, ready, or failed';
+
+-- Set by the worker that owns the generation job; startup recovery re-queues a
+-- pending listing only after this claim is older than LISTING_AI_LEASE_S
+alter table if exists public.listings
+  add column if not exists ai_claimed_at timestamptz;
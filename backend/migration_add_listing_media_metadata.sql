@@ -0,0 +1,8 @@
+-- Migration: Store probed video container metadata on listings
+-- Run this in Supabase SQL Editor
+
+-- Add media_metadata field (jsonb, nullable) - array of per-video objects
+alter table if exists public.listings
+  add column if not exists media_metadata jsonb;
+
+comment on column public.listings.media_metadata is 'Per-video MP4/MOV metadata probed on upload: [{duration_sec, width, height, bitrate_kbps, size_bytes}]';
@@ -0,0 +1,27 @@
+-- Migration: Content-hash index for uploaded media (dedup identical uploads)
+-- Run this in Supabase SQL Editor
+
+-- One row per teacher and unique file content; the storage object (under that
+-- teacher's prefix) is shared by all of the teacher's listings referencing it.
+-- Dedup is scoped per teacher so one tenant's upload never resolves to another's object.
+CREATE TABLE IF NOT EXISTS media_blobs (
+  teacher_id TEXT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  sha256 TEXT NOT NULL,
+  path TEXT NOT NULL,
+  bucket TEXT NOT NULL,
+  public_url TEXT NOT NULL,
+  content_type TEXT,
+  size_bytes BIGINT,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (teacher_id, sha256)
+);
+
+-- Upgrade an index created keyed by sha256 alone: ownerless rows are dropped
+-- (their objects stay in Storage; the next upload of that file re-indexes it)
+ALTER TABLE media_blobs ADD COLUMN IF NOT EXISTS teacher_id TEXT REFERENCES users(id) ON DELETE CASCADE;
+DELETE FROM media_blobs WHERE teacher_id IS NULL;
+ALTER TABLE media_blobs ALTER COLUMN teacher_id SET NOT NULL;
+ALTER TABLE media_blobs DROP CONSTRAINT IF EXISTS media_blobs_pkey;
+ALTER TABLE media_blobs ADD PRIMARY KEY (teacher_id, sha256);
+
+COMMENT ON TABLE media_blobs IS '(teacher_id, SHA-256) -> storage path index used by /creator/upload to store identical files once per teacher';
@@ -0,0 +1,39 @@
+-- Migration: Transactional outbox for Finternet calls
+-- Run this in Supabase SQL Editor (after migration_add_write_batch.sql)
+--
+-- /sessions/start and /sessions/end write their outbox event in the same
+-- apply_write_batch() transaction as the session/payment rows; a background
+-- dispatcher delivers it (payment intent + escrow, settle + refund) with
+-- retries, in created_at order per session.
+
+CREATE TABLE IF NOT EXISTS outbox (
+  id TEXT PRIMARY KEY,
+  session_id TEXT REFERENCES sessions(id) ON DELETE CASCADE,
+  kind TEXT NOT NULL,
+  payload JSONB NOT NULL,
+  status TEXT NOT NULL DEFAULT 'pending',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  available_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+  delivered_at TIMESTAMP WITH TIME ZONE,
+  CONSTRAINT outbox_status_check CHECK (status IN ('pending', 'in_flight', 'delivered', 'failed'))
+);
+
+-- Dispatcher polls undelivered events oldest-first
+CREATE INDEX IF NOT EXISTS idx_outbox_undelivered
+  ON outbox(created_at)
+  WHERE status IN ('pending', 'in_flight');
+
+CREATE INDEX IF NOT EXISTS idx_outbox_session_id ON outbox(session_id);
+
+COMMENT ON TABLE outbox IS 'Finternet calls recorded with the session write and delivered asynchronously';
+
+-- Allow apply_write_batch() to write outbox rows alongside sessions/payments
+CREATE OR REPLACE FUNCTION public.write_batch_table_allowed(tbl text)
+RETURNS boolean
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT tbl IN ('sessions', 'payments', 'escrows', 'outbox');
+$$;
@@ -0,0 +1,31 @@
+-- Migration: Track background AI scoring on reviews
+-- Run this in Supabase SQL Editor
+--
+-- With REVIEW_SCORING_MODE=background, /reviews/submit stores the review with a
+-- provisional (completion-based) credibility score and scoring_status='pending';
+-- a background job claims it ('scoring', scoring_claimed_by/_at), replaces
+-- credibility_score/bonus_percentage and marks it 'scored' (or 'failed',
+-- keeping the provisional values).
+
+alter table if exists public.reviews
+  add column if not exists scoring_status text not null default 'scored';
+
+alter table if exists public.reviews
+  drop constraint if exists reviews_scoring_status_check;
+alter table if exists public.reviews
+  add constraint reviews_scoring_status_check
+  check (scoring_status in ('pending', 'scoring', 'scored', 'failed'));
+
+-- Claim taken by the scoring job, so several workers never score the same review;
+-- startup recovery takes over claims older than REVIEW_SCORING_LEASE_S
+alter table if exists public.reviews
+  add column if not exists scoring_claimed_by text,
+  add column if not exists scoring_claimed_at timestamptz;
+
+-- Startup recovery re-queues reviews left pending (or mid-scoring) by a restart
+drop index if exists idx_reviews_scoring_pending;
+create index if not exists idx_reviews_scoring_unfinished
+  on public.reviews(created_at)
+  where scoring_status in ('pending', 'scoring');
+
+comment on column public.reviews.scoring_status is 'Background AI scoring state: pending, scoring, scored, or failed';
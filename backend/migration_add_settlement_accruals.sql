@@ -0,0 +1,29 @@
+-- Migration: Claim settle payments held by a settlement batcher
+-- Run this in Supabase SQL Editor
+--
+-- With SETTLEMENT_BATCHING enabled, a worker marks a settle payment
+-- status='accrued' with accrued_by = its worker id before adding it to its
+-- in-memory batcher, and renews accrued_at while it still holds it. Startup
+-- recovery only re-accrues payments whose claim was not renewed within
+-- SETTLEMENT_ACCRUAL_LEASE_S, so a payment is never in two workers' batchers.
+--
+-- Before a netted transfer goes out, its payments move to status='settling'
+-- with settlement_batch_id = the transfer's idempotency key. Recovery resumes
+-- such a batch under the same key instead of accruing its payments again.
+
+ALTER TABLE IF EXISTS public.payments
+  ADD COLUMN IF NOT EXISTS accrued_by TEXT,
+  ADD COLUMN IF NOT EXISTS accrued_at TIMESTAMP WITH TIME ZONE,
+  ADD COLUMN IF NOT EXISTS settlement_batch_id TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_payments_settle_accrued
+  ON public.payments(accrued_at)
+  WHERE type = 'settle' AND status IN ('accrued', 'settling');
+
+CREATE INDEX IF NOT EXISTS idx_payments_settlement_batch_id
+  ON public.payments(settlement_batch_id)
+  WHERE settlement_batch_id IS NOT NULL;
+
+COMMENT ON COLUMN public.payments.accrued_by IS 'Worker whose settlement batcher holds this settle payment';
+COMMENT ON COLUMN public.payments.accrued_at IS 'Last time the holding worker renewed its claim';
+COMMENT ON COLUMN public.payments.settlement_batch_id IS 'Netted transfer (and its idempotency key) this settle payment is paid by';
@@ -0,0 +1,19 @@
+-- Migration: Precomputed per-teacher forecasts
+-- Run this in Supabase SQL Editor
+--
+-- Filled by the nightly batch job (python -m app.services.forecast_batch).
+-- Teacher dashboards and review anomaly checks read these rows instead of
+-- fitting ARIMA on demand.
+
+CREATE TABLE IF NOT EXISTS teacher_forecasts (
+  teacher_id TEXT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  avg_forecast_bonus NUMERIC(6, 3) NOT NULL DEFAULT 0,
+  next_bonus_predictions JSONB NOT NULL DEFAULT '[]'::jsonb,
+  predicted_rating NUMERIC(6, 3),
+  review_count INTEGER NOT NULL DEFAULT 0,
+  computed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE teacher_forecasts IS 'Nightly ARIMA forecasts per teacher (bonus percentage and next rating)';
+COMMENT ON COLUMN teacher_forecasts.next_bonus_predictions IS 'Forecast bonus_percentage for the next reviews, e.g. [10.0, 9.5, 9.8]';
+COMMENT ON COLUMN teacher_forecasts.review_count IS 'Number of reviews the forecast was fitted on';
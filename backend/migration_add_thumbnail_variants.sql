@@ -0,0 +1,12 @@
+-- Migration: Store downscaled thumbnail derivatives
+-- Run this in Supabase SQL Editor
+
+-- Listing-level derivative URLs: {"card": url, "detail": url}
+alter table if exists public.listings
+  add column if not exists thumbnail_variants jsonb;
+
+-- Derivatives per unique thumbnail, reused when the same image is uploaded again
+alter table if exists public.media_blobs
+  add column if not exists variants jsonb;
+
+comment on column public.listings.thumbnail_variants is 'Downscaled thumbnail derivatives (WebP/JPEG): {"card": url, "detail": url}';
@@ -0,0 +1,95 @@
+-- Migration: Batched multi-table writes in one round-trip
+-- Run this in Supabase SQL Editor
+--
+-- Used by SupabaseService.write_batch() so each session lifecycle transition
+-- (start: session + lock payment, end: session update + settle/refund payments)
+-- is a single PostgREST call and a single transaction.
+--
+-- apply_write_batch() only dispatches; the allowed tables, inserts and updates
+-- live in helper functions so later migrations replace just the part they change
+-- (migration_add_outbox.sql: allowed tables, migration_add_write_batch_guards.sql: updates).
+
+-- Tables apply_write_batch() may write
+CREATE OR REPLACE FUNCTION public.write_batch_table_allowed(tbl text)
+RETURNS boolean
+LANGUAGE sql
+IMMUTABLE
+AS $$
+  SELECT tbl IN ('sessions', 'payments', 'escrows');
+$$;
+
+-- Insert rows, naming only the columns each row sets so omitted columns keep
+-- their DEFAULTs (rows with the same keys are inserted together)
+CREATE OR REPLACE FUNCTION public.write_batch_insert(tbl text, p_rows jsonb)
+RETURNS void
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  grp record;
+BEGIN
+  FOR grp IN
+    SELECT cols, jsonb_agg(r) AS rows
+    FROM (
+      SELECT r, (SELECT string_agg(format('%I', k), ', ' ORDER BY k) FROM jsonb_object_keys(r) AS k) AS cols
+      FROM jsonb_array_elements(p_rows) AS r
+    ) keyed
+    GROUP BY cols
+  LOOP
+    EXECUTE format(
+      'INSERT INTO public.%I (%s) SELECT %s FROM jsonb_populate_recordset(NULL::public.%I, $1)',
+      tbl, grp.cols, grp.cols, tbl
+    ) USING grp.rows;
+  END LOOP;
+END;
+$$;
+
+-- Update the columns in p_set of row p_id
+CREATE OR REPLACE FUNCTION public.write_batch_update(tbl text, p_id text, p_set jsonb, p_expect jsonb)
+RETURNS void
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  cols text;
+BEGIN
+  SELECT string_agg(format('%I', k), ', ') INTO cols FROM jsonb_object_keys(p_set) AS k;
+  EXECUTE format(
+    'UPDATE public.%I SET (%s) = (SELECT %s FROM jsonb_populate_record(NULL::public.%I, $1)) WHERE id = $2',
+    tbl, cols, cols, tbl
+  ) USING p_set, p_id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.apply_write_batch(p_ops jsonb)
+RETURNS void
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  op jsonb;
+  tbl text;
+BEGIN
+  FOR op IN SELECT * FROM jsonb_array_elements(p_ops) LOOP
+    tbl := op->>'table';
+    IF NOT write_batch_table_allowed(tbl) THEN
+      RAISE EXCEPTION 'apply_write_batch: table % not allowed', tbl;
+    END IF;
+
+    IF op->>'op' = 'insert' THEN
+      PERFORM write_batch_insert(tbl, op->'rows');
+    ELSIF op->>'op' = 'update' THEN
+      PERFORM write_batch_update(tbl, op->>'id', op->'set', op->'expect');
+    ELSE
+      RAISE EXCEPTION 'apply_write_batch: unsupported op %', op->>'op';
+    END IF;
+  END LOOP;
+END;
+$$;
+
+-- Backend-only: callable with the service role key, not from browsers
+REVOKE ALL ON FUNCTION public.write_batch_insert(text, jsonb) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.write_batch_update(text, text, jsonb, jsonb) FROM PUBLIC, anon, authenticated;
+REVOKE ALL ON FUNCTION public.apply_write_batch(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION public.apply_write_batch(jsonb) TO service_role;
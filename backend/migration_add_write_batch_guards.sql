@@ -0,0 +1,32 @@
+-- Migration: Guarded updates in apply_write_batch
+-- Run this in Supabase SQL Editor (after migration_add_outbox.sql)
+--
+-- An update op may carry `"expect": {"column": value, ...}`. The row is only
+-- updated if it still matches; otherwise the whole batch is rolled back with a
+-- WRITE_CONFLICT error. Used so /sessions/end and the expiry sweeper can't both
+-- end (and settle) the same session.
+
+CREATE OR REPLACE FUNCTION public.write_batch_update(tbl text, p_id text, p_set jsonb, p_expect jsonb)
+RETURNS void
+LANGUAGE plpgsql
+SET search_path = public
+AS $$
+DECLARE
+  cols text;
+  guard text;
+  n integer;
+BEGIN
+  SELECT string_agg(format('%I', k), ', ') INTO cols FROM jsonb_object_keys(p_set) AS k;
+  SELECT coalesce(string_agg(format(' AND %I::text = %L', e.key, e.value), ''), '')
+    INTO guard
+    FROM jsonb_each_text(coalesce(p_expect, '{}'::jsonb)) AS e;
+  EXECUTE format(
+    'UPDATE public.%I SET (%s) = (SELECT %s FROM jsonb_populate_record(NULL::public.%I, $1)) WHERE id = $2%s',
+    tbl, cols, cols, tbl, guard
+  ) USING p_set, p_id;
+  GET DIAGNOSTICS n = ROW_COUNT;
+  IF p_expect IS NOT NULL AND n = 0 THEN
+    RAISE EXCEPTION 'WRITE_CONFLICT: %.% does not match %', tbl, p_id, p_expect;
+  END IF;
+END;
+$$;
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Metering unit tests (pure functions, no server, no Supabase).
+
+- Chunk bitsets survive the base64 round-trip and list/bitmap forms merge.
+- The NumPy batch path returns bit-identical charges to the scalar formula.
+
+Usage:
+  uv run python test_metering.py
+  uv run pytest test_metering.py
+"""
+
+import random
+import sys
+from pathlib import Path
+
+# Ensure backend app is on path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def test_bitmap_round_trip():
+    from app.services.metering import chunks_to_bits, decode_chunk_bitmap, encode_chunk_bitmap
+
+    rng = random.Random(38)
+    cases = [0, 1, 1 << 7, 1 << 8, (1 << 1000) - 1]
+    cases += [chunks_to_bits(rng.sample(range(2000), rng.randint(1, 300))) for _ in range(50)]
+    for bits in cases:
+        assert decode_chunk_bitmap(encode_chunk_bitmap(bits)) == bits
+
+    assert encode_chunk_bitmap(0) == ""
+    assert len(encode_chunk_bitmap((1 << 1000) - 1)) == 168
+    for bad in (None, "", "not base64!", 123):
+        assert decode_chunk_bitmap(bad) == 0
+
+
+def test_compact_and_merge_engagement():
+    from app.services.metering import (
+        compact_engagement,
+        compute_completion_percentage,
+        engagement_bits,
+        merge_engagement,
+    )
+
+    raw = {"total_chunks": 10, "viewed_chunks": [0, 1, 1, 2, 12, "x"], "skipped_chunks": [5]}
+    compact = compact_engagement(raw)
+    assert set(compact) == {"total_chunks", "viewed_bitmap", "skipped_bitmap"}
+    # Duplicates, out-of-range and invalid indices are dropped
+    assert engagement_bits(compact, "viewed") == 0b111
+    assert compute_completion_percentage({}, compact) == 30.0
+    assert compute_completion_percentage({}, raw) == 30.0
+
+    merged = merge_engagement(compact, None, {"viewed_chunks": [2, 3], "total_chunks": 10})
+    assert engagement_bits(merged, "viewed") == 0b1111
+    assert engagement_bits(merged, "skipped") == 1 << 5
+    assert "viewed_chunks" not in merged and "rewatched_bitmap" not in merged
+    assert merge_engagement(None, {}) == {}
+
+
+def test_batch_charges_match_scalar():
+    import numpy as np
+
+    from app.services.batch_metering import compute_charges_batch
+    from app.services.metering import compute_charge_amount
+
+    rng = random.Random(38)
+    rows = []
+    for _ in range(5000):
+        rows.append(
+            (
+                rng.choice([0.0, -0.0, -1.0, rng.uniform(0, 120), round(rng.uniform(0, 120), 3)]),
+                rng.choice([0.0, 50.0, 100.0, 150.0, rng.uniform(-10, 110)]),
+                rng.choice([0.005, 0.015, 0.125, round(rng.uniform(0, 5), 3)]),
+                rng.choice([30.0, 60.0, rng.uniform(1, 120)]),
+                rng.choice([0.0, 1.005, 2.675, round(rng.uniform(0, 500), 3)]),
+            )
+        )
+
+    cols = [np.asarray(c, dtype=np.float64) for c in zip(*rows)]
+    charges, refunds = compute_charges_batch(
+        duration_min=cols[0],
+        completion_percentage=cols[1],
+        price_per_min=cols[2],
+        total_duration_min=cols[3],
+        reserve_amount=cols[4],
+    )
+    for i, (d, c, p, t, r) in enumerate(rows):
+        charge, refund = compute_charge_amount(
+            duration_min=d,
+            completion_percentage=c,
+            price_per_min=p,
+            total_duration_min=t,
+            reserve_amount=r,
+        )
+        # Bit-identical, including the sign of zero
+        assert float(charges[i]).hex() == charge.hex(), (rows[i], charges[i], charge)
+        assert float(refunds[i]).hex() == refund.hex(), (rows[i], refunds[i], refund)
+
+
+def test_batch_completion_matches_scalar():
+    from app.services.batch_metering import compute_completion_batch, engagement_columns
+    from app.services.metering import compute_completion_percentage, encode_chunk_bitmap
+
+    rng = random.Random(38)
+    engagements = [None, {}, {"total_chunks": 0, "viewed_chunks": [1]}, {"total_chunks": 7}]
+    for _ in range(500):
+        total = rng.randint(1, 400)
+        viewed = rng.sample(range(total + 20), rng.randint(0, total))
+        if rng.random() < 0.5:
+            engagements.append({"total_chunks": total, "viewed_chunks": viewed})
+        else:
+            bits = sum(1 << i for i in set(viewed))
+            engagements.append({"total_chunks": total, "viewed_bitmap": encode_chunk_bitmap(bits)})
+
+    totals, counts = engagement_columns(engagements)
+    pct = compute_completion_batch(total_chunks=totals, viewed_counts=counts)
+    for i, e in enumerate(engagements):
+        assert float(pct[i]).hex() == compute_completion_percentage({}, e).hex(), (e, pct[i])
+
+
+if __name__ == "__main__":
+    test_bitmap_round_trip()
+    test_compact_and_merge_engagement()
+    test_batch_charges_match_scalar()
+    test_batch_completion_matches_scalar()
+    print("✅ metering bitsets round-trip and batch charges match the scalar path")
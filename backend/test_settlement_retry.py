@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Settle/refund retry against the Finternet stand-in (no server, no Supabase).
+
+A settlement whose refund half fails is retried with the same outbox event id:
+the settle half must be replayed (same tx, no second transfer) and the refund
+half applied once.
+
+Usage:
+  uv run python test_settlement_retry.py
+  uv run pytest test_settlement_retry.py
+"""
+
+import sys
+from pathlib import Path
+
+# Ensure backend app is on path
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+def _gateway():
+    from fastapi.testclient import TestClient
+
+    from app.services.finternet import FinternetGateway
+    from finternet_standin import StandinConfig, create_app
+
+    gw = FinternetGateway(max_retries=1, retry_delay=0.0, base_url="http://standin", mode="http")
+    client = TestClient(create_app(StandinConfig()), base_url="http://standin")
+    # Route the gateway's pooled client through the in-process stand-in
+    gw._client = client
+    return gw, client
+
+
+def test_settle_ok_refund_fail_then_retry():
+    from app.services.finternet import SettlementError
+
+    gw, client = _gateway()
+    real_refund = gw.refund
+    calls = {"refund": 0}
+
+    def flaky_refund(**kwargs):
+        calls["refund"] += 1
+        if calls["refund"] == 1:
+            raise RuntimeError("refund unavailable")
+        return real_refund(**kwargs)
+
+    gw.refund = flaky_refund
+    pair = dict(wallet_address="0xstudent", settle_amount=7.5, refund_amount=2.5, idempotency_key="ob_1")
+
+    try:
+        gw.settle_and_refund(**pair)
+    except SettlementError:
+        pass
+    else:
+        raise AssertionError("first attempt should fail on the refund half")
+
+    settle_tx, refund_tx = gw.settle_and_refund(**pair)
+    stats = client.get("/_standin/stats").json()["requests"]
+
+    # The settle half was replayed, not repeated, and nothing was reversed
+    assert settle_tx.finternet_tx_id.startswith("ft_settle_")
+    assert refund_tx.finternet_tx_id.startswith("ft_refund_")
+    assert stats.get("POST settlements") == 2
+    assert stats.get("POST refunds") == 1
+    assert "POST reversals" not in stats
+    replay = gw.settle(wallet_address="0xstudent", amount=7.5, idempotency_key="ob_1:settle")
+    assert replay.finternet_tx_id == settle_tx.finternet_tx_id
+
+
+if __name__ == "__main__":
+    test_settle_ok_refund_fail_then_retry()
+    print("✅ settle/refund retry replays the applied half")
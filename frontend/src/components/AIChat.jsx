@@ -1,4 +1,5 @@
 import { useState } from 'react';
+import { Link } from 'react-router-dom';
 import { Send } from 'lucide-react';
 import { aiService } from '../features/ai/aiService';
 import './AIChat.css';
@@ -14,30 +15,56 @@ export default function AIChat() {
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
 
+  const updateMessage = (id, update) => {
+    setMessages((prev) => prev.map((m) => (m.id === id ? { ...m, ...update(m) } : m)));
+  };
+
   const handleSend = async () => {
     if (!input.trim()) return;
 
+    const query = input;
     const userMessage = {
       id: 'msg_' + Date.now(),
       type: 'user',
-      text: input,
+      text: query,
     };
+    // Filled in as the concierge stream arrives
+    const aiMessageId = 'msg_ai_' + Date.now();
 
-    setMessages((prev) => [...prev, userMessage]);
+    setMessages((prev) => [
+      ...prev,
+      userMessage,
+      { id: aiMessageId, type: 'ai', text: '', matches: [], streaming: true },
+    ]);
     setInput('');
     setLoading(true);
 
     try {
-      const response = await aiService.discoverCourse(input);
-      const aiMessage = {
-        id: 'msg_' + Date.now(),
-        type: 'ai',
-        text: response.message,
-      };
-      setMessages((prev) => [...prev, aiMessage]);
+      await aiService.streamSuggest(query, {
+        onMatches: (matches) => updateMessage(aiMessageId, () => ({ matches })),
+        onToken: (text) => updateMessage(aiMessageId, (m) => ({ text: m.text + text })),
+        onDone: (reasoning) =>
+          updateMessage(aiMessageId, (m) => ({
+            text: m.text || reasoning || 'Here are some courses you might like.',
+            streaming: false,
+          })),
+      });
     } catch (error) {
       console.error('AI request failed:', error);
+      // Drop anything streamed before the failure so it isn't mixed with the fallback
+      try {
+        const response = await aiService.discoverCourse(query);
+        updateMessage(aiMessageId, () => ({ text: response.message, matches: [], streaming: false }));
+      } catch (fallbackError) {
+        console.error('AI fallback failed:', fallbackError);
+        updateMessage(aiMessageId, () => ({
+          text: 'Sorry, I could not get recommendations right now. Please try again.',
+          matches: [],
+          streaming: false,
+        }));
+      }
     } finally {
+      updateMessage(aiMessageId, () => ({ streaming: false }));
       setLoading(false);
     }
   };
@@ -47,7 +74,20 @@ export default function AIChat() {
       <div className="chat-messages">
         {messages.map((msg) => (
           <div key={msg.id} className={`message ${msg.type}`}>
-            <div className="message-content">{msg.text}</div>
+            <div className="message-content">
+              {msg.matches?.length > 0 && (
+                <ul className="message-matches">
+                  {msg.matches.map((listing) => (
+                    <li key={listing.id}>
+                      <Link to={`/session/${listing.id}`}>{listing.title}</Link>
+                      {listing.teacher_name && <span> · {listing.teacher_name}</span>}
+                    </li>
+                  ))}
+                </ul>
+              )}
+              {msg.text}
+              {msg.streaming && <span className="typing-cursor">▍</span>}
+            </div>
           </div>
         ))}
       </div>
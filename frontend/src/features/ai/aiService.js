@@ -3,6 +3,23 @@ import axios from 'axios';
 
 const AI_BASE_URL = import.meta.env.VITE_OPENAI_BASE_URL || 'https://api.openai.com/v1';
 const AI_KEY = import.meta.env.VITE_OPENAI_API_KEY || 'mock-key';
+const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+
+// Parse one Server-Sent Events block ("event: x\ndata: {...}") into { event, data }
+function parseSSEBlock(block) {
+  let event = 'message';
+  const dataLines = [];
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+  }
+  if (dataLines.length === 0) return null;
+  try {
+    return { event, data: JSON.parse(dataLines.join('\n')) };
+  } catch {
+    return null;
+  }
+}
 
 export const aiService = {
   async discoverCourse(userMessage) {
@@ -27,6 +44,47 @@ export const aiService = {
     };
   },
 
+  /**
+   * Streaming course concierge (POST /discovery/suggest/stream).
+   * Callbacks fire as events arrive: onMatches(listings) once the picks are known,
+   * onToken(text) for each reasoning chunk, onDone(reasoning) at the end.
+   * EventSource only supports GET, so the stream is read with fetch.
+   */
+  async streamSuggest(query, { onMatches, onToken, onDone, signal } = {}) {
+    const headers = { 'Content-Type': 'application/json', Accept: 'text/event-stream' };
+    const token = localStorage.getItem('access_token');
+    if (token) headers.Authorization = `Bearer ${token}`;
+
+    const response = await fetch(`${API_BASE_URL}/discovery/suggest/stream`, {
+      method: 'POST',
+      headers,
+      body: JSON.stringify({ query }),
+      signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Suggest stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const parsed = parseSSEBlock(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        if (!parsed) continue;
+        if (parsed.event === 'matches') onMatches?.(parsed.data.matches || []);
+        else if (parsed.event === 'token') onToken?.(parsed.data.text || '');
+        else if (parsed.event === 'done') onDone?.(parsed.data.reasoning ?? null);
+        else if (parsed.event === 'error') console.error('Concierge stream error:', parsed.data.message);
+      }
+    }
+  },
+
   async callOpenAI(messages) {
     // Mock OpenAI call for real implementation
     if (!AI_KEY || AI_KEY === 'mock-key') {